@@ -0,0 +1,63 @@
+"""
+Temps avant la première carte quand l'historique grossit : ancien /api/optimized_gateways
+(toutes les dates dans une seule réponse JSON) contre le manifeste + le shard précompressé
+de la date affichée.
+
+Usage : python3 benchmarks/bench_date_shards.py [--days 10 30 100]
+"""
+import os
+import sys
+import json
+import time
+import gzip
+import argparse
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from gateway_index import GatewayIndex
+from date_shards import DateShards
+from bench_gateway_index import write_csv, ROWS_PER_DAY
+
+
+def render(date, gateways):
+    # Même forme que with_links du webhook (visibilité et graphe IGRA joints)
+    return {gw_id: dict(entry, graph_path='') for gw_id, entry in gateways.items()}
+
+
+def bench(days):
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "helium_gateway_data.csv")
+        write_csv(csv_path, days * ROWS_PER_DAY, datetime(2023, 1, 1))
+        index = GatewayIndex(csv_path).load()
+        dates = index.dates()
+
+        t0 = time.perf_counter()
+        snapshot = index.snapshot()
+        full = json.dumps({date: render(date, gateways) for date, gateways in snapshot.items()}).encode()
+        full_s = time.perf_counter() - t0
+
+        shards = DateShards(index, render, lambda: None)
+        t0 = time.perf_counter()
+        manifest = json.dumps({"dates": shards.manifest()}).encode()
+        _, _, variants = shards.get(dates[0])
+        cold_s = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        shards.manifest()
+        shards.get(dates[0])
+        warm_s = time.perf_counter() - t0
+
+        first_bytes = len(gzip.compress(manifest)) + len(variants["gzip"])
+        print(f"{len(dates):5d} days | full payload {full_s * 1000:8.1f} ms {len(full) / 1e6:7.2f} MB | "
+              f"manifest + 1 shard {cold_s * 1000:6.1f} ms (cached {warm_s * 1000:5.2f} ms) "
+              f"{first_bytes / 1e3:6.1f} kB gzip")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, nargs="+", default=[10, 30, 100])
+    args = parser.parse_args()
+    for days in args.days:
+        bench(days)
@@ -0,0 +1,73 @@
+"""
+Lecture d'un profil ERA5 en un point : décodage du GRIB à chaque appel (ancien
+on_demand) contre le cube décodé une fois et relu en mémoire-mappée.
+
+Usage (depuis la racine du dépôt) : python3 benchmarks/bench_era5_cache.py [--hours 12] [--size 41] [--calls 200]
+"""
+import os
+import sys
+import time
+import argparse
+import datetime
+import tempfile
+
+import numpy as np
+import pygrib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import era5_gradients
+from bench_era5_cube import write_fake_grib
+
+
+def legacy_profile(grib_file, lat, lon, closest_time):
+    """Ancien chemin de on_demand : ouverture, select et décodage des messages de l'heure."""
+    grbs = pygrib.open(grib_file)
+    temp_msgs = grbs.select(shortName='t', dataTime=closest_time)
+    rh_msgs = grbs.select(shortName='r', dataTime=closest_time)
+    lats, lons = temp_msgs[0].latlons()
+    i, j = np.unravel_index(((lats - lat) ** 2 + (lons - lon) ** 2).argmin(), lats.shape)
+    temp, rh = [], []
+    for level in sorted(era5_gradients.ERA5_PRESSURE_LEVELS, reverse=True):
+        t_msg = next((m for m in temp_msgs if m['level'] == level), None)
+        rh_msg = next((m for m in rh_msgs if m['level'] == level), None)
+        temp.append(t_msg.values[i, j])
+        rh.append(rh_msg.values[i, j])
+    grbs.close()
+    return np.array(temp), np.array(rh)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hours", type=int, default=12)
+    parser.add_argument("--size", type=int, default=41)
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(2)
+    with tempfile.TemporaryDirectory() as tmp:
+        era5_gradients.CUBE_DIR = os.path.join(tmp, "cubes")
+        grib_file = os.path.join(tmp, "era5_2025-06-26.grib")
+        write_fake_grib(grib_file, datetime.date(2025, 6, 26), args.hours, args.size)
+        points = rng.uniform([41, 9], [50, 18], (args.calls, 2))
+        hours = rng.integers(0, args.hours, args.calls) * 2
+
+        t0 = time.perf_counter()
+        for (lat, lon), hour in zip(points[:20], hours[:20]):
+            legacy_profile(grib_file, lat, lon, hour * 100)
+        legacy = (time.perf_counter() - t0) / 20
+        print(f"GRIB decode per call : {legacy * 1000:8.2f} ms / profile")
+
+        t0 = time.perf_counter()
+        era5_gradients.convert_grib(grib_file)
+        print(f"one-time conversion  : {(time.perf_counter() - t0) * 1000:8.2f} ms")
+
+        t0 = time.perf_counter()
+        for (lat, lon), hour in zip(points, hours):
+            cube = era5_gradients.load_cube(grib_file)
+            time_index = int(np.abs(cube["times"] - hour * 100).argmin())
+            temp, rh = era5_gradients.extract_profile(cube, lat, lon, time_index)
+        cached = (time.perf_counter() - t0) / args.calls
+        print(f"memory-mapped cube   : {cached * 1000:8.2f} ms / profile (x{legacy / cached:.0f}, cube reopened each call)")
+
+        expected = legacy_profile(grib_file, lat, lon, hour * 100)
+        print(f"same profile: {np.allclose(expected[0], temp, atol=1e-3) and np.allclose(expected[1], rh, atol=1e-3)}")
@@ -0,0 +1,130 @@
+"""
+Calcul ERA5 d'une journée : ancienne boucle par point de grille (compute_gradient_profile
+sur chaque colonne) contre le calcul vectorisé du cube (temps, niveau, lat, lon).
+
+Le fichier GRIB de test est écrit à la main (GRIB1, grille lat/lon régulière,
+paramètres t et r de la table ECMWF 128) pour ne dépendre ni du CDS ni des samples ecCodes.
+
+Usage (depuis la racine du dépôt) : python3 benchmarks/bench_era5_cube.py [--hours 12] [--size 41]
+"""
+import os
+import sys
+import time
+import struct
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import era5_gradients
+
+PARAMS = {"t": 130, "r": 157}
+
+
+def _int(value, size):
+    """Entier GRIB1 signé (bit de signe + magnitude) sur `size` octets."""
+    magnitude = abs(int(value))
+    if value < 0:
+        magnitude |= 1 << (8 * size - 1)
+    return magnitude.to_bytes(size, "big")
+
+
+def grib1_message(values, param, level, date, hour, lat0, lon0, step=0.25, decimals=2):
+    """Message GRIB1 (simple packing 16 bits) d'un champ (nj, ni), ligne 0 au nord."""
+    nj, ni = values.shape
+    pds = (struct.pack(">I", 28)[1:] + bytes([128, 98, 0, 255, 0x80, param, 100])
+           + struct.pack(">H", level)
+           + bytes([date.year % 100 or 100, date.month, date.day, hour, 0, 1, 0, 0, 0])
+           + bytes([0, 0, 0, date.year // 100 + 1, 0]) + _int(decimals, 2))
+    millideg = lambda v: _int(round(v * 1000), 3)
+    gds = (struct.pack(">I", 32)[1:] + bytes([0, 255, 0]) + struct.pack(">HH", ni, nj)
+           + millideg(lat0) + millideg(lon0) + bytes([0x80])
+           + millideg(lat0 - (nj - 1) * step) + millideg(lon0 + (ni - 1) * step)
+           + struct.pack(">HH", round(step * 1000), round(step * 1000)) + bytes([0]) + bytes(4))
+
+    scaled = np.round(values.ravel() * 10 ** decimals).astype(np.int64)
+    reference = int(scaled.min())
+    packed = (scaled - reference).astype(">u2").tobytes()
+    # Valeur de référence en flottant IBM (ici un entier exact)
+    ref_bytes = _ibm_float(reference)
+    length = 11 + len(packed)
+    length += length % 2
+    bds = struct.pack(">I", length)[1:] + bytes([((length - 11 - len(packed)) * 8) & 0x0F]) + _int(0, 2) \
+        + ref_bytes + bytes([16]) + packed + bytes(length - 11 - len(packed))
+
+    body = pds + gds + bds + b"7777"
+    total = 8 + len(body)
+    return b"GRIB" + struct.pack(">I", total)[1:] + bytes([1]) + body
+
+
+def _ibm_float(value):
+    if value == 0:
+        return bytes(4)
+    sign = 0x80 if value < 0 else 0
+    mantissa, exponent = abs(float(value)), 64
+    while mantissa >= 1:
+        mantissa /= 16
+        exponent += 1
+    while mantissa < 1 / 16:
+        mantissa *= 16
+        exponent -= 1
+    return bytes([sign | exponent]) + int(mantissa * (1 << 24)).to_bytes(3, "big")
+
+
+def write_fake_grib(path, day, hours=12, size=41, lat0=50.75, lon0=8.75):
+    """Journée ERA5 synthétique : `hours` pas de temps (toutes les 2 h), 7 niveaux, grille size×size."""
+    rng = np.random.default_rng(0)
+    levels = sorted(era5_gradients.ERA5_PRESSURE_LEVELS, reverse=True)
+    with open(path, "wb") as f:
+        for hour in range(0, 2 * hours, 2):
+            for k, level in enumerate(levels):
+                temp = 290 - 6.5 * k * 0.5 + rng.normal(0, 2, (size, size))
+                rh = np.clip(80 - 8 * k + rng.normal(0, 10, (size, size)), 1, 100)
+                f.write(grib1_message(temp, PARAMS["t"], level, day, hour, lat0, lon0))
+                f.write(grib1_message(rh, PARAMS["r"], level, day, hour, lat0, lon0))
+
+
+def legacy_day(cube, stride=1):
+    """Ancien calcul : compute_gradient_profile appelé pour chaque colonne."""
+    profiles = []
+    for t in range(cube["temp"].shape[0]):
+        for i in range(0, cube["temp"].shape[2], stride):
+            for j in range(0, cube["temp"].shape[3], stride):
+                profiles.append(era5_gradients.compute_gradient_profile(
+                    cube["temp"][t, :, i, j], cube["rh"][t, :, i, j], era5_gradients.ERA5_PRESSURE_LEVELS))
+    return profiles
+
+
+if __name__ == "__main__":
+    import datetime
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hours", type=int, default=12)
+    parser.add_argument("--size", type=int, default=41, help="Grid points per side (41 = 10 degrees at 0.25)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "era5_2025-06-26.grib")
+        write_fake_grib(path, datetime.date(2025, 6, 26), args.hours, args.size)
+        print(f"GRIB: {os.path.getsize(path) / 1e6:.1f} MB, {args.hours} timesteps, {args.size}x{args.size} grid")
+
+        t0 = time.perf_counter()
+        cube = era5_gradients.read_grib_cube(path)
+        decode = time.perf_counter() - t0
+        print(f"GRIB decode        : {decode:7.3f} s  cube {cube['temp'].shape}")
+
+    t0 = time.perf_counter()
+    legacy = legacy_day(cube)
+    legacy_s = time.perf_counter() - t0
+    print(f"per-column loop    : {legacy_s:7.3f} s  ({len(legacy)} columns)")
+
+    t0 = time.perf_counter()
+    result = era5_gradients.compute_cube(cube)
+    cube_s = time.perf_counter() - t0
+    print(f"vectorized cube    : {cube_s:7.3f} s  (x{legacy_s / cube_s:.0f}), "
+          f"{int(result['ducting'].sum())} ducting columns")
+
+    heights, gradients = legacy[-1]
+    same = np.allclose(heights, result["heights"][-1, :, -1, -1]) and np.allclose(gradients, result["gradients"][-1, :, -1, -1])
+    print(f"same profiles as the per-column loop: {same}")
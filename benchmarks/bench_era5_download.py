@@ -0,0 +1,113 @@
+"""
+Téléchargements ERA5 contre un faux CDS local (file d'attente simulée) : une requête
+par jour les unes après les autres (ancienne boucle) contre les lots mensuels soumis en
+parallèle par era5_download.DownloadPlanner, puis reprise après interruption.
+
+Usage (depuis la racine du dépôt) : python3 benchmarks/bench_era5_download.py [--days 45] [--queue-s 0.5]
+"""
+import os
+import sys
+import time
+import argparse
+import datetime
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import era5_gradients
+from era5_download import DownloadPlanner
+from tests.fake_cds import FakeCdsClient
+from bench_era5_cube import write_fake_grib
+
+
+class QueuedFakeClient(FakeCdsClient):
+    """Faux CDS dont chaque requête attend `queue_s` secondes dans la file, quelle que soit sa taille."""
+
+    def __init__(self, writer, queue_s):
+        super().__init__(writer, polls=0)
+        self.queue_s = queue_s
+        self.submitted_at = {}
+
+    def submit(self, dataset, request):
+        request_id = super().submit(dataset, request)
+        self.submitted_at[request_id] = time.perf_counter()
+        return request_id
+
+    def status(self, request_id):
+        if time.perf_counter() - self.submitted_at[request_id] < self.queue_s:
+            return "running"
+        return super().status(request_id)
+
+
+_DAY_BYTES = {}
+
+
+def fake_writer(request, target):
+    """Fichier GRIB du lot : un jour synthétique (grille 9×9) par jour demandé, généré une seule fois."""
+    with open(target, "wb") as out:
+        for day in request["day"]:
+            date = datetime.date(int(request["year"]), int(request["month"]), int(day))
+            if date not in _DAY_BYTES:
+                part = f"{target}.{day}"
+                write_fake_grib(part, date, hours=len(request["time"]), size=9)
+                with open(part, "rb") as f:
+                    _DAY_BYTES[date] = f.read()
+                os.remove(part)
+            out.write(_DAY_BYTES[date])
+
+
+def serial_download(client, days, grib_dir, poll_s):
+    """Ancienne boucle : une requête par jour, attendue avant de passer au jour suivant."""
+    for day in days:
+        request_id = client.submit(era5_gradients.ERA5_DATASET, era5_gradients.era5_request([day]))
+        while client.status(request_id) != "completed":
+            time.sleep(poll_s)
+        client.download(request_id, os.path.join(grib_dir, f"era5_{day}.grib"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=45)
+    parser.add_argument("--queue-s", type=float, default=0.5, help="Simulated CDS queueing time per request")
+    parser.add_argument("--parallel", type=int, default=3)
+    args = parser.parse_args()
+
+    first = datetime.date(2025, 5, 20)
+    days = [(first + datetime.timedelta(days=i)).isoformat() for i in range(args.days)]
+    poll_s = args.queue_s / 10
+    quiet = lambda *messages: None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        serial_dir, batch_dir, resume_dir = (os.path.join(tmp, name) for name in ("serial", "batch", "resume"))
+        for path in (serial_dir, batch_dir, resume_dir):
+            os.makedirs(path)
+
+        t0 = time.perf_counter()
+        serial_download(QueuedFakeClient(fake_writer, args.queue_s), days, serial_dir, poll_s)
+        serial = time.perf_counter() - t0
+        print(f"one request per day  : {serial:6.2f} s  ({args.days} requests)")
+
+        client = QueuedFakeClient(fake_writer, args.queue_s)
+        t0 = time.perf_counter()
+        available = DownloadPlanner(client, era5_gradients.ERA5_DATASET, era5_gradients.era5_request, batch_dir,
+                                    max_parallel=args.parallel, poll_seconds=poll_s, log=quiet).run(days)
+        batched = time.perf_counter() - t0
+        print(f"monthly batches      : {batched:6.2f} s  ({len(client.requests)} requests, "
+              f"{args.parallel} in parallel, x{serial / batched:.1f})")
+
+        same = all(open(os.path.join(serial_dir, f"era5_{day}.grib"), "rb").read()
+                   == open(os.path.join(batch_dir, f"era5_{day}.grib"), "rb").read() for day in days)
+        print(f"day files            : {len(available)}/{len(days)}, identical to per-day downloads: {same}")
+
+        # Interruption juste après la soumission, puis relance avec le même fichier d'état
+        client = QueuedFakeClient(fake_writer, args.queue_s)
+        planner = DownloadPlanner(client, era5_gradients.ERA5_DATASET, era5_gradients.era5_request, resume_dir,
+                                  max_parallel=args.parallel, poll_seconds=poll_s, log=quiet)
+        planner.plan(days)
+        planner.step()
+        submitted = len(client.requests)
+        restarted = DownloadPlanner(client, era5_gradients.ERA5_DATASET, era5_gradients.era5_request, resume_dir,
+                                    max_parallel=args.parallel, poll_seconds=poll_s, log=quiet)
+        available = restarted.run(days)
+        print(f"resume after restart : {submitted} request(s) before, {len(client.requests) - submitted} new after, "
+              f"{len(available)}/{len(days)} day files")
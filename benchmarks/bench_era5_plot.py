@@ -0,0 +1,80 @@
+"""
+Rendu du graphe ERA5 journalier sur une grille de 10°×10° (0.25°) : ancienne boucle
+plt.plot par profil contre les deux LineCollection et le mode densité.
+
+Usage (depuis la racine du dépôt) : python3 benchmarks/bench_era5_plot.py [--hours 1] [--step 1]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import era5_gradients
+
+
+def synthetic_profiles(n_profiles):
+    """Profils réalistes : hauteurs des 7 niveaux, gradients autour de -40 N/km, ~5 % de ducting."""
+    rng = np.random.default_rng(0)
+    levels = len(era5_gradients.ERA5_PRESSURE_LEVELS)
+    heights = np.sort(np.array([110, 540, 990, 1460, 1950, 2470, 3010])[None, :]
+                      + rng.normal(0, 30, (n_profiles, levels)), axis=1)
+    gradients = rng.normal(-40, 25, (n_profiles, levels))
+    ducts = rng.random(n_profiles) < 0.05
+    gradients[ducts, 0] = rng.uniform(-400, -160, ducts.sum())
+    coords = [(round(45.7 + (i % 41) * 0.25, 2), round(13.7 + (i // 41 % 41) * 0.25, 2)) for i in range(n_profiles)]
+    return heights, gradients, coords
+
+
+def legacy_draw(plot_file, day_str, heights, gradients, coords):
+    """Ancienne version : un plt.plot par profil."""
+    plt.figure(figsize=(12, 6))
+    has_ducting = has_noducting = False
+    for h, g in zip(heights, gradients):
+        if np.any(g < -157):
+            plt.plot(g, h, color='red', alpha=0.7, linewidth=0.7, label='Ducting' if not has_ducting else "")
+            has_ducting = True
+        else:
+            plt.plot(g, h, color='gray', alpha=0.3, linewidth=0.7, label='No Ducting' if not has_noducting else "")
+            has_noducting = True
+    plt.axvline(x=-157, color='red', linestyle='--', label='Ducting threshold -157 N/km')
+    plt.title(f"Refractivity gradients of all coordinates for each hour of the day {day_str}")
+    plt.legend()
+    plt.grid(True)
+    plt.savefig(plot_file, dpi=150, bbox_inches='tight')
+    plt.close()
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hours", type=int, default=1, help="Timesteps drawn on the same graph")
+    parser.add_argument("--step", type=int, default=1, help="Grid stride (the daily job uses 2)")
+    args = parser.parse_args()
+
+    side = (10 * 4) // args.step + 1
+    n_profiles = side * side * args.hours
+    heights, gradients, coords = synthetic_profiles(n_profiles)
+    print(f"10°x10° grid, stride {args.step}, {args.hours} timestep(s): {n_profiles} profiles")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = timed(legacy_draw, os.path.join(tmp, "legacy.png"), "2025-06-26", heights, gradients, coords)
+        lines = timed(era5_gradients.draw_day, os.path.join(tmp, "lines.png"), "2025-06-26",
+                      heights, gradients, coords, mode="lines")
+        density = timed(era5_gradients.draw_day, os.path.join(tmp, "density.png"), "2025-06-26",
+                        heights, gradients, coords, mode="density")
+
+    print(f"plt.plot per profile : {legacy:7.2f} s")
+    print(f"LineCollection       : {lines:7.2f} s  (x{legacy / lines:.1f})")
+    print(f"density (hist2d)     : {density:7.2f} s  (x{legacy / density:.1f})")
@@ -0,0 +1,89 @@
+"""
+Graphe ERA5 on-demand : un `python3 era5_gradients.py --on-demand` par requête (ancien
+webhook) contre le pool chaud d'era5_service (premier rendu, résultat mémoïsé, requêtes
+identiques simultanées regroupées).
+
+Usage (depuis la racine du dépôt) : python3 benchmarks/bench_era5_service.py [--requests 10] [--concurrent 8]
+"""
+import os
+import sys
+import time
+import argparse
+import datetime
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from era5_service import Era5OnDemand
+from bench_era5_cube import write_fake_grib
+
+DAY = datetime.date(2025, 6, 26)
+
+SUBPROCESS_SNIPPET = """
+import sys, era5_gradients
+era5_gradients.GRIB_DIR, era5_gradients.PLOT_DIR, era5_gradients.CUBE_DIR = sys.argv[1:4]
+print(era5_gradients.on_demand(sys.argv[4], float(sys.argv[5]), float(sys.argv[6]), sys.argv[7], sys.argv[8]))
+"""
+
+
+def subprocess_request(dirs, gateway, lat, lon, hour):
+    """Équivalent de l'ancien subprocess.run du webhook (interpréteur et imports à chaque requête)."""
+    result = subprocess.run(
+        ["python3", "-c", SUBPROCESS_SNIPPET, dirs["GRIB_DIR"], dirs["PLOT_DIR"], dirs["CUBE_DIR"],
+         gateway, str(lat), str(lon), DAY.isoformat(), f"{hour}:00"],
+        capture_output=True, text=True, check=True, cwd=ROOT, env={**os.environ, "MPLBACKEND": "Agg"})
+    return result.stdout.strip().split('\n')[-1]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=10, help="Distinct requests (gateway, hour)")
+    parser.add_argument("--concurrent", type=int, default=8, help="Identical requests sent at the same time")
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dirs = {name: os.path.join(tmp, name.split("_")[0].lower()) for name in ("GRIB_DIR", "PLOT_DIR", "CUBE_DIR")}
+        for path in dirs.values():
+            os.makedirs(path)
+        write_fake_grib(os.path.join(dirs["GRIB_DIR"], f"era5_{DAY.isoformat()}.grib"), DAY)
+        requests = [(f"gw-{i}", 45.7 + 0.1 * i, 13.7 + 0.1 * i, 2 * (i % 12)) for i in range(args.requests)]
+
+        t0 = time.perf_counter()
+        for request in requests[:3]:
+            subprocess_request(dirs, *request)
+        legacy = (time.perf_counter() - t0) / 3
+        print(f"subprocess per request : {legacy * 1000:8.1f} ms / request")
+
+        t0 = time.perf_counter()
+        service = Era5OnDemand(workers=args.workers, dirs=dirs).start()
+        print(f"warm pool start        : {(time.perf_counter() - t0) * 1000:8.1f} ms ({args.workers} workers, once)")
+
+        def get(request):
+            gateway, lat, lon, hour = request
+            return service.get(gateway, lat, lon, DAY.isoformat(), f"{hour}:00")
+
+        try:
+            t0 = time.perf_counter()
+            paths = [get(request) for request in requests]
+            first = (time.perf_counter() - t0) / len(requests)
+            print(f"warm pool, first render: {first * 1000:8.1f} ms / request (x{legacy / first:.1f})")
+
+            t0 = time.perf_counter()
+            again = [get(request) for request in requests]
+            memo = (time.perf_counter() - t0) / len(requests)
+            print(f"memoized               : {memo * 1000:8.3f} ms / request")
+
+            burst = [("gw-burst", 46.0, 14.0, 12)] * args.concurrent
+            t0 = time.perf_counter()
+            with ThreadPoolExecutor(args.concurrent) as threads:
+                burst_paths = list(threads.map(get, burst))
+            print(f"{args.concurrent} identical at once   : {(time.perf_counter() - t0) * 1000:8.1f} ms, "
+                  f"{len(set(burst_paths))} render(s)")
+            print(f"stats: {service.stats()}")
+            print(f"same files on replay: {paths == again and all(os.path.exists(p) for p in paths)}")
+        finally:
+            service.close()
@@ -0,0 +1,88 @@
+"""
+Benchmark de la latence d'ingestion du webhook quand le CSV grossit.
+
+Pour chaque taille de CSV (10k -> 1M lignes), on charge l'index une fois puis on
+mesure le chemin d'un uplink : append CSV + lecture de la fin du CSV (sync) dans l'index en mémoire.
+
+Usage : python3 benchmarks/bench_gateway_index.py [--sizes 10000 100000 1000000]
+"""
+import os
+import sys
+import csv
+import time
+import random
+import argparse
+import tempfile
+import statistics
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from gateway_index import GatewayIndex
+
+CSV_HEADER = ["gwTime", "gatewayId", "gateway_name", "gateway_id",
+              "node_long", "node_lat", "gateway_long", "gateway_lat",
+              "dist_km", "rssi", "snr", "visibility"]
+
+N_GATEWAYS = 300
+ROWS_PER_DAY = 3000
+
+
+def fake_row(i, start):
+    gw = i % N_GATEWAYS
+    t = start + timedelta(seconds=i * 86400 / ROWS_PER_DAY)
+    return {
+        "gwTime": t.strftime("%Y-%m-%dT%H:%M:%S.%f+00:00"),
+        "gatewayId": f"gw{gw:04d}",
+        "gateway_name": f"gateway-{gw}",
+        "gateway_id": f"id{gw}",
+        "node_long": 13.72, "node_lat": 45.70,
+        "gateway_long": 13.0 + gw / 1000, "gateway_lat": 45.0 + gw / 1000,
+        "dist_km": 12.3456, "rssi": -110 + gw % 20, "snr": 3.5,
+        "visibility": random.choice(["LOS", "NLOS", "N/A"]),
+    }
+
+
+def write_csv(path, n_rows, start):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_HEADER)
+        for i in range(n_rows):
+            row = fake_row(i, start)
+            writer.writerow([row[col] for col in CSV_HEADER])
+
+
+def bench(n_rows, n_uplinks):
+    start = datetime(2025, 6, 1)
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "helium_gateway_data.csv")
+        write_csv(csv_path, n_rows, start)
+
+        t0 = time.perf_counter()
+        index = GatewayIndex(csv_path).load()
+        load_s = time.perf_counter() - t0
+
+        latencies = []
+        for k in range(n_uplinks):
+            rows = [fake_row(n_rows + k * 3 + j, start) for j in range(3)]  # 3 gateways par uplink
+            t0 = time.perf_counter()
+            with open(csv_path, "a", newline="") as f:
+                writer = csv.writer(f)
+                for row in rows:
+                    writer.writerow([row[col] for col in CSV_HEADER])
+            index.sync()
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    latencies.sort()
+    return load_s, statistics.median(latencies), latencies[int(len(latencies) * 0.95) - 1]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--uplinks", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} | {'startup load (s)':>16} | {'uplink p50 (ms)':>15} | {'uplink p95 (ms)':>15}")
+    for n in args.sizes:
+        load_s, p50, p95 = bench(n, args.uplinks)
+        print(f"{n:>10} | {load_s:>16.2f} | {p50:>15.3f} | {p95:>15.3f}")
@@ -0,0 +1,104 @@
+"""
+Lecture des sondages d'un jour dans un fichier IGRA dérivé de taille réelle :
+ancien parcours complet (readlines) contre l'index d'offsets + mmap.
+
+Usage : python3 benchmarks/bench_igra_index.py [--years 40] [--levels 80] [--lookups 500]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import calculate_igra
+
+STATION = "ITM00016044"
+FIRST_YEAR = 1980
+
+
+def write_derived_file(path, years, levels):
+    """Fichier au format IGRA2 dérivé : deux sondages par jour, lignes de 160+ caractères."""
+    rng = random.Random(0)
+    with open(path, "w") as f:
+        for year in range(FIRST_YEAR, FIRST_YEAR + years):
+            for month in range(1, 13):
+                for day in range(1, 29):
+                    for hour in (0, 12):
+                        f.write(f"#{STATION} {year:4d} {month:02d} {day:02d} {hour:02d} {hour:02d}00 {levels:4d}"
+                                + " " * 100 + "\n")
+                        for level in range(levels):
+                            height = 100 + 150 * level
+                            n = 320 - 40 * level // 10 + rng.randint(-5, 5)
+                            f.write(f"{100000 - 500 * level:7d}{0:9d}{height:7d}" + " " * 121 + f"{n:7d}" + " " * 20 + "\n")
+
+
+def legacy_parse(filepath, target_year, target_month, target_day):
+    """Ancienne version de parse_igra_derived_file (readlines puis parcours complet)."""
+    with open(filepath, 'r') as file:
+        lines = file.readlines()
+    data, current, inside = [], None, False
+    for line in lines:
+        if line.startswith('#'):
+            if (int(line[13:17]), int(line[18:20]), int(line[21:23])) == (target_year, target_month, target_day):
+                inside = True
+                if current:
+                    data.append(current)
+                current = {'levels': []}
+            else:
+                inside = False
+        elif inside and current:
+            try:
+                height, n = int(line[16:23].strip()), int(line[144:151].strip())
+                if height != -99999 and n != -99999:
+                    current['levels'].append((height, n))
+            except ValueError:
+                continue
+    if current and current['levels']:
+        data.append(current)
+    return data
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--years", type=int, default=40)
+    parser.add_argument("--levels", type=int, default=80)
+    parser.add_argument("--lookups", type=int, default=500)
+    parser.add_argument("--legacy-lookups", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    dates = [(rng.randrange(FIRST_YEAR, FIRST_YEAR + args.years), rng.randint(1, 12), rng.randint(1, 28))
+             for _ in range(args.lookups)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, f"{STATION}-drvd.txt")
+        write_derived_file(path, args.years, args.levels)
+        print(f"Derived file: {os.path.getsize(path) / 1e6:.0f} MB, {args.years * 12 * 28 * 2} soundings")
+
+        t0 = time.perf_counter()
+        for date in dates[:args.legacy_lookups]:
+            legacy_parse(path, *date)
+        legacy = (time.perf_counter() - t0) / args.legacy_lookups
+        print(f"readlines scan : {legacy * 1000:9.1f} ms / lookup")
+
+        t0 = time.perf_counter()
+        calculate_igra.load_igra_index(path)
+        print(f"index build    : {(time.perf_counter() - t0) * 1000:9.1f} ms (once per downloaded file)")
+
+        calculate_igra._igra_indexes.clear()
+        t0 = time.perf_counter()
+        calculate_igra.load_igra_index(path)
+        print(f"index reload   : {(time.perf_counter() - t0) * 1000:9.1f} ms (from {calculate_igra.INDEX_SUFFIX})")
+
+        t0 = time.perf_counter()
+        for date in dates:
+            calculate_igra.parse_igra_derived_file(path, *date)
+        indexed = (time.perf_counter() - t0) / len(dates)
+        print(f"indexed mmap   : {indexed * 1000:9.3f} ms / lookup  (x{legacy / indexed:.0f})")
+
+        date = dates[args.legacy_lookups - 1]
+        same = [s['levels'] for s in legacy_parse(path, *date)] == \
+               [s['levels'] for s in calculate_igra.parse_igra_derived_file(path, *date)]
+        print(f"same soundings as the legacy parser: {same}")
@@ -0,0 +1,77 @@
+"""
+Attribution de la station IGRA la plus proche au point milieu de chaque lien :
+ancien parcours linéaire (haversine sur toutes les stations) contre le KD-tree.
+
+Usage : python3 benchmarks/bench_igra_stations.py [--stations 1500] [--links 100000]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from igra_stations import StationIndex
+from calculate_igra import haversine
+
+YEAR = 2025
+
+
+def write_station_list(path, n):
+    rng = np.random.default_rng(0)
+    lats = np.degrees(np.arcsin(rng.uniform(-1, 1, n)))
+    lons = rng.uniform(-180, 180, n)
+    with open(path, "w") as f:
+        for i, (lat, lon) in enumerate(zip(lats, lons)):
+            last_year = YEAR if i % 5 else 1990  # une partie des stations n'est plus active
+            f.write(f"XXM{i:08d} {lat:8.4f} {lon:9.4f} {0:6.1f} {'':2} {'STATION':30} {1950:4d} {last_year:4d} {1000:6d}\n")
+
+
+def linear_nearest(lat, lon, index):
+    best, best_dist = None, float("inf")
+    for i in range(len(index)):
+        dist = haversine(lat, lon, index.lats[i], index.lons[i])
+        if dist < best_dist:
+            best, best_dist = i, dist
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stations", type=int, default=1500)
+    parser.add_argument("--links", type=int, default=100000)
+    parser.add_argument("--linear-links", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    lats = rng.uniform(35, 55, args.links)
+    lons = rng.uniform(-5, 30, args.links)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "igra2-station-list.txt")
+        write_station_list(path, args.stations)
+
+        t0 = time.perf_counter()
+        index = StationIndex.load(path, YEAR)
+        print(f"index build  : {(time.perf_counter() - t0) * 1000:8.1f} ms ({len(index)} active stations)")
+        t0 = time.perf_counter()
+        index = StationIndex.load(path, YEAR)
+        print(f"index reload : {(time.perf_counter() - t0) * 1000:8.1f} ms")
+
+        t0 = time.perf_counter()
+        expected = [linear_nearest(lat, lon, index) for lat, lon in zip(lats[:args.linear_links], lons[:args.linear_links])]
+        linear = (time.perf_counter() - t0) / args.linear_links
+        print(f"linear scan  : {linear * 1e6:8.1f} µs / link -> {linear * args.links:.1f} s for {args.links} links")
+
+        t0 = time.perf_counter()
+        nearest, _ = index.query(lats, lons)
+        batched = time.perf_counter() - t0
+        print(f"KD-tree      : {batched * 1000:8.1f} ms for {args.links} links")
+
+        t0 = time.perf_counter()
+        index.query(lats, lons, k=5)
+        print(f"KD-tree k=5  : {(time.perf_counter() - t0) * 1000:8.1f} ms")
+
+        print(f"same stations as the linear scan: {list(nearest[:args.linear_links]) == expected}")
@@ -0,0 +1,54 @@
+"""
+Compare le temps de chargement à froid des mesures : CSV (parsing ISO8601)
+contre le store Parquet partitionné par jour (lecture complète et sur 7 jours).
+
+Usage : python3 benchmarks/bench_measurement_store.py [--rows 1000000]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import measurement_store
+from bench_gateway_index import write_csv
+from datetime import datetime
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - t0, result
+
+
+def load_csv(path):
+    df = pd.read_csv(path)
+    df["date"] = pd.to_datetime(df["gwTime"], format="ISO8601").dt.strftime("%Y-%m-%d")
+    return df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} | {'CSV (s)':>8} | {'store full (s)':>14} | {'store 7 days (s)':>16} | {'CSV MB':>7} | {'store MB':>8}")
+    for n in args.rows:
+        with tempfile.TemporaryDirectory() as tmp:
+            csv_path = os.path.join(tmp, "helium_gateway_data.csv")
+            store_dir = os.path.join(tmp, "measurements")
+            write_csv(csv_path, n, datetime(2025, 6, 1))
+            measurement_store.migrate(csv_path, store_dir)
+
+            t_csv, _ = timed(lambda: load_csv(csv_path))
+            t_full, df = timed(lambda: measurement_store.read_measurements(store_dir=store_dir))
+            dates = measurement_store.list_dates(store_dir)
+            t_week, _ = timed(lambda: measurement_store.read_measurements(dates[-7], dates[-1], store_dir=store_dir))
+
+            csv_mb = os.path.getsize(csv_path) / 1e6
+            store_mb = sum(os.path.getsize(os.path.join(root, f))
+                           for root, _, files in os.walk(store_dir) for f in files) / 1e6
+            print(f"{n:>10} | {t_csv:>8.2f} | {t_full:>14.2f} | {t_week:>16.3f} | {csv_mb:>7.1f} | {store_mb:>8.1f}")
@@ -0,0 +1,57 @@
+"""
+Débit du moteur LOS natif (profils par seconde) sur des tuiles SRTM3 synthétiques.
+
+Usage : python3 benchmarks/bench_terrain_los.py [--profiles 500] [--radius 1.5]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import terrain_los
+
+END_LAT, END_LON = 45.70377, 13.72040
+
+
+def write_tiles(directory, lat0, lon0, radius, size=1201):
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:size, 0:size] / size
+    for la in range(int(np.floor(lat0 - radius)), int(np.floor(lat0 + radius)) + 1):
+        for lo in range(int(np.floor(lon0 - radius)), int(np.floor(lon0 + radius)) + 1):
+            relief = 400 * np.sin(6 * x + la) * np.cos(5 * y + lo) + rng.normal(0, 20, (size, size))
+            relief = np.clip(relief + 300, 0, None).astype('>i2')
+            relief.tofile(os.path.join(directory, f"{terrain_los.tile_name(la, lo)}.hgt"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profiles", type=int, default=500)
+    parser.add_argument("--radius", type=float, default=1.5, help="Max gateway distance (degrees)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    with tempfile.TemporaryDirectory() as tmp:
+        write_tiles(tmp, END_LAT, END_LON, args.radius)
+        tiles = terrain_los.HgtTiles(tmp)
+        gateways = np.column_stack([
+            END_LAT + rng.uniform(-args.radius, args.radius, args.profiles),
+            END_LON + rng.uniform(-args.radius, args.radius, args.profiles),
+        ])
+
+        terrain_los.analyse_link(tiles, END_LAT, END_LON, *gateways[0])  # ouverture des tuiles
+        t0 = time.perf_counter()
+        n_points = 0
+        nlos = 0
+        for gw_lat, gw_lon in gateways:
+            distances, elevations = terrain_los.terrain_profile(tiles, END_LAT, END_LON, gw_lat, gw_lon)
+            result = terrain_los.los_clearance(distances, elevations)
+            n_points += len(distances)
+            nlos += result["nlos"]
+        elapsed = time.perf_counter() - t0
+
+    print(f"{args.profiles} profiles ({n_points / args.profiles:.0f} samples on average) in {elapsed:.2f}s "
+          f"-> {args.profiles / elapsed:.0f} profiles/s ({nlos} NLOS)")
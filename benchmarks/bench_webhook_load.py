@@ -0,0 +1,175 @@
+"""
+Test de charge local du webhook : des clients concurrents envoient des uplinks Helium
+(POST /helium-data) et lisent la carte (manifeste, shards par date, /api/gateways,
+/api/dates) ; débit, latences p50/p95/p99 et erreurs par type de requête.
+
+Avec --server, le serveur est lancé par le script (depuis la racine du dépôt, avec les
+dossiers /app/output du conteneur) :
+- dev      : python3 webhook_server.py (un processus, serveur Flask) ;
+- gunicorn : les deux pools de gunicorn.conf.py (lecture sur 5000, ingestion sur 5001).
+Sans --server, le test vise un webhook déjà lancé (--url / --ingest-url).
+
+Usage : python3 benchmarks/bench_webhook_load.py --server gunicorn [--clients 32] [--duration 20]
+"""
+import os
+import json
+import time
+import random
+import argparse
+import threading
+import subprocess
+import statistics
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+N_GATEWAYS = 50
+
+
+def helium_payload():
+    """Uplink reçu par 1 à 3 gateways, au format de la console Helium."""
+    now = datetime.now(timezone.utc).isoformat()
+    rx_info = []
+    for gw in random.sample(range(N_GATEWAYS), random.randint(1, 3)):
+        rx_info.append({
+            "gwTime": now,
+            "gatewayId": f"loadtest{gw:03d}",
+            "rssi": random.randint(-130, -90),
+            "snr": round(random.uniform(-15, 10), 1),
+            "metadata": {
+                "gateway_name": f"load-test-{gw}",
+                "gateway_id": f"lt{gw}",
+                "gateway_lat": str(45.5 + gw / 100),
+                "gateway_long": str(13.5 + gw / 100),
+            },
+        })
+    return json.dumps({"rxInfo": rx_info}).encode()
+
+
+def request(url, data=None):
+    headers = {"Accept-Encoding": "gzip"}
+    if data is not None:
+        headers["Content-Type"] = "application/json"
+    req = urllib.request.Request(url, data=data, headers=headers)
+    with urllib.request.urlopen(req, timeout=30) as response:
+        response.read()
+        return response.status
+
+
+class LoadTest:
+    def __init__(self, url, ingest_url, ingest_ratio):
+        self.url = url.rstrip("/")
+        self.ingest_url = ingest_url.rstrip("/")
+        self.ingest_ratio = ingest_ratio
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.dates = []
+        self.manifest = {}
+
+    def refresh_dates(self):
+        with urllib.request.urlopen(f"{self.url}/api/optimized_gateways/manifest", timeout=30) as response:
+            self.manifest = json.load(response)["dates"]
+        self.dates = sorted(self.manifest)
+
+    def pick(self):
+        if random.random() < self.ingest_ratio or not self.dates:
+            return "ingest", f"{self.ingest_url}/helium-data", helium_payload()
+        date = random.choice(self.dates[-30:])
+        kind = random.choice(["manifest", "shard", "gateways", "dates"])
+        url = {
+            "manifest": f"{self.url}/api/optimized_gateways/manifest",
+            "shard": f"{self.url}/api/optimized_gateways/{date}?v={self.manifest.get(date, '')}",
+            "gateways": f"{self.url}/api/gateways?date={date}",
+            "dates": f"{self.url}/api/dates",
+        }[kind]
+        return kind, url, None
+
+    def client(self, deadline):
+        while time.monotonic() < deadline:
+            kind, url, data = self.pick()
+            t0 = time.perf_counter()
+            try:
+                request(url, data)
+            except (urllib.error.URLError, OSError) as e:
+                with self.lock:
+                    self.errors[kind] = self.errors.get(kind, 0) + 1
+                if not isinstance(e, urllib.error.HTTPError):
+                    time.sleep(0.05)
+                continue
+            elapsed = (time.perf_counter() - t0) * 1000
+            with self.lock:
+                self.latencies.setdefault(kind, []).append(elapsed)
+
+    def run(self, clients, duration):
+        self.refresh_dates()
+        deadline = time.monotonic() + duration
+        threads = [threading.Thread(target=self.client, args=(deadline,)) for _ in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def report(self, duration):
+        total = sum(len(values) for values in self.latencies.values())
+        print(f"{total} requests in {duration} s: {total / duration:.0f} req/s, "
+              f"{sum(self.errors.values())} errors")
+        print(f"{'request':>10} | {'count':>7} | {'p50 (ms)':>9} | {'p95 (ms)':>9} | {'p99 (ms)':>9} | {'errors':>6}")
+        for kind in sorted(set(self.latencies) | set(self.errors)):
+            values = sorted(self.latencies.get(kind, [])) or [float("nan")]
+            pct = lambda q: values[min(len(values) - 1, int(len(values) * q))]
+            print(f"{kind:>10} | {len(self.latencies.get(kind, [])):>7} | {statistics.median(values):>9.1f} | "
+                  f"{pct(0.95):>9.1f} | {pct(0.99):>9.1f} | {self.errors.get(kind, 0):>6}")
+
+
+def start_server(kind):
+    env = dict(os.environ, WEBHOOK_LOGS="0")
+    if kind == "dev":
+        commands = [(["python3", "webhook_server.py"], env)]
+    else:
+        commands = [(["gunicorn", "-c", "gunicorn.conf.py", "webhook_server:app"], dict(env, WEBHOOK_POOL=pool))
+                    for pool in ("read", "ingest")]
+    processes = [subprocess.Popen(command, cwd=ROOT, env=command_env, stdout=subprocess.DEVNULL)
+                 for command, command_env in commands]
+    return processes
+
+
+def wait_ready(urls, timeout=120):
+    deadline = time.monotonic() + timeout
+    for url in urls:
+        while True:
+            try:
+                request(url)
+                break
+            except (urllib.error.URLError, OSError):
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"{url} not ready after {timeout} s")
+                time.sleep(0.5)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--server", choices=["dev", "gunicorn"], default=None,
+                        help="Start the webhook before the test (default: use a running one)")
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--ingest-url", default=None, help="Default: port 5001 with --server gunicorn, else --url")
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--duration", type=int, default=20, help="Seconds")
+    parser.add_argument("--ingest-ratio", type=float, default=0.3, help="Share of requests that are uplinks")
+    args = parser.parse_args()
+
+    ingest_url = args.ingest_url or ("http://localhost:5001" if args.server == "gunicorn" else args.url)
+    processes = start_server(args.server) if args.server else []
+    try:
+        wait_ready([f"{args.url}/", f"{ingest_url}/"])
+        test = LoadTest(args.url, ingest_url, args.ingest_ratio)
+        test.run(args.clients, args.duration)
+        test.report(args.duration)
+        with urllib.request.urlopen(f"{ingest_url}/api/ingest_stats", timeout=30) as response:
+            print("ingest stats (one worker):", json.load(response))
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=60)
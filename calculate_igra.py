@@ -1,7 +1,8 @@
 import os
-import sys
 import subprocess
 import datetime
+import mmap
+import numpy as np
 import pandas as pd
 from math import radians, cos, sin, sqrt, atan2, degrees
 import matplotlib.pyplot as plt
@@ -9,6 +10,10 @@ import argparse
 import json
 import glob
 from configs.config_coords import END_DEVICE_LAT, END_DEVICE_LON
+from measurement_store import load_measurements
+import igra_reader
+from igra_stations import StationIndex
+from render_pool import RenderPool, RENDER_WORKERS, make_job
 
 last_message_type = None  # Global tracker for logs
 
@@ -23,11 +28,14 @@ STATIONS_FILE = "/app/output/igra-datas/igra2-station-list.txt"
 OUTPUT_JSON = "/app/output/igra-datas/map_links.json"
 GRADIENT_CACHE_FILE = "/app/output/processed_gradients.json"
 
+# Index (année, mois, jour, heure) -> octets de chaque sondage, enregistré à côté du fichier IGRA
+INDEX_SUFFIX = ".idx.npz"
+
 EARTH_RADIUS = 6371.0
 
 parser = argparse.ArgumentParser()
 parser.add_argument("--logs", action="store_true")
-args = parser.parse_args()
+parser.add_argument("--render-workers", type=int, default=RENDER_WORKERS, help="Max processes rendering the graphs")
 
 
 def log(message):
@@ -51,10 +59,13 @@ def log(message):
 
 
 os.makedirs(LOCAL_DIR, exist_ok=True)
-# Supprime les anciens fichiers pour être sûr d'avoir les infos les plus récentes (png et données IGRA)
-for file in glob.glob(f"{LOCAL_DIR}ITM*-drvd.txt"):
-    os.remove(file)
-log("Removed old IGRA data files")
+
+
+def remove_old_igra_files():
+    # Supprime les anciens fichiers pour être sûr d'avoir les infos les plus récentes (png et données IGRA)
+    for file in glob.glob(f"{LOCAL_DIR}ITM*-drvd.txt") + glob.glob(f"{LOCAL_DIR}ITM*-drvd.txt{INDEX_SUFFIX}"):
+        os.remove(file)
+    log("Removed old IGRA data files")
 
 
 def load_processed_gradients():
@@ -86,16 +97,10 @@ def get_stations():
         except subprocess.CalledProcessError:
             log(f"Error downloading {IGRA_STATIONS_FILE}")
             return None
-        
-    # column LSTYEAR is 78-81
-    stations = []
-    with open(STATIONS_FILE, "r") as f:
-        for line in f:
-            if int(line[77:81]) == CURRENT_YEAR:
-                # On garde que les stations intéressantes pour nous
-                stations.append({"id": line[0:11].strip(), "lat": float(line[12:20].strip()), "lon": float(line[21:30].strip())})
 
-    return stations
+    # On garde que les stations actives cette année (colonne LSTYEAR), index mis en cache
+    # à côté de la liste et reconstruit seulement quand elle est re-téléchargée
+    return StationIndex.load(STATIONS_FILE, CURRENT_YEAR)
 
 def download_igra_file(id):
     # télécharge le zip, décompresse et nettoie pour un id demandé
@@ -141,50 +146,100 @@ def spherical_midpoint(lat1, lon1, lat2, lon2):
     # Convert back to degrees
     return degrees(lat3), degrees(lon3)
 
+def spherical_midpoints(lats, lons, lat2, lon2):
+    """Version vectorisée de spherical_midpoint pour des tableaux de gateways."""
+    lat1, lon1 = np.radians(np.asarray(lats, dtype=float)), np.radians(np.asarray(lons, dtype=float))
+    lat2, lon2 = radians(lat2), radians(lon2)
+    Bx = cos(lat2) * np.cos(lon2 - lon1)
+    By = cos(lat2) * np.sin(lon2 - lon1)
+    lat3 = np.arctan2(np.sin(lat1) + sin(lat2), np.sqrt((np.cos(lat1) + Bx)**2 + By**2))
+    lon3 = lon1 + np.arctan2(By, np.cos(lat1) + Bx)
+    return np.degrees(lat3), np.degrees(lon3)
+
 def find_closest_station(lat, lon, stations):
-    closest = None
-    min_dist = float("inf")
-    for s in stations:
-        dist = haversine(lat, lon, s["lat"], s["lon"])
-        if dist < min_dist:
-            min_dist = dist
-            closest = s
+    return stations.nearest(lat, lon)
 
-    return closest
 
+def sounding_key(year, month, day, hour=0):
+    return ((year * 100 + month) * 100 + day) * 100 + hour
 
-def parse_igra_derived_file(filepath, target_year, target_month, target_day):
-    with open(filepath, 'r') as file:
-        lines = file.readlines()
 
-    data = []
-    current_sounding = None
-    inside_target_day = False
-
-    for line in lines:
-        if line.startswith('#'):
-            year = int(line[13:17])
-            month = int(line[18:20])
-            day = int(line[21:23])
-
-            if year == target_year and month == target_month and day == target_day:
-                inside_target_day = True
-                if current_sounding:
-                    data.append(current_sounding)
-                current_sounding = {'date': (year, month, day), 'levels': []}
-            else:
-                inside_target_day = False
-        elif inside_target_day and current_sounding:
+def build_igra_index(filepath):
+    """
+    Parcourt une seule fois le fichier et repère le début et la fin de chaque sondage
+    (lignes d'en-tête '#'). Les clés sont triées pour une recherche par dichotomie.
+    """
+    keys, starts = [], []
+    size = os.path.getsize(filepath)
+    if size == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return {"keys": empty, "starts": empty, "ends": empty}
+
+    with open(filepath, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        pos = 0 if mm[:1] == b"#" else mm.find(b"\n#")
+        pos = pos + 1 if pos >= 0 and mm[pos:pos + 1] == b"\n" else pos
+        while pos >= 0:
+            header = mm[pos:pos + 26]
             try:
-                height = int(line[16:23].strip())
-                N = int(line[144:151].strip())
-                if height != -99999 and N != -99999:
-                    current_sounding['levels'].append((height, N))
+                hour = int(header[24:26])
             except ValueError:
-                continue
+                hour = 99
+            keys.append(sounding_key(int(header[13:17]), int(header[18:20]), int(header[21:23]), hour))
+            starts.append(pos)
+            pos = mm.find(b"\n#", pos)
+            pos = pos + 1 if pos >= 0 else pos
+
+    starts = np.array(starts, dtype=np.int64)
+    ends = np.append(starts[1:], size).astype(np.int64)
+    keys = np.array(keys, dtype=np.int64)
+    order = np.argsort(keys, kind="stable")
+    return {"keys": keys[order], "starts": starts[order], "ends": ends[order]}
+
+
+_igra_indexes = {}
+
 
-    if current_sounding and current_sounding['levels']:
-        data.append(current_sounding)
+def load_igra_index(filepath):
+    """Index du fichier, reconstruit seulement si le fichier IGRA a changé (taille ou date)."""
+    stat = os.stat(filepath)
+    signature = (stat.st_size, stat.st_mtime_ns)
+    cached = _igra_indexes.get(filepath)
+    if cached and cached[0] == signature:
+        return cached[1]
+
+    index_path = filepath + INDEX_SUFFIX
+    index = None
+    if os.path.exists(index_path):
+        try:
+            with np.load(index_path) as saved:
+                if tuple(int(v) for v in saved["signature"]) == signature:
+                    index = {name: saved[name] for name in ("keys", "starts", "ends")}
+        except (OSError, ValueError, KeyError):
+            index = None
+
+    if index is None:
+        index = build_igra_index(filepath)
+        tmp = index_path + ".tmp.npz"
+        np.savez(tmp, signature=np.array(signature, dtype=np.int64), **index)
+        os.replace(tmp, index_path)
+        log(f"Indexed {len(index['keys'])} soundings of {os.path.basename(filepath)}")
+
+    _igra_indexes[filepath] = (signature, index)
+    return index
+
+
+def parse_igra_derived_file(filepath, target_year, target_month, target_day):
+    """Sondages d'un jour : lecture directe des octets du jour grâce à l'index (mmap)."""
+    index = load_igra_index(filepath)
+    lo = np.searchsorted(index["keys"], sounding_key(target_year, target_month, target_day, 0), side="left")
+    hi = np.searchsorted(index["keys"], sounding_key(target_year, target_month, target_day, 99), side="right")
+    if lo == hi:
+        return []
+
+    data = []
+    with open(filepath, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for start, end in zip(index["starts"][lo:hi], index["ends"][lo:hi]):
+            data.extend(igra_reader.as_legacy(*igra_reader.parse_buffer(np.frombuffer(mm[start:end], dtype=np.uint8))))
 
     return data
 
@@ -199,6 +254,7 @@ def compute_gradients(levels):
     return gradients
 
 def plot_gradients(gradients, output_file, title_date, gateway_name, station_id):
+    """Job de rendu (données simples) du graphe d'un sondage, exécuté par render_pool."""
     heights = [h for h, _ in gradients]
     dn_dh = [v for _, v in gradients]
 
@@ -208,6 +264,12 @@ def plot_gradients(gradients, output_file, title_date, gateway_name, station_id)
     # description = call_ollama(station_id, title_date, prompt)
     description = describe_ducting_case(zones)
 
+    title = f'Refractivity gradient of {gateway_name} – {title_date} (Station {station_id})'
+    return make_job("calculate_igra:draw_gradients", output_file,
+                    heights=heights, dn_dh=dn_dh, title=title, description=description)
+
+
+def draw_gradients(output_file, heights, dn_dh, title, description):
     # Créer la figure avec 2 zones : graphe + texte
     fig, axs = plt.subplots(2, 1, figsize=(6, 10), gridspec_kw={'height_ratios': [3, 1]})
 
@@ -217,7 +279,7 @@ def plot_gradients(gradients, output_file, title_date, gateway_name, station_id)
     axs[0].invert_yaxis()
     axs[0].set_xlabel('Refractivity gradient (km⁻¹)')
     axs[0].set_ylabel('Height (m)')
-    axs[0].set_title(f'Refractivity gradient of {gateway_name} – {title_date} (Station {station_id})', wrap=True)
+    axs[0].set_title(title, wrap=True)
     axs[0].grid(True)
     axs[0].legend()
 
@@ -228,8 +290,7 @@ def plot_gradients(gradients, output_file, title_date, gateway_name, station_id)
 
     plt.tight_layout()
     plt.savefig(output_file, dpi=300)
-    plt.close()
-    log(f"Graph with analysis saved in {output_file}")
+    plt.close(fig)
 
 
 
@@ -285,9 +346,44 @@ def describe_ducting_case(duct_zones):
 
 
 
-def main(test_index=None):
-    df = pd.read_csv(INPUT_CSV)
-    df["gwTime"] = pd.to_datetime(df["gwTime"], format='ISO8601')
+def read_igra_period(filepath, first_day, last_day):
+    """
+    Sondages de toute une période en une lecture : l'index donne la plage d'octets
+    couvrant les jours demandés, décodée en une seule fois. {date: [sondages]}.
+    """
+    index = load_igra_index(filepath)
+    lo = np.searchsorted(index["keys"], sounding_key(first_day.year, first_day.month, first_day.day, 0), side="left")
+    hi = np.searchsorted(index["keys"], sounding_key(last_day.year, last_day.month, last_day.day, 99), side="right")
+    if lo == hi:
+        return {}
+
+    start, end = index["starts"][lo:hi].min(), index["ends"][lo:hi].max()
+    with open(filepath, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        soundings = igra_reader.as_legacy(*igra_reader.parse_buffer(np.frombuffer(mm[start:end], dtype=np.uint8)))
+
+    by_day = {}
+    for sounding in soundings:
+        day = datetime.date(*sounding['date'])
+        if first_day <= day <= last_day:
+            by_day.setdefault(day, []).append(sounding)
+    return by_day
+
+
+def unique_links(df, already_processed):
+    """Une ligne par (gateway, jour) NLOS encore à traiter, au lieu d'une par mesure."""
+    links = df[df["visibility"] != "LOS"].copy()
+    links["date"] = pd.to_datetime(links["gwTime"]).dt.date
+    links = links.drop_duplicates(subset=["gatewayId", "date"])[
+        ["gatewayId", "gateway_name", "gateway_lat", "gateway_long", "date"]
+    ]
+    done = [gw_name in already_processed and date.isoformat() in already_processed[gw_name]
+            for gw_name, date in zip(links["gateway_name"], links["date"])]
+    log(f"{len(links)} unique (gateway, day) links, {sum(done)} already processed")
+    return links[~np.array(done, dtype=bool)].reset_index(drop=True)
+
+
+def main(test_index=None, render_workers=None):
+    df = load_measurements(csv_file=INPUT_CSV)
 
     stations = get_stations()
 
@@ -307,79 +403,77 @@ def main(test_index=None):
             log(f"Error loading existing JSON file: {str(e)}")
             json_output = {}
 
-    for _, row in df.iterrows():
-        lat, lon = row["gateway_lat"], row["gateway_long"]
-        mid_lat, mid_lon = spherical_midpoint(lat, lon, END_DEVICE_LAT, END_DEVICE_LON)
-        date = row["gwTime"]
-        gw_name = row["gateway_name"]
-        gw_id = row["gatewayId"]
-        visibility = row["visibility"]
-        output_image = f"{LOCAL_DIR}gradient_{gw_name}_{date.strftime('%Y-%m-%d')}.png"
-
-
-        date_str = date.date().isoformat()
-
-        if visibility == "LOS":
-            # passer les LOS pour pas avoir de graphes inutiles
-            continue
-
-        if gw_name in already_processed and date_str in already_processed[gw_name]:
-            log(f"Already processed : ({gw_name}, {date_str})")
-            continue
-
-        # Ajoute l'entrée au cache
-        # already_processed.setdefault(gw_name, set()).add(date_str)
-
-
-        closest = find_closest_station(mid_lat, mid_lon, stations)
-        if not closest:
-            log("No near station found.")
-            continue
-
-        igra_file = download_igra_file(closest["id"])
-        if not igra_file or not os.path.exists(igra_file):
-            log(f"IGRA file not found : {igra_file}")
-            continue
-
-        results = parse_igra_derived_file(
-            igra_file,
-            date.year,
-            date.month,
-            date.day
+    links = unique_links(df, already_processed)
+    renders = []
+    if links.empty or not stations:
+        log("No link to process." if stations else "No near station found.")
+    else:
+        # Point milieu de chaque lien et station la plus proche, en une seule requête sur l'index
+        links["mid_lat"], links["mid_lon"] = spherical_midpoints(
+            links["gateway_lat"], links["gateway_long"], END_DEVICE_LAT, END_DEVICE_LON
         )
+        closest_indices, _ = stations.query(links["mid_lat"], links["mid_lon"])
+        links["station"] = closest_indices
 
-        if results:
-            # Ajoute l'entrée au cache seulement si des résultats sont trouvés
-            already_processed.setdefault(gw_name, set()).add(date_str)
-
-            gradients = compute_gradients(results[0]['levels'])
-            # gateway_name_safe = row["gateway_name"].replace(" ", "_").replace("/", "_")
-            plot_gradients(gradients, output_image, date.strftime('%Y-%m-%d'), gw_name, closest["id"])
-
-            if gw_id not in json_output:
-                json_output[gw_id] = {
-                    "gateway_name": gw_name,
-                    "gateway_coords": [lat, lon],
-                    "station_id": closest["id"],
-                    "station_coords": [closest["lat"], closest["lon"]],
-                    "midpoint": [mid_lat, mid_lon],
-                    "graphs": {}  # <- nouveau dictionnaire par date
-                }
-            elif "graphs" not in json_output[gw_id]:
-                json_output[gw_id]["graphs"] = {}
-
-            # Ajouter le graphe du jour à "graphs"
-            date_key = pd.to_datetime(date).strftime("%Y-%m-%d")
-
-            # Seulement si la gateway est en NLOS car plus intéressant
-            # if visibility == "NLOS":
-            json_output[gw_id]["graphs"][date_key] = output_image
+        # Chaque fichier de station est lu une seule fois, chaque jour de station tracé une seule fois
+        for station_index, station_links in links.groupby("station", sort=True):
+            closest = stations.station(station_index)
 
+            igra_file = download_igra_file(closest["id"])
+            if not igra_file or not os.path.exists(igra_file):
+                log(f"IGRA file not found : {igra_file}")
+                continue
 
-            log("Results found and saved in json")
-
-        else:
-            log(f"No sounding found for this date. {date}, for {gw_name}")
+            soundings_by_day = read_igra_period(igra_file, station_links["date"].min(), station_links["date"].max())
+
+            for date, day_links in station_links.groupby("date", sort=True):
+                date_str = date.isoformat()
+                results = soundings_by_day.get(date)
+                if not results:
+                    log(f"No sounding found for this date. {date_str}, for {', '.join(day_links['gateway_name'])}")
+                    continue
+
+                output_image = f"{LOCAL_DIR}gradient_{closest['id']}_{date_str}.png"
+                gradients = compute_gradients(results[0]['levels'])
+                # Titre calculé sur toutes les gateways du graphe partagé, y compris celles
+                # reliées par un passage précédent (map_links.json), pas seulement ce lot
+                names = {gw_id: entry["gateway_name"] for gw_id, entry in json_output.items()
+                         if entry.get("graphs", {}).get(date_str) == output_image}
+                names.update(zip(day_links["gatewayId"], day_links["gateway_name"]))
+                label = next(iter(names.values())) if len(names) == 1 else f"{len(names)} gateways"
+                renders.append((plot_gradients(gradients, output_image, date_str, label, closest["id"]),
+                                closest, date_str, day_links))
+
+    # Tous les graphes sont rendus en parallèle, puis reliés aux gateways s'ils ont été écrits
+    with RenderPool(render_workers, on_error=log) as pool:
+        rendered = pool.run(job for job, _, _, _ in renders)
+    log(f"Rendering: {pool.stats()}")
+
+    for job, closest, date_str, day_links in renders:
+        output_image = job["output"]
+        if rendered.get(output_image):
+            # Le même graphe est partagé par toutes les gateways rattachées à cette station ce jour-là
+            for link in day_links.itertuples(index=False):
+                gw_id = link.gatewayId
+                # Ajoute l'entrée au cache seulement si des résultats sont trouvés
+                already_processed.setdefault(link.gateway_name, set()).add(date_str)
+
+                if gw_id not in json_output:
+                    json_output[gw_id] = {
+                        "gateway_name": link.gateway_name,
+                        "gateway_coords": [link.gateway_lat, link.gateway_long],
+                        "station_id": closest["id"],
+                        "station_coords": [closest["lat"], closest["lon"]],
+                        "midpoint": [link.mid_lat, link.mid_lon],
+                        "graphs": {}  # <- nouveau dictionnaire par date
+                    }
+                elif "graphs" not in json_output[gw_id]:
+                    json_output[gw_id]["graphs"] = {}
+
+                # Ajouter le graphe du jour à "graphs"
+                json_output[gw_id]["graphs"][date_str] = output_image
+
+            log(f"Results found for {closest['id']} on {date_str}, shared by {len(day_links)} gateways")
 
     # Écriture du fichier JSON
     if json_output:
@@ -392,9 +486,10 @@ def main(test_index=None):
     print(f"IGRA graphs saved in {LOCAL_DIR}")
     log(f"Link file saved to {OUTPUT_JSON}")    
 
-# Pour exécuter le script normalement :
-main()
-
-# Pour exécuter en mode test sur la ligne 0 :
-# if __name__ == "__main__":
+# Pour exécuter le script normalement (le module reste importable sans effet de bord) :
+if __name__ == "__main__":
+    args = parser.parse_args()
+    remove_old_igra_files()
+    main(render_workers=args.render_workers)
+    # Pour exécuter en mode test sur la ligne 0 :
     # main(test_index=1)
\ No newline at end of file
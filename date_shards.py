@@ -0,0 +1,101 @@
+import gzip
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Réponses de /api/optimized_gateways/<date> : un JSON compact par date, compressé une
+# seule fois (gzip, et brotli si le module est installé) et gardé en mémoire pour les
+# dates les plus demandées. Le manifeste donne l'empreinte de chaque date : elle change
+# quand la date reçoit des mesures, ou quand les liens IGRA ou les visibilités changent.
+MAX_CACHED_DATES = 64
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def encode(payload):
+    """Empreinte du JSON (base des ETag forts) et corps par encodage : identity, gzip, br."""
+    body = json.dumps(payload, separators=(",", ":")).encode()
+    variants = {"identity": body, "gzip": gzip.compress(body, GZIP_LEVEL, mtime=0)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(body, quality=BROTLI_QUALITY)
+    return hashlib.sha1(body).hexdigest()[:20], variants
+
+
+def negotiate(accept_encoding, variants):
+    """Meilleur encodage disponible accepté par le client (br, puis gzip, sinon identity)."""
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in ("br", "gzip"):
+        if encoding in variants and accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return "identity"
+
+
+class DateShards:
+    """
+    render(date, gateways) construit la réponse d'une date (jointure liens IGRA et
+    visibilité), inputs_version() résume ces données externes. Une date n'est
+    re-sérialisée que si son empreinte a changé depuis la dernière requête.
+    """
+
+    def __init__(self, index, render, inputs_version, max_dates=MAX_CACHED_DATES):
+        self.index = index
+        self.render = render
+        self.inputs_version = inputs_version
+        self.max_dates = max_dates
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def manifest(self):
+        """{date: empreinte} pour toutes les dates de l'index."""
+        inputs = self.inputs_version()
+        return {date: self._version(date, count, inputs) for date, count in sorted(self.index.versions().items())}
+
+    @staticmethod
+    def _version(date, count, inputs):
+        return hashlib.sha1(repr((date, count, inputs)).encode()).hexdigest()[:16]
+
+    def get(self, date):
+        """(version, empreinte du contenu, variantes) de la date, ou None si elle est inconnue."""
+        count = self.index.versions().get(date)
+        if count is None:
+            return None
+        version = self._version(date, count, self.inputs_version())
+
+        with self.lock:
+            cached = self.cache.get(date)
+            if cached is not None and cached[0] == version:
+                self.hits += 1
+                self.cache.move_to_end(date)
+                return cached
+            self.misses += 1
+
+        gateways = self.index.snapshot([date]).get(date, {})
+        entry = (version, *encode(self.render(date, gateways)))
+        with self.lock:
+            self.cache[date] = entry
+            self.cache.move_to_end(date)
+            while len(self.cache) > self.max_dates:
+                self.cache.popitem(last=False)
+        return entry
+
+    def stats(self):
+        with self.lock:
+            return {"cached_dates": len(self.cache), "hits": self.hits, "misses": self.misses,
+                    "brotli": brotli is not None}
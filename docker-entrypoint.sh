@@ -5,4 +5,5 @@ set -e
 source venv/bin/activate
 
 echo "🚀 Launching application..."
-python3 main.py --logs | tee /app/output/app.log
+# WEBHOOK_PRODUCTION=1 : webhook servi par gunicorn (voir gunicorn.conf.py)
+python3 main.py --logs ${WEBHOOK_PRODUCTION:+--production} | tee /app/output/app.log
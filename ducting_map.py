@@ -0,0 +1,185 @@
+import os
+import json
+import shutil
+import argparse
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.image
+from matplotlib import colormaps
+
+from era5_gradients import DUCTING_THRESHOLD, GRIB_DIR, load_cube, compute_cube, _grib_signature
+
+# Carte de ducting ERA5 : pour chaque point de grille et chaque pas de temps, le dN/dh
+# minimal de la colonne et la hauteur de base du premier niveau en ducting. Les rasters
+# (float16 / uint8) sont enregistrés par jour, avec une image PNG par heure et une image
+# de la probabilité journalière, affichées sur la carte Leaflet en L.imageOverlay.
+DUCT_MAP_DIR = "/app/output/era5/ducting"
+RASTERS = ("min_gradient", "duct_base", "ducting")
+PIXELS_PER_CELL = 4
+GRADIENT_FLOOR = -400  # N/km, couleur la plus foncée
+
+
+def duct_fields(cube):
+    """
+    (temps, lat, lon) : dN/dh minimal (N/km), hauteur de base du premier niveau en
+    ducting (m, NaN sans ducting) et masque de ducting.
+    """
+    result = compute_cube(cube)
+    gradients, heights = result["gradients"], result["heights"]
+    ducting_levels = gradients < DUCTING_THRESHOLD
+    first = np.argmax(ducting_levels, axis=1)[:, None]
+    duct_base = np.take_along_axis(heights, first, axis=1)[:, 0]
+    duct_base[~result["ducting"]] = np.nan
+    return {
+        "min_gradient": np.nanmin(gradients, axis=1),
+        "duct_base": duct_base,
+        "ducting": result["ducting"],
+    }
+
+
+def grid_bounds(lats, lons):
+    """Emprise [[sud, ouest], [nord, est]] des mailles (points de grille au centre)."""
+    half_lat = abs(lats[1, 0] - lats[0, 0]) / 2 if lats.shape[0] > 1 else 0.125
+    half_lon = abs(lons[0, 1] - lons[0, 0]) / 2 if lons.shape[1] > 1 else 0.125
+    return [[float(lats.min() - half_lat), float(lons.min() - half_lon)],
+            [float(lats.max() + half_lat), float(lons.max() + half_lon)]]
+
+
+def mercator_rows(bounds, n_rows, height):
+    """
+    Ligne source (0 = nord) de chaque ligne d'une image de `height` pixels : Leaflet
+    étire l'image en Web Mercator, les lignes sont donc espacées en y Mercator.
+    """
+    (south, _), (north, _) = bounds
+    y = lambda lat: np.log(np.tan(np.pi / 4 + np.radians(lat) / 2))
+    pixel_y = y(north) - (np.arange(height) + 0.5) / height * (y(north) - y(south))
+    pixel_lat = np.degrees(2 * np.arctan(np.exp(pixel_y)) - np.pi / 2)
+    row = np.floor((north - pixel_lat) / (north - south) * n_rows).astype(int)
+    return np.clip(row, 0, n_rows - 1)
+
+
+def to_image(values, bounds, pixels=PIXELS_PER_CELL):
+    """Raster (lat, lon), ligne 0 au nord, agrandi et remis en projection Mercator."""
+    rows = mercator_rows(bounds, values.shape[0], values.shape[0] * pixels)
+    return np.repeat(values[rows], pixels, axis=1)
+
+
+def ducting_rgba(min_gradient):
+    """Mailles en ducting en rouge (plus foncé si le gradient est fort), transparentes sinon."""
+    strength = np.clip((DUCTING_THRESHOLD - min_gradient) / (DUCTING_THRESHOLD - GRADIENT_FLOOR), 0, 1)
+    rgba = colormaps["Reds"](0.35 + 0.65 * np.nan_to_num(strength))
+    rgba[..., 3] = np.where(min_gradient < DUCTING_THRESHOLD, 0.75, 0)
+    return rgba
+
+
+def probability_rgba(probability):
+    """Part des heures du jour en ducting (%), du jaune au rouge foncé."""
+    rgba = colormaps["YlOrRd"](0.3 + 0.7 * probability / 100)
+    rgba[..., 3] = np.where(probability > 0, 0.25 + 0.5 * probability / 100, 0)
+    return rgba
+
+
+def day_dir(day_str):
+    return os.path.join(DUCT_MAP_DIR, day_str)
+
+
+def build_day(grib_file, day_str, force=False):
+    """
+    Rasters et images d'un jour, écrits dans un dossier temporaire puis renommé.
+    Rien n'est refait si le GRIB n'a pas changé depuis le dernier calcul.
+    """
+    target = day_dir(day_str)
+    meta_path = os.path.join(target, "meta.json")
+    if not force and os.path.exists(meta_path):
+        with open(meta_path, "r") as f:
+            if json.load(f)["signature"] == _grib_signature(grib_file):
+                return target
+
+    cube = load_cube(grib_file)
+    fields = duct_fields(cube)
+    lats, lons = np.asarray(cube["lats"]), np.asarray(cube["lons"])
+    if lats[0, 0] < lats[-1, 0]:
+        # Ligne 0 au nord, comme les images
+        fields = {name: values[:, ::-1] for name, values in fields.items()}
+        lats = lats[::-1]
+    bounds = grid_bounds(lats, lons)
+    probability = np.round(100 * fields["ducting"].mean(axis=0)).astype(np.uint8)
+
+    tmp = f"{target}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    np.save(os.path.join(tmp, "min_gradient.npy"), fields["min_gradient"].astype(np.float16))
+    np.save(os.path.join(tmp, "duct_base.npy"), fields["duct_base"].astype(np.float16))
+    np.save(os.path.join(tmp, "ducting.npy"), fields["ducting"].astype(np.uint8))
+    np.save(os.path.join(tmp, "probability.npy"), probability)
+
+    hours = [int(t) // 100 for t in cube["times"]]
+    for t, hour in enumerate(hours):
+        rgba = ducting_rgba(to_image(fields["min_gradient"][t].astype(float), bounds))
+        matplotlib.image.imsave(os.path.join(tmp, f"{hour:02d}.png"), rgba)
+    matplotlib.image.imsave(os.path.join(tmp, "probability.png"),
+                            probability_rgba(to_image(probability.astype(float), bounds)))
+
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump({
+            "date": day_str,
+            "signature": _grib_signature(grib_file),
+            "hours": hours,
+            "bounds": bounds,
+            "shape": list(fields["ducting"].shape),
+            "threshold": DUCTING_THRESHOLD,
+            "ducting_cells": [int(n) for n in fields["ducting"].sum(axis=(1, 2))],
+        }, f)
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp, target)
+    return target
+
+
+def load_day(day_str):
+    """Métadonnées et rasters d'un jour (en mémoire-mappée), ou None s'il n'est pas calculé."""
+    target = day_dir(day_str)
+    meta_path = os.path.join(target, "meta.json")
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, "r") as f:
+        meta = json.load(f)
+    for name in RASTERS + ("probability",):
+        meta[name] = np.load(os.path.join(target, f"{name}.npy"), mmap_mode="r")
+    return meta
+
+
+def overlay_index(day_str, url_prefix="/ducting"):
+    """Description servie à la carte : emprise et URL des images de chaque heure."""
+    meta_path = os.path.join(day_dir(day_str), "meta.json")
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, "r") as f:
+        meta = json.load(f)
+    return {
+        "date": day_str,
+        "bounds": meta["bounds"],
+        "hours": meta["hours"],
+        "ducting_cells": meta["ducting_cells"],
+        "overlays": {f"{hour:02d}": f"{url_prefix}/{day_str}/{hour:02d}.png" for hour in meta["hours"]},
+        "probability": f"{url_prefix}/{day_str}/probability.png",
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build ERA5 ducting map rasters and overlays")
+    parser.add_argument("dates", nargs="*", help="Days to build (YYYY-MM-DD), default: every downloaded day")
+    parser.add_argument("--force", action="store_true", help="Rebuild even if the GRIB file did not change")
+    args = parser.parse_args()
+
+    days = args.dates or sorted(os.path.basename(f)[5:15] for f in os.listdir(GRIB_DIR)
+                                if f.startswith("era5_") and f.endswith(".grib") and len(f) == 20)
+    for day_str in days:
+        grib_file = os.path.join(GRIB_DIR, f"era5_{day_str}.grib")
+        if not os.path.exists(grib_file):
+            print(f"[SKIP] No GRIB file for {day_str}")
+            continue
+        try:
+            print(f"[OK] Ducting map: {build_day(grib_file, day_str, force=args.force)}")
+        except Exception as e:
+            print(f"[ERROR] Ducting map {day_str}: {e}")
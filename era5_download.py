@@ -0,0 +1,221 @@
+import os
+import json
+import time
+import hashlib
+from abc import ABC, abstractmethod
+from collections import defaultdict
+
+# Téléchargements ERA5 groupés : les jours manquants sont regroupés en une requête CDS
+# par mois, plusieurs requêtes attendent en même temps dans la file du CDS, et l'état
+# (identifiants de requête) est enregistré pour reprendre après un redémarrage au lieu
+# de tout resoumettre. Chaque fichier mensuel est ensuite découpé en era5_YYYY-MM-DD.grib.
+MAX_PARALLEL = int(os.environ.get("ERA5_CDS_PARALLEL", 3))
+POLL_SECONDS = 30
+STATE_FILE = "downloads.json"
+
+
+class CdsClient(ABC):
+    """
+    Ce que le planificateur attend du CDS. status() renvoie "queued", "running",
+    "completed" ou "failed" ; download() n'est appelé qu'une fois la requête terminée.
+    Un faux client local sert aux tests (tests/fake_cds.py).
+    """
+
+    @abstractmethod
+    def submit(self, dataset, request):
+        """Soumet la requête et renvoie son identifiant."""
+
+    @abstractmethod
+    def status(self, request_id):
+        """État de la requête."""
+
+    @abstractmethod
+    def download(self, request_id, target):
+        """Écrit le résultat de la requête dans `target`."""
+
+
+class CdsApiClient(CdsClient):
+    """Client réel (cdsapi >= 0.7 et clé du nouveau CDS dans ~/.cdsapirc)."""
+
+    STATUSES = {
+        "accepted": "queued",
+        "running": "running",
+        "successful": "completed",
+        "failed": "failed",
+        "rejected": "failed",
+        "dismissed": "failed",
+        "deleted": "failed",
+    }
+
+    def __init__(self):
+        import cdsapi
+        # cdsapi.Client renvoie un LegacyClient dont .client est le client ecmwf.datastores
+        self.client = cdsapi.Client(wait_until_complete=False).client
+
+    def submit(self, dataset, request):
+        return self.client.submit(dataset, request).request_id
+
+    def status(self, request_id):
+        return self.STATUSES.get(self.client.get_remote(request_id).status, "queued")
+
+    def download(self, request_id, target):
+        self.client.get_remote(request_id).download(target)
+
+
+def month_batches(days):
+    """{"YYYY-MM": [jours triés]} pour une liste de jours "YYYY-MM-DD"."""
+    batches = defaultdict(list)
+    for day in sorted(set(days)):
+        batches[day[:7]].append(day)
+    return dict(batches)
+
+
+def batch_id(days):
+    return f"{days[0][:7]}-{hashlib.sha1(','.join(days).encode()).hexdigest()[:8]}"
+
+
+def grib_messages(buffer):
+    """
+    Parcourt un fichier GRIB (édition 1 ou 2) sans le décoder : (jour de référence
+    "YYYY-MM-DD", début, fin) de chaque message, lus dans les en-têtes.
+    """
+    pos = buffer.find(b"GRIB")
+    while pos >= 0:
+        edition = buffer[pos + 7]
+        if edition == 1:
+            length = int.from_bytes(buffer[pos + 4:pos + 7], "big")
+            pds = pos + 8
+            year = (buffer[pds + 24] - 1) * 100 + buffer[pds + 12]
+            month, day = buffer[pds + 13], buffer[pds + 14]
+        elif edition == 2:
+            length = int.from_bytes(buffer[pos + 8:pos + 16], "big")
+            section1 = pos + 16
+            year = int.from_bytes(buffer[section1 + 12:section1 + 14], "big")
+            month, day = buffer[section1 + 14], buffer[section1 + 15]
+        else:
+            raise ValueError(f"Unsupported GRIB edition {edition} at byte {pos}")
+        yield f"{year:04d}-{month:02d}-{day:02d}", pos, pos + length
+        pos = buffer.find(b"GRIB", pos + length)
+
+
+def split_by_day(grib_file, grib_dir, days):
+    """
+    Découpe un GRIB multi-jours en era5_YYYY-MM-DD.grib (messages recopiés tels quels,
+    chaque fichier écrit sous un nom temporaire puis renommé). Renvoie les jours écrits.
+    """
+    with open(grib_file, "rb") as f:
+        buffer = f.read()
+    messages = defaultdict(list)
+    for day, start, end in grib_messages(buffer):
+        messages[day].append((start, end))
+
+    written = []
+    for day in days:
+        if not messages.get(day):
+            continue
+        target = os.path.join(grib_dir, f"era5_{day}.grib")
+        tmp = f"{target}.tmp-{os.getpid()}"
+        with open(tmp, "wb") as f:
+            for start, end in messages[day]:
+                f.write(buffer[start:end])
+        os.replace(tmp, target)
+        written.append(day)
+    return written
+
+
+class DownloadPlanner:
+    """
+    plan(days) regroupe les jours sans fichier en lots mensuels (en reprenant les lots
+    déjà soumis d'après le fichier d'état) ; step() soumet des lots jusqu'à `max_parallel`
+    requêtes en cours, interroge celles-ci, télécharge et découpe celles qui sont prêtes.
+    run(days) enchaîne les deux jusqu'à ce qu'il ne reste rien.
+    """
+
+    def __init__(self, client, dataset, request_for, grib_dir, max_parallel=MAX_PARALLEL,
+                 poll_seconds=POLL_SECONDS, state_file=None, log=print):
+        self.client = client
+        self.dataset = dataset
+        self.request_for = request_for
+        self.grib_dir = grib_dir
+        self.max_parallel = max(1, max_parallel)
+        self.poll_seconds = poll_seconds
+        self.state_file = state_file or os.path.join(grib_dir, STATE_FILE)
+        self.log = log
+        self.batches = self._load_state()
+
+    def _load_state(self):
+        if not os.path.exists(self.state_file):
+            return {}
+        try:
+            with open(self.state_file, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            self.log(f"[WARN] Unreadable download state {self.state_file}: {e}")
+            return {}
+
+    def _save_state(self):
+        tmp = f"{self.state_file}.tmp-{os.getpid()}"
+        with open(tmp, "w") as f:
+            json.dump(self.batches, f, indent=1)
+        os.replace(tmp, self.state_file)
+
+    def day_file(self, day):
+        return os.path.join(self.grib_dir, f"era5_{day}.grib")
+
+    def plan(self, days):
+        """Ajoute au plan les jours sans fichier qui ne sont pas déjà dans un lot en cours."""
+        planned = {day for batch in self.batches.values() for day in batch["days"]}
+        missing = [day for day in days if not os.path.exists(self.day_file(day)) and day not in planned]
+        for month_days in month_batches(missing).values():
+            self.batches[batch_id(month_days)] = {"days": month_days, "request_id": None, "state": "pending"}
+        self._save_state()
+        return missing
+
+    def active(self):
+        return [key for key, batch in self.batches.items() if batch["state"] == "submitted"]
+
+    def step(self):
+        # Soumission dans la limite des requêtes simultanées
+        for key, batch in self.batches.items():
+            if len(self.active()) >= self.max_parallel:
+                break
+            if batch["state"] == "pending":
+                batch["request_id"] = self.client.submit(self.dataset, self.request_for(batch["days"]))
+                batch["state"] = "submitted"
+                self._save_state()
+                self.log(f"[DL] Submitted ERA5 request {batch['request_id']} for {len(batch['days'])} day(s) of {key[:7]}")
+
+        for key in self.active():
+            batch = self.batches[key]
+            status = self.client.status(batch["request_id"])
+            if status == "failed":
+                # Lot abandonné : ses jours seront replanifiés au prochain lancement
+                self.log(f"[ERROR] ERA5 request {batch['request_id']} failed ({key})")
+                del self.batches[key]
+                self._save_state()
+            elif status == "completed":
+                target = os.path.join(self.grib_dir, f"era5_batch_{key}.grib")
+                self.client.download(batch["request_id"], target + ".part")
+                os.replace(target + ".part", target)
+                batch["state"] = "downloaded"
+                self._save_state()
+
+        for key, batch in list(self.batches.items()):
+            if batch["state"] == "downloaded":
+                target = os.path.join(self.grib_dir, f"era5_batch_{key}.grib")
+                if not os.path.exists(target):
+                    batch["state"] = "pending"
+                    continue
+                written = split_by_day(target, self.grib_dir, batch["days"])
+                os.remove(target)
+                del self.batches[key]
+                self._save_state()
+                self.log(f"[OK] ERA5 {key[:7]}: {len(written)}/{len(batch['days'])} day file(s) written")
+        return bool(self.batches)
+
+    def run(self, days):
+        self.plan(days)
+        while self.step():
+            if self.active():
+                time.sleep(self.poll_seconds)
+        return [day for day in days if os.path.exists(self.day_file(day))]
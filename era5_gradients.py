@@ -1,27 +1,52 @@
 import os
 import glob
 import sys
+import json
+import shutil
+import hashlib
 import pygrib
-import cdsapi
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.offsetbox import AnchoredText
+from matplotlib.collections import LineCollection
+from matplotlib.colors import LogNorm
 from datetime import datetime
 import pandas as pd
 from math import radians, cos, sin, sqrt, atan2, degrees
 from configs.config_coords import END_DEVICE_LAT, END_DEVICE_LON
+from measurement_store import load_measurements
+from render_pool import RenderPool, make_job
+from era5_download import DownloadPlanner, CdsApiClient, MAX_PARALLEL
 
 # ==== CONFIG ====
 CSV_LINKS = "/app/output/data/helium_gateway_data.csv"
 GRIB_DIR = "/app/output/era5/grib"
 PLOT_DIR = "/app/output/era5/plots"
+# GRIB déjà décodés : un dossier par jour avec des tableaux .npy lus en mémoire-mappée
+CUBE_DIR = "/app/output/era5/cubes"
 os.makedirs(GRIB_DIR, exist_ok=True)
 os.makedirs(PLOT_DIR, exist_ok=True)
+os.makedirs(CUBE_DIR, exist_ok=True)
 
 delta = 5  # rayon en degré autour du end-node
 ERA5_AREA = [END_DEVICE_LAT + delta, END_DEVICE_LON - delta , END_DEVICE_LAT - delta, END_DEVICE_LON + delta]     # [N, W, S, E] (zone utile)
 ERA5_PRESSURE_LEVELS = [1000, 950, 900, 850, 800, 750, 700]  # en hPa
 ERA5_VARIABLES = ['geopotential', 'temperature', 'relative_humidity']
+ERA5_TIMES = [f"{hour:02d}:00" for hour in range(0, 24, 2)]  # Une heure sur deux
+ERA5_DATASET = 'reanalysis-era5-pressure-levels'
+
+DUCTING_THRESHOLD = -157  # N/km
+
+# Graphe journalier : "lines" (une courbe par profil), "density" (histogramme 2D
+# gradient / hauteur) ou "auto" (densité au-delà de DENSITY_MIN_PROFILES profils)
+PLOT_MODE = os.environ.get("ERA5_PLOT_MODE", "auto")
+DENSITY_MIN_PROFILES = 20000
+DENSITY_SAMPLES = 20
+
+# Graphes on-demand adressés par contenu (ondemand_<empreinte>.png) : incrémenter la
+# version quand le dessin change, les anciens fichiers sortent alors par l'éviction LRU
+ONDEMAND_RENDER_VERSION = 1
+ONDEMAND_CACHE_MAX_BYTES = int(os.environ.get("ERA5_ONDEMAND_CACHE_MB", 200)) * 1024 * 1024
 
 CDSAPI_RC_PATH = os.path.expanduser("~/.cdsapirc")
 
@@ -52,19 +77,46 @@ key: {cds_key}"""
     else:
         print(f"[INFO] Config file CDS API found: {CDSAPI_RC_PATH}")
 
-# Appel de la fonction de configuration avant tout
-setup_cdsapi_config()
+def ondemand_key(grib_file, cells, time_index, labels):
+    """
+    Empreinte d'un graphe on-demand : GRIB (taille, date de modification), points de
+    grille lus, pas de temps, version du rendu et textes affichés (gateway, coordonnées).
+    """
+    content = json.dumps([_grib_signature(grib_file), cells, int(time_index), ONDEMAND_RENDER_VERSION, labels])
+    return hashlib.sha1(content.encode()).hexdigest()[:20]
 
-# Supprimer les anciens graphes créés pour libérer de la place
-for file_path in glob.glob(os.path.join(PLOT_DIR, "*ondemand*.png")):
-    try:
-        os.remove(file_path)
-        print(f"Deleted : {file_path}")
-    except OSError as e:
-        print(f"Error deleting {file_path} : {e}")
 
+def ondemand_plot_file(key):
+    return os.path.join(PLOT_DIR, f"ondemand_{key}.png")
 
 
+def evict_ondemand_plots(max_bytes=None):
+    """
+    Limite la place des graphes on-demand : supprime les moins récemment servis (date
+    d'accès, mise à jour à chaque hit) jusqu'à repasser sous `max_bytes`.
+    """
+    max_bytes = ONDEMAND_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    plots = []
+    for file_path in glob.glob(os.path.join(PLOT_DIR, "ondemand_*.png")):
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            continue
+        plots.append((stat.st_atime, stat.st_size, file_path))
+
+    total = sum(size for _, size, _ in plots)
+    removed = 0
+    for _, size, file_path in sorted(plots):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(file_path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+        total -= size
+    return removed
+
 
 def spherical_midpoint(lat1, lon1):
     # Convert to radians
@@ -84,167 +136,345 @@ def spherical_midpoint(lat1, lon1):
     # Convert back to degrees
     return degrees(lat3), degrees(lon3)
 
-def download_era5_for_day(day_str):
-    """Télécharge ERA5 pour un jour donné si non déjà présent."""
-    target_file = os.path.join(GRIB_DIR, f"era5_{day_str}.grib")
-    if os.path.exists(target_file):
-        print(f"[SKIP] ERA5 already downloaded {day_str}")
-        return target_file
-
-    print(f"[DL] Downloading ERA5 file for {day_str}...")
-    c = cdsapi.Client()
-    c.retrieve(
-        'reanalysis-era5-pressure-levels',
-        {
-            'product_type': ['reanalysis'],
-            'variable': ERA5_VARIABLES,
-            'year': day_str[:4],
-            'month': day_str[5:7],
-            'day': day_str[8:10],
-            'time': [ # Une heure sur deux
-                "00:00", "02:00", "04:00",
-                "06:00", "08:00", "10:00",
-                "12:00", "14:00", "16:00",
-                "18:00", "20:00", "22:00"
-            ],
-            'data_format': 'grib',
-            'pressure_level': ERA5_PRESSURE_LEVELS,
-            'area': ERA5_AREA
-        },
-        target_file
-    )
-    print(f"[OK] Saved file : {target_file}")
-    return target_file
-
-def compute_real_heights(temp, rh, pressure_levels):
-    """Calcule les hauteurs géopotentielles réelles."""
+def era5_request(days):
+    """Requête CDS pour une liste de jours d'un même mois."""
+    return {
+        'product_type': ['reanalysis'],
+        'variable': ERA5_VARIABLES,
+        'year': days[0][:4],
+        'month': days[0][5:7],
+        'day': [day[8:10] for day in days],
+        'time': ERA5_TIMES,
+        'data_format': 'grib',
+        'pressure_level': ERA5_PRESSURE_LEVELS,
+        'area': ERA5_AREA
+    }
+
+def download_era5_days(days, client=None, max_parallel=MAX_PARALLEL):
+    """
+    Télécharge tous les jours manquants par lots mensuels (voir era5_download.py) et
+    renvoie les jours dont le fichier GRIB est disponible.
+    """
+    planner = DownloadPlanner(client or CdsApiClient(), ERA5_DATASET, era5_request, GRIB_DIR,
+                              max_parallel=max_parallel)
+    return planner.run(days)
+
+def _level_shape(pressure_levels, ndim, axis):
+    """Pressions (Pa) mises en forme pour être diffusées le long de l'axe des niveaux."""
+    shape = [1] * ndim
+    shape[axis] = -1
+    return (np.asarray(pressure_levels, dtype=float) * 100).reshape(shape)
+
+
+def vapour_pressure(temp, rh):
+    """Pression de vapeur (hPa) depuis la température (K) et l'humidité relative (%)."""
+    return rh / 100.0 * 6.112 * np.exp(17.67 * (temp - 273.15) / (temp - 273.15 + 243.5))
+
+
+def compute_real_heights(temp, rh, pressure_levels, axis=0):
+    """
+    Calcule les hauteurs géopotentielles réelles (relatives au premier niveau) le long
+    de l'axe `axis` des niveaux ; temp et rh peuvent être des cubes (temps, niveau, lat, lon).
+    """
     # Conversion en numpy arrays
-    temp = np.asarray(temp)
-    rh = np.asarray(rh)
-    pressure_levels = np.asarray(pressure_levels) * 100  # Convert hPa to Pa
-    
-    # Calcul de la pression de vapeur saturante (Pa)
-    e_s = 6.112 * np.exp(17.67 * (temp - 273.15) / (temp - 273.15 + 243.5)) * 100
-    e = (rh / 100.0) * e_s
-    
-    # Rapport de mélange (kg/kg)
-    q = (0.622 * e) / (pressure_levels - e)
-    
+    temp = np.asarray(temp, dtype=float)
+    rh = np.asarray(rh, dtype=float)
+    pressure = _level_shape(pressure_levels, temp.ndim, axis)
+
+    # Pression de vapeur (Pa) puis rapport de mélange (kg/kg)
+    e = vapour_pressure(temp, rh) * 100
+    q = (0.622 * e) / (pressure - e)
+
     # Température virtuelle (K)
-    T_v = temp * (1 + 0.61 * q)
-    
-    # Calcul des hauteurs (m)
-    z = np.zeros_like(temp)
-    for i in range(1, len(temp)):
-        delta_z = (287.05 * (T_v[i-1] + T_v[i]) / 2 / 9.80665 * 
-                 np.log(pressure_levels[i-1] / pressure_levels[i]))
-        z[i] = z[i-1] + delta_z
-    
-    return z
+    T_v = np.moveaxis(temp * (1 + 0.61 * q), axis, 0)
+    p = np.moveaxis(pressure, axis, 0)
+
+    # Épaisseur hypsométrique de chaque couche, puis cumul depuis le niveau le plus bas
+    delta_z = 287.05 * (T_v[:-1] + T_v[1:]) / 2 / 9.80665 * np.log(p[:-1] / p[1:])
+    z = np.concatenate([np.zeros_like(T_v[:1]), np.cumsum(delta_z, axis=0)])
+    return np.moveaxis(z, 0, axis)
+
+
+def gradient_along(values, coords, axis=0):
+    """
+    np.gradient avec des coordonnées différentes pour chaque colonne (différences
+    centrées d'ordre 2 à l'intérieur, d'ordre 1 aux bords, comme np.gradient).
+    """
+    f = np.moveaxis(values, axis, 0)
+    x = np.moveaxis(coords, axis, 0)
+    out = np.empty_like(f, dtype=float)
+
+    hd = x[1:-1] - x[:-2]
+    hs = x[2:] - x[1:-1]
+    out[1:-1] = (hd**2 * f[2:] - hs**2 * f[:-2] + (hs**2 - hd**2) * f[1:-1]) / (hs * hd * (hs + hd))
+    out[0] = (f[1] - f[0]) / (x[1] - x[0])
+    out[-1] = (f[-1] - f[-2]) / (x[-1] - x[-2])
+    return np.moveaxis(out, 0, axis)
+
+
+def compute_refractivity(temp, rh, pressure_levels, axis=0):
+    """Indice de réfractivité N."""
+    pressure_hpa = _level_shape(pressure_levels, np.ndim(temp), axis) / 100
+    return 77.6 * (pressure_hpa / temp) + 3.73e5 * (vapour_pressure(temp, rh) / temp**2)
+
+
+def compute_gradient_profile(temp, rh, pressure_levels, axis=0):
+    """Calcule les gradients de réfractivité atmosphérique (N/km) le long de l'axe des niveaux."""
+    temp = np.asarray(temp, dtype=float)
+    rh = np.asarray(rh, dtype=float)
 
-def compute_gradient_profile(temp, rh, pressure_levels):
-    """Calcule les gradients de réfractivité atmosphérique."""
-    # Pression de vapeur (hPa)
-    e = rh / 100.0 * 6.112 * np.exp(17.67 * (temp - 273.15) / (temp - 273.15 + 243.5))
-    
     # Indice de réfractivité
-    N = 77.6 * (pressure_levels / temp) + 3.73e5 * (e / temp**2)
-    
+    N = compute_refractivity(temp, rh, pressure_levels, axis)
+
     # Hauteurs et gradients
-    heights = compute_real_heights(temp, rh, pressure_levels)
-    gradients = np.gradient(N, heights) * 1000 # Pour avoir du N/km et non N/m
-    
+    heights = compute_real_heights(temp, rh, pressure_levels, axis)
+    gradients = gradient_along(N, heights, axis) * 1000 # Pour avoir du N/km et non N/m
+
     return heights, gradients
 
+
+def read_grib_cube(grib_file):
+    """
+    Cubes (temps, niveau, lat, lon) de température et d'humidité pour tous les pas de
+    temps du fichier, niveaux du plus bas (1000 hPa) au plus haut.
+    """
+    grbs = pygrib.open(grib_file)
+    try:
+        fields = {}
+        lats = lons = None
+        for msg in grbs:
+            if msg['shortName'] in ('t', 'r'):
+                fields[(msg['dataDate'], msg['dataTime'], msg['level'], msg['shortName'])] = msg.values
+                if lats is None:
+                    lats, lons = msg.latlons()
+    finally:
+        grbs.close()
+
+    levels = sorted(ERA5_PRESSURE_LEVELS, reverse=True)
+    # Seuls les pas de temps complets (toutes les variables à tous les niveaux) sont gardés
+    times = sorted(time for time in {key[:2] for key in fields}
+                   if all((*time, level, name) in fields for level in levels for name in ('t', 'r')))
+    if not times:
+        raise ValueError(f"No complete timestep in {grib_file}")
+
+    def stack(name):
+        return np.array([[np.asarray(fields[(*time, level, name)], dtype=float) for level in levels]
+                         for time in times])
+
+    return {
+        "times": np.array([data_time for _, data_time in times]),
+        "levels": np.array(levels),
+        "temp": stack('t'),
+        "rh": stack('r'),
+        "lats": lats,
+        "lons": lons,
+    }
+
+
+CUBE_ARRAYS = ("temp", "rh", "lats", "lons")
+
+# Cubes déjà ouverts par ce processus (fichier GRIB -> (signature, cube)) : un
+# processus qui reste vivant (service on-demand du webhook) ne relit pas meta.json
+_open_cubes = {}
+OPEN_CUBES_MAX = 16
+
+
+def cube_dir(grib_file):
+    name = os.path.splitext(os.path.basename(grib_file))[0]
+    return os.path.join(CUBE_DIR, name)
+
+
+def _grib_signature(grib_file):
+    stat = os.stat(grib_file)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def convert_grib(grib_file):
+    """
+    Décode une seule fois le GRIB en tableaux float32 (temps, niveau, lat, lon) + métadonnées,
+    écrits dans un dossier temporaire puis renommé.
+    """
+    cube = read_grib_cube(grib_file)
+    target = cube_dir(grib_file)
+    tmp = f"{target}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for name in CUBE_ARRAYS:
+        np.save(os.path.join(tmp, f"{name}.npy"), np.asarray(cube[name], dtype=np.float32))
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump({
+            "grib": os.path.basename(grib_file),
+            "signature": _grib_signature(grib_file),
+            "times": cube["times"].tolist(),
+            "levels": cube["levels"].tolist(),
+            "shape": list(cube["temp"].shape),
+            "axes": ["time", "level", "lat", "lon"],
+        }, f)
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp, target)
+    return target
+
+
+def load_cube(grib_file):
+    """
+    Cube du jour en mémoire-mappée, converti depuis le GRIB au premier accès ou si le
+    GRIB a changé. Les lectures suivantes ne décodent plus de GRIB.
+    """
+    signature = _grib_signature(grib_file) if os.path.exists(grib_file) else None
+    opened = _open_cubes.get(grib_file)
+    if opened is not None and opened[0] == signature:
+        return opened[1]
+
+    target = cube_dir(grib_file)
+    meta_path = os.path.join(target, "meta.json")
+    meta = None
+    if os.path.exists(meta_path):
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+        if signature is not None and meta["signature"] != signature:
+            meta = None
+    if meta is None:
+        if not os.path.exists(grib_file):
+            raise FileNotFoundError(f"GRIB file not found: {grib_file}")
+        convert_grib(grib_file)
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+
+    cube = {name: np.load(os.path.join(target, f"{name}.npy"), mmap_mode="r") for name in CUBE_ARRAYS}
+    cube["times"] = np.array(meta["times"])
+    cube["levels"] = np.array(meta["levels"])
+    _open_cubes.pop(grib_file, None)
+    if len(_open_cubes) >= OPEN_CUBES_MAX:
+        _open_cubes.pop(next(iter(_open_cubes)))
+    _open_cubes[grib_file] = (signature, cube)
+    return cube
+
+
+def grid_index(cube, lat, lon):
+    """Point de grille le plus proche (grille régulière : recherche sur les deux axes seulement)."""
+    i = int(np.abs(cube["lats"][:, 0] - lat).argmin())
+    j = int(np.abs(cube["lons"][0, :] - lon).argmin())
+    return i, j
+
+
+def extract_profile(cube, lat, lon, time_index):
+    """Profils T et RH (du niveau le plus bas au plus haut) d'un point : une simple tranche du cube."""
+    i, j = grid_index(cube, lat, lon)
+    temp = np.asarray(cube["temp"][time_index, :, i, j], dtype=float)
+    rh = np.asarray(cube["rh"][time_index, :, i, j], dtype=float)
+    if np.isnan(temp).any() or np.isnan(rh).any():
+        raise ValueError(f"Missing data for some pressure levels at {lat:.2f},{lon:.2f}")
+    return temp, rh
+
+
+def compute_cube(cube):
+    """Hauteurs, N, dN/dh et masque de ducting pour toutes les colonnes du cube en une fois."""
+    heights, gradients = compute_gradient_profile(cube["temp"], cube["rh"], cube["levels"], axis=1)
+    return {
+        "heights": heights,
+        "refractivity": compute_refractivity(cube["temp"], cube["rh"], cube["levels"], axis=1),
+        "gradients": gradients,
+        "ducting": np.any(gradients < DUCTING_THRESHOLD, axis=1),
+    }
+
+
+def day_profiles(grib_file, stride=2):
+    """
+    Profils de gradient de tous les pas de temps (un point de grille sur `stride`)
+    d'un fichier GRIB journalier, en tableaux simples (profils, niveaux).
+    """
+    cube = load_cube(grib_file)
+    result = compute_cube(cube)
+
+    def columns(values):
+        # (temps, niveau, lat, lon) -> (temps * lat * lon, niveau)
+        values = values[:, :, ::stride, ::stride]
+        return np.moveaxis(values, 1, -1).reshape(-1, values.shape[1])
+
+    lats = np.round(cube["lats"][::stride, ::stride], 2)
+    lons = np.round(cube["lons"][::stride, ::stride], 2)
+    coords = list(zip(lats.ravel().tolist(), lons.ravel().tolist())) * len(cube["times"])
+    return columns(result["heights"]), columns(result["gradients"]), coords
+
+
 def process_day(grib_file, day_str):
-    """Produit le graphe global pour un jour."""
+    """Job de rendu du graphe global d'un jour (None si déjà tracé ou en cas d'erreur)."""
     path = os.path.join(PLOT_DIR, f'gradient_{day_str}.png')
     if os.path.exists(path):
-        return path
+        return None
     try:
-        grbs = pygrib.open(grib_file)
-        
-        # Extraire tous les messages
-        messages = grbs.select()
-        
-        # Organiser les données par niveau et variable
-        data = {}
-        for msg in messages:
-            level = msg['level']
-            if level not in data:
-                data[level] = {}
-            data[level][msg['shortName']] = msg
-        
-        # Récupérer les coordonnées (on prend celles du premier message)
-        lats, lons = messages[0].latlons()
-        
-        # Créer le graphique
-        plt.figure(figsize=(12, 6))
-
-        has_ducting = False
-        has_noducting = False
-        ducting_coords = []
-        
-        # Pour chaque point de grille
-        for i in range(0, lats.shape[0], 2):  # Pas de 2 pour réduire le nombre
-            for j in range(0, lats.shape[1], 2):
-                # Extraire les profils verticaux
-                temp_profile = []
-                rh_profile = []
-                
-                for level in sorted(ERA5_PRESSURE_LEVELS, reverse=True):
-                    if level in data:
-                        temp_profile.append(data[level]['t'].values[i,j])
-                        rh_profile.append(data[level]['r'].values[i,j])
-                
-                if len(temp_profile) == len(ERA5_PRESSURE_LEVELS):
-                    heights, gradients = compute_gradient_profile(
-                        np.array(temp_profile),
-                        np.array(rh_profile),
-                        ERA5_PRESSURE_LEVELS
-                    )
-
-                    if np.any(gradients < -157):
-                        plt.plot(gradients, heights, color='red', alpha=0.7, linewidth=0.7,
-                                 label='Ducting' if not has_ducting else "")
-                        has_ducting = True
-                        lat = round(float(lats[i, j]), 2)
-                        lon = round(float(lons[i, j]), 2)
-                        ducting_coords.append(f"{lat}, {lon}")
-                    else:
-                        plt.plot(gradients, heights, color='gray', alpha=0.3, linewidth=0.7,
-                                 label='No Ducting' if not has_noducting else "")
-                        has_noducting = True
-        
-        plt.axvline(x=-157, color='red', linestyle='--', label='Ducting threshold -157 N/km')
-        plt.xlabel('Refractivity gradient (N/km)')
-        plt.ylabel('Height (m)')
-        plt.title(f"Refractivity gradients of all coordinates for each hour of the day {day_str}")
-        plt.legend()
-        plt.grid(True)
-        
-        # Encadré des profils ducting
-        if ducting_coords:
-            coord_text = "\n".join(ducting_coords[:10])  # max 10 pour lisibilité
-            if len(ducting_coords) > 10:
-                coord_text += f"\n... (+{len(ducting_coords) - 10} more)"
-            anchored_text = AnchoredText(f"Profiles with ducting at:\n{coord_text}",
-                                         loc='upper right', prop={'size': 8}, frameon=True)
-            plt.gca().add_artist(anchored_text)
-        
-        plot_file = os.path.join(PLOT_DIR, f'gradient_{day_str}.png')
-        plt.savefig(plot_file, dpi=150, bbox_inches='tight')
-        plt.close()
-        grbs.close()
-        
-        print(f"[OK] Saved graph: {plot_file}")
-        return plot_file
-        
+        heights, gradients, coords = day_profiles(grib_file)
     except Exception as e:
         print(f"[ERROR] Processing {grib_file}: {str(e)}")
-        if 'grbs' in locals():
-            grbs.close()
         return None
+    return make_job("era5_gradients:draw_day", path, day_str=day_str,
+                    heights=heights, gradients=gradients, coords=coords)
+
+
+def draw_day(plot_file, day_str, heights, gradients, coords, mode=PLOT_MODE):
+    """Produit le graphe global pour un jour (courbes ou densité selon `mode`)."""
+    heights = np.asarray(heights, dtype=float).reshape(-1, len(ERA5_PRESSURE_LEVELS))
+    gradients = np.asarray(gradients, dtype=float).reshape(heights.shape)
+    ducting = np.any(gradients < DUCTING_THRESHOLD, axis=1)
+    if mode == "auto":
+        mode = "density" if len(heights) > DENSITY_MIN_PROFILES else "lines"
+
+    fig, ax = plt.subplots(figsize=(12, 6))
+    if mode == "density":
+        draw_density(ax, fig, heights, gradients)
+    else:
+        draw_lines(ax, heights, gradients, ducting)
+
+    ax.axvline(x=DUCTING_THRESHOLD, color='red', linestyle='--', label='Ducting threshold -157 N/km')
+    ax.set_xlabel('Refractivity gradient (N/km)')
+    ax.set_ylabel('Height (m)')
+    ax.set_title(f"Refractivity gradients of all coordinates for each hour of the day {day_str}")
+    ax.legend(loc='lower left' if mode == "density" else 'best')
+    ax.grid(True)
+
+    # Encadré des profils ducting
+    # Un même point peut être en ducting à plusieurs heures : listé une seule fois
+    ducting_coords = list(dict.fromkeys(f"{lat}, {lon}" for (lat, lon), duct in zip(coords, ducting) if duct))
+    if ducting_coords:
+        coord_text = "\n".join(ducting_coords[:10])  # max 10 pour lisibilité
+        if len(ducting_coords) > 10:
+            coord_text += f"\n... (+{len(ducting_coords) - 10} more)"
+        anchored_text = AnchoredText(f"Profiles with ducting at:\n{coord_text}",
+                                     loc='upper right', prop={'size': 8}, frameon=True)
+        ax.add_artist(anchored_text)
+
+    fig.savefig(plot_file, dpi=150, bbox_inches='tight')
+    plt.close(fig)
+
+
+def draw_lines(ax, heights, gradients, ducting):
+    """Tous les profils en deux LineCollection (ducting / sans ducting) au lieu d'un plt.plot par profil."""
+    segments = np.stack([gradients, heights], axis=-1)
+    if (~ducting).any():
+        ax.add_collection(LineCollection(segments[~ducting], colors='gray', alpha=0.3, linewidths=0.7,
+                                         label='No Ducting'))
+    if ducting.any():
+        ax.add_collection(LineCollection(segments[ducting], colors='red', alpha=0.7, linewidths=0.7,
+                                         label='Ducting'))
+    ax.autoscale_view()
+
+
+def draw_density(ax, fig, heights, gradients, samples=DENSITY_SAMPLES, bins=(200, 120)):
+    """
+    Histogramme 2D gradient / hauteur pour les très grandes zones : chaque segment
+    de profil est échantillonné `samples` fois pour que la densité suive les courbes.
+    """
+    t = np.linspace(0.0, 1.0, samples, endpoint=False)[None, None, :]
+    x = gradients[:, :-1, None] + t * (gradients[:, 1:, None] - gradients[:, :-1, None])
+    y = heights[:, :-1, None] + t * (heights[:, 1:, None] - heights[:, :-1, None])
+    x, y = x.ravel(), y.ravel()
+    valid = np.isfinite(x) & np.isfinite(y)
+
+    counts, x_edges, y_edges = np.histogram2d(x[valid], y[valid], bins=bins)
+    counts = np.ma.masked_equal(counts.T, 0)
+    mesh = ax.pcolormesh(x_edges, y_edges, counts, cmap='viridis', norm=LogNorm())
+    fig.colorbar(mesh, ax=ax, label=f'Profile samples ({len(heights)} profiles)')
+
 
 def on_demand(gateway_name, lat, lon, date_str, time_str):
     """Génère un graphique on-demand double (gateway + midpoint)."""
@@ -253,41 +483,31 @@ def on_demand(gateway_name, lat, lon, date_str, time_str):
         if not os.path.exists(grib_file):
             raise FileNotFoundError(f"GRIB file not found: {grib_file}")
         
-        grbs = pygrib.open(grib_file)
-        
-        # Trouver l'heure la plus proche
+        cube = load_cube(grib_file)
+
+        # Trouver l'heure la plus proche parmi celles du fichier (HHMM, une heure sur deux)
         hour = int(time_str.split(':')[0])
-        closest_hour = min(range(0, 24, 2), key=lambda h: abs(h - hour))
-        closest_time = closest_hour * 100  # format ERA5 dans pygrib
-
-        # Filtrer
-        temp_msgs = grbs.select(shortName='t', dataTime=closest_time)
-        rh_msgs = grbs.select(shortName='r', dataTime=closest_time)
-        lats, lons = temp_msgs[0].latlons()
-
-        def extract_profile(lat_, lon_):
-            """Sous-fonction pour extraire un profil pour une coordonnée."""
-            dist = (lats - lat_)**2 + (lons - lon_)**2
-            i, j = np.unravel_index(dist.argmin(), dist.shape)
-            temp_profile, rh_profile = [], []
-            for level in sorted(ERA5_PRESSURE_LEVELS, reverse=True):
-                t_msg = next((m for m in temp_msgs if m['level'] == level), None)
-                rh_msg = next((m for m in rh_msgs if m['level'] == level), None)
-                if t_msg and rh_msg:
-                    temp_profile.append(t_msg.values[i, j])
-                    rh_profile.append(rh_msg.values[i, j])
-            if len(temp_profile) != len(ERA5_PRESSURE_LEVELS):
-                raise ValueError(f"Missing data for some pressure levels at {lat_:.2f},{lon_:.2f}")
-            return np.array(temp_profile), np.array(rh_profile)
+        time_index = int(np.abs(cube["times"] - hour * 100).argmin())
+        closest_hour = int(cube["times"][time_index]) // 100
+
+        # Graphe déjà rendu pour les mêmes données : simple fichier statique
+        lat_mid, lon_mid = spherical_midpoint(lat, lon)
+        cells = [grid_index(cube, lat, lon), grid_index(cube, lat_mid, lon_mid)]
+        labels = [gateway_name, date_str, f"{lat:.2f}", f"{lon:.2f}", f"{lat_mid:.2f}", f"{lon_mid:.2f}"]
+        plot_file = ondemand_plot_file(ondemand_key(grib_file, cells, time_index, labels))
+        if os.path.exists(plot_file):
+            # Date d'accès seule : elle ordonne l'éviction, Last-Modified ne change pas
+            os.utime(plot_file, (datetime.now().timestamp(), os.stat(plot_file).st_mtime))
+            print(f"[OK] Cached on-demand graph: {plot_file}")
+            return plot_file
 
         # --- Gateway ---
-        temp_gw, rh_gw = extract_profile(lat, lon)
-        heights_gw, gradients_gw = compute_gradient_profile(temp_gw, rh_gw, ERA5_PRESSURE_LEVELS)
+        temp_gw, rh_gw = extract_profile(cube, lat, lon, time_index)
+        heights_gw, gradients_gw = compute_gradient_profile(temp_gw, rh_gw, cube["levels"])
 
         # --- Point milieu sphérique ---
-        lat_mid, lon_mid = spherical_midpoint(lat, lon)
-        temp_mid, rh_mid = extract_profile(lat_mid, lon_mid)
-        heights_mid, gradients_mid = compute_gradient_profile(temp_mid, rh_mid, ERA5_PRESSURE_LEVELS)
+        temp_mid, rh_mid = extract_profile(cube, lat_mid, lon_mid, time_index)
+        heights_mid, gradients_mid = compute_gradient_profile(temp_mid, rh_mid, cube["levels"])
 
         # --- Affichage ---
         fig, axs = plt.subplots(1, 2, figsize=(12, 6), sharey=True)
@@ -312,24 +532,24 @@ def on_demand(gateway_name, lat, lon, date_str, time_str):
         fig.suptitle(f'ERA5 refractivity gradient - {gateway_name}\n{date_str} at {closest_hour}:00H', fontsize=14)
         plt.tight_layout(rect=[0, 0.03, 1, 0.95])
 
-        plot_file = os.path.join(
-            PLOT_DIR,
-            f'ondemand_{gateway_name}_{date_str}_{lat:.2f}_{lon:.2f}_vs_midpoint.png'
-        )
-        plt.savefig(plot_file, dpi=150, bbox_inches='tight')
+        tmp_file = f'{os.path.splitext(plot_file)[0]}.tmp-{os.getpid()}.png'
+        plt.savefig(tmp_file, dpi=150, bbox_inches='tight')
         plt.close()
-        grbs.close()
+        os.replace(tmp_file, plot_file)
+        evict_ondemand_plots()
 
         print(f"[OK] Saved on-demand graph: {plot_file}")
         return plot_file
 
     except Exception as e:
         print(f"[ERROR] On-demand processing failed: {str(e)}")
-        if 'grbs' in locals():
-            grbs.close()
         return None
 
 if __name__ == "__main__":
+    # Appel de la fonction de configuration avant tout
+    setup_cdsapi_config()
+    evict_ondemand_plots()
+
     if len(sys.argv) > 1 and sys.argv[1] == "--on-demand":
         if len(sys.argv) != 7:
             print("Usage: era5_gradients.py --on-demand gateway_name lat lon date hour")
@@ -347,16 +567,33 @@ if __name__ == "__main__":
         sys.exit(0 if result else 1)
     
     # Traitement normal pour tous les jours
-    df = pd.read_csv(CSV_LINKS)
-    df['date'] = pd.to_datetime(df['gwTime'], format='ISO8601')
+    df = load_measurements(columns=['gwTime'], csv_file=CSV_LINKS)
     today = datetime.utcnow().date()
-    days_needed = sorted(set(d.date().isoformat() for d in df['date']
-                        if (today - d.date()).days > 5))
+    days_needed = sorted(set(d for d in df['date'].unique()
+                        if (today - datetime.strptime(d, '%Y-%m-%d').date()).days > 5))
     
-    for day_str in days_needed:
-        download_era5_for_day(day_str)
+    # Jours manquants demandés au CDS par mois, plusieurs requêtes en parallèle
+    available = download_era5_days(days_needed)
+
+    # Carte de ducting (rasters + images par heure) de chaque jour, refaite si le GRIB change
+    import ducting_map
+
+    jobs = []
+    for day_str in available:
         grib_file = os.path.join(GRIB_DIR, f'era5_{day_str}.grib')
-        if os.path.exists(grib_file):
-            process_day(grib_file, day_str)
+        try:
+            ducting_map.build_day(grib_file, day_str)
+        except Exception as e:
+            print(f"[ERROR] Ducting map {day_str}: {e}")
+        job = process_day(grib_file, day_str)
+        if job:
+            jobs.append(job)
+
+    # Rendu des graphes journaliers en parallèle (RENDER_WORKERS processus au plus)
+    with RenderPool() as pool:
+        for plot_file, ok in sorted(pool.run(jobs).items()):
+            if ok:
+                print(f"[OK] Saved graph: {plot_file}")
+    print(f"[INFO] Rendering: {pool.stats()}")
 
     print("[FINISHED] Finished ERA5 computing !")
\ No newline at end of file
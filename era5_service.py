@@ -0,0 +1,141 @@
+import os
+import time
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, CancelledError
+
+# Graphes ERA5 on-demand générés dans le processus du webhook : un pool de processus
+# gardés chauds (matplotlib, pygrib et era5_gradients importés une fois, cubes du jour
+# déjà ouverts) remplace le lancement d'un `python3 era5_gradients.py --on-demand` par requête.
+ERA5_WORKERS = int(os.environ.get("ERA5_WORKERS", 2))
+ERA5_TIMEOUT = 300  # secondes, comme l'ancien subprocess
+MEMO_MAX_ENTRIES = 1024
+
+
+def _init_worker(dirs=None):
+    import matplotlib
+    matplotlib.use("Agg")
+    import era5_gradients
+    # Dossiers GRIB_DIR / PLOT_DIR / CUBE_DIR remplacés (benchmarks)
+    for name, path in (dirs or {}).items():
+        setattr(era5_gradients, name, path)
+
+
+def _ping():
+    return os.getpid()
+
+
+def _render(gateway_name, lat, lon, date_str, time_str):
+    import era5_gradients
+    return era5_gradients.on_demand(gateway_name, lat, lon, date_str, time_str)
+
+
+def request_key(gateway_name, lat, lon, date_str, time_str):
+    """Clé de mémoïsation : deux requêtes de même clé produisent le même graphe."""
+    return (str(gateway_name), round(float(lat), 5), round(float(lon), 5), str(date_str), int(str(time_str).split(':')[0]))
+
+
+class Era5OnDemand:
+    """
+    get() renvoie le chemin du graphe (ou None si la génération a échoué) :
+    - résultat déjà calculé et fichier toujours présent : renvoyé sans travail ;
+    - même requête déjà en cours : on attend le même Future (coalescence) ;
+    - sinon : soumise au pool.
+    Lève concurrent.futures.TimeoutError au-delà de `timeout` secondes. Après close()
+    (arrêt du worker), renvoie None sans redémarrer le pool.
+    """
+
+    def __init__(self, workers=None, timeout=ERA5_TIMEOUT, max_entries=MEMO_MAX_ENTRIES, dirs=None):
+        self.workers = max(1, workers or ERA5_WORKERS)
+        self.dirs = dirs
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self.executor = None
+        self.closed = False
+        # RLock : add_done_callback appelle _done immédiatement si le Future est déjà terminé
+        self.lock = threading.RLock()
+        self.results = OrderedDict()
+        self.inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.failures = 0
+        self.render_seconds = 0.0
+
+    def start(self):
+        """
+        Démarre le pool et attend que chaque processus ait fait ses imports. forkserver :
+        les processus ne sont pas forkés depuis le webhook et ses threads (file d'ingestion).
+        """
+        with self.lock:
+            if self.executor is not None or self.closed:
+                return self
+            context = multiprocessing.get_context("forkserver")
+            executor = self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                                           initializer=_init_worker, initargs=(self.dirs,))
+        for future in [executor.submit(_ping) for _ in range(self.workers)]:
+            future.result()
+        return self
+
+    def close(self):
+        with self.lock:
+            executor, self.executor = self.executor, None
+            self.closed = True
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def get(self, gateway_name, lat, lon, date_str, time_str):
+        key = request_key(gateway_name, lat, lon, date_str, time_str)
+        self.start()
+
+        with self.lock:
+            path = self.results.get(key)
+            if path is not None and os.path.exists(path):
+                self.hits += 1
+                self.results.move_to_end(key)
+                return path
+            future = self.inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+            else:
+                # Pool lu sous le verrou : close() a pu l'arrêter depuis start()
+                if self.executor is None:
+                    return None
+                self.misses += 1
+                future = self.executor.submit(_render, gateway_name, lat, lon, date_str, time_str)
+                future.started_at = time.perf_counter()
+                self.inflight[key] = future
+                future.add_done_callback(lambda f, key=key: self._done(key, f))
+
+        try:
+            return future.result(timeout=self.timeout)
+        except CancelledError:
+            return None  # annulé par close()
+
+    def _done(self, key, future):
+        with self.lock:
+            self.inflight.pop(key, None)
+            self.render_seconds += time.perf_counter() - future.started_at
+            path = None if future.cancelled() or future.exception() else future.result()
+            if path is None:
+                self.failures += 1
+                return
+            self.results[key] = path
+            self.results.move_to_end(key)
+            while len(self.results) > self.max_entries:
+                self.results.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            completed = self.misses - len(self.inflight)
+            return {
+                "workers": self.workers,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "failures": self.failures,
+                "inflight": len(self.inflight),
+                "memoized": len(self.results),
+                "avg_render_ms": round(1000 * self.render_seconds / completed, 1) if completed else 0.0,
+            }
@@ -0,0 +1,53 @@
+import os
+import fcntl
+import threading
+
+# Verrous partagés entre les workers du webhook (gunicorn lance plusieurs processus) :
+# flock sur un fichier .lock pour les autres processus, plus un RLock pour les threads
+# du processus courant (flock ne les distingue pas, ils partagent le même descripteur).
+LOCK_DIR = os.environ.get("WEBHOOK_LOCK_DIR", "/app/output/data/locks")
+
+
+class FileLock:
+    """
+    Verrou exclusif réentrant, utilisable comme threading.Lock (`with lock:`).
+    Le fichier est ouvert à la première acquisition, dans chaque processus (après le fork).
+    """
+
+    def __init__(self, name, lock_dir=None):
+        self.path = os.path.join(lock_dir or LOCK_DIR, f"{name}.lock")
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+        self._pid = None
+
+    def _file(self):
+        if self._fd is None or self._pid != os.getpid():
+            # Descripteur hérité d'un fork : le verrou du parent ne doit pas être partagé
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+            self._pid = os.getpid()
+        return self._fd
+
+    def acquire(self):
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            try:
+                fcntl.flock(self._file(), fcntl.LOCK_EX)
+            except BaseException:
+                self._thread_lock.release()
+                raise
+        self._depth += 1
+        return True
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._thread_lock.release()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc):
+        self.release()
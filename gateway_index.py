@@ -0,0 +1,180 @@
+import os
+import io
+import csv
+import math
+import threading
+
+
+def _clean(value):
+    """Remplace les valeurs manquantes du CSV ('N/A', 'NaN', vide) par None."""
+    if value is None:
+        return None
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, str) and value.strip() in ("", "N/A", "NaN", "nan"):
+        return None
+    return value
+
+
+def _number(value):
+    value = _clean(value)
+    if value is None or isinstance(value, (int, float)):
+        return value
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _round(value, digits):
+    value = _number(value)
+    return round(value, digits) if value is not None else None
+
+
+def row_date(gw_time):
+    """Date 'YYYY-MM-DD' d'un gwTime ISO8601, ou None si invalide."""
+    if not isinstance(gw_time, str) or len(gw_time) < 10:
+        return None
+    date = gw_time[:10]
+    if date[4] != "-" or date[7] != "-":
+        return None
+    return date
+
+
+class GatewayIndex:
+    """
+    Index en mémoire date -> gateway -> infos + mesures.
+    Chargé une seule fois depuis le CSV, puis mis à jour uniquement avec les
+    nouvelles lignes reçues (les réponses par date sont servies par date_shards.py).
+    Le CSV n'étant qu'allongé, sync() ne relit que la fin ajoutée depuis la dernière
+    lecture (lignes écrites par ce processus ou par les autres workers du webhook).
+    """
+
+    def __init__(self, csv_file):
+        self.csv_file = csv_file
+        self.data = {}
+        # Nombre de mesures par date : change à chaque ajout, sert de version du shard
+        self.counts = {}
+        self.lock = threading.RLock()
+        self._csv_stat = None
+        self._header = None
+        self._offset = 0
+
+    def _stat(self):
+        try:
+            st = os.stat(self.csv_file)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _read_tail(self):
+        """Ajoute les lignes complètes écrites après self._offset, retourne les dates touchées."""
+        try:
+            f = open(self.csv_file, "rb")
+        except FileNotFoundError:
+            self._csv_stat = None
+            return set()
+        with f:
+            st = os.fstat(f.fileno())
+            f.seek(self._offset)
+            chunk = f.read(st.st_size - self._offset)
+        self._csv_stat = (st.st_ino, st.st_mtime_ns, st.st_size)
+        # Une ligne en cours d'écriture (sans fin de ligne) sera lue au prochain sync()
+        end = chunk.rfind(b"\n") + 1
+        self._offset += end
+        reader = csv.reader(io.StringIO(chunk[:end].decode("utf-8"), newline=""))
+        if self._header is None:
+            self._header = next(reader, None)
+            if self._header is None:
+                return set()
+        return self.add_rows(dict(zip(self._header, values)) for values in reader)
+
+    def load(self):
+        """Construit l'index complet depuis le CSV (une seule fois au démarrage)."""
+        with self.lock:
+            self.data = {}
+            self.counts = {}
+            self._header = None
+            self._offset = 0
+            self._read_tail()
+        return self
+
+    def sync(self):
+        """
+        Lit les lignes ajoutées au CSV depuis la dernière lecture (rechargement complet
+        si le fichier a été remplacé ou tronqué). Retourne True si l'index a changé.
+        """
+        with self.lock:
+            stat = self._stat()
+            if stat == self._csv_stat:
+                return False
+            previous = self._csv_stat
+            if stat is None or previous is None or stat[0] != previous[0] or stat[2] < self._offset:
+                self.load()
+            else:
+                self._read_tail()
+            return True
+
+    def _add(self, row):
+        date = row_date(row.get("gwTime"))
+        gw_id = _clean(row.get("gatewayId"))
+        if date is None or gw_id is None:
+            return None
+
+        gateways = self.data.setdefault(date, {})
+        entry = gateways.get(gw_id)
+        if entry is None:
+            # Infos statiques : première ligne de la gateway pour ce jour
+            entry = gateways[gw_id] = {
+                "name": _clean(row.get("gateway_name")),
+                "lat": _round(row.get("gateway_lat"), 5),
+                "lon": _round(row.get("gateway_long"), 5),
+                "dist_km": _round(row.get("dist_km"), 2),
+                "visibility": _clean(row.get("visibility")),
+                "measurements": [],
+            }
+        self.counts[date] = self.counts.get(date, 0) + 1
+        entry["measurements"].append({
+            "gwTime": row.get("gwTime"),
+            "rssi": _number(row.get("rssi")),
+            "snr": _number(row.get("snr")),
+        })
+        return date
+
+    def add_rows(self, rows):
+        """Ajoute de nouvelles lignes (dicts au format du CSV), retourne les dates touchées."""
+        touched = set()
+        with self.lock:
+            for row in rows:
+                date = self._add(row)
+                if date is not None:
+                    touched.add(date)
+        return touched
+
+    def dates(self):
+        with self.lock:
+            return sorted(self.data)
+
+    def versions(self):
+        """{date: nombre de mesures}, pour savoir quels shards ont changé."""
+        with self.lock:
+            return dict(self.counts)
+
+    def get_date(self, date):
+        with self.lock:
+            return self.data.get(date)
+
+    def snapshot(self, dates=None):
+        """
+        Copie superficielle date -> gateway -> entrée, sûre à sérialiser hors du lock
+        (toutes les dates, ou seulement `dates`).
+        """
+        with self.lock:
+            dates = self.data if dates is None else [date for date in dates if date in self.data]
+            return {date: {gw_id: dict(entry, measurements=list(entry["measurements"]))
+                           for gw_id, entry in self.data[date].items()}
+                    for date in dates}
@@ -5,6 +5,7 @@ import json
 import html
 from datetime import datetime
 from configs.config_coords import END_DEVICE_LAT, END_DEVICE_LON
+from measurement_store import load_measurements
 
 # === Paramètres ===
 LOS_CSV = "/app/output/data/helium_gateway_data.csv"
@@ -27,7 +28,7 @@ def escape_js(s):
     return html.escape(s).replace("\n", "").replace("`", "\\`")
 
 # === Chargement des données ===
-df = pd.read_csv(LOS_CSV)
+df = load_measurements(csv_file=LOS_CSV)
 map_center = [END_DEVICE_LAT, END_DEVICE_LON]
 
 # === Chargement des liens IGRA ===
@@ -39,7 +40,6 @@ except FileNotFoundError:
     log(f"File {IGRA_LINKS_JSON} not found. No graph will be linked")
 
 # === Préparation des dates ===
-df['date'] = pd.to_datetime(df['gwTime'], format='ISO8601').dt.strftime('%Y-%m-%d')
 all_dates = sorted(df['date'].unique())
 
 
@@ -84,7 +84,7 @@ for date in all_dates:
 
 # === Affichage des gateways ===
 # Grouper toutes les mesures par gatewayId + date
-grouped = df.groupby(["gatewayId", "date"])
+grouped = df.groupby(["gatewayId", "date"], observed=True)
 
 for (gw_id, date), group in grouped:
     row = group.iloc[0]  # Pour l'emplacement et les infos statiques
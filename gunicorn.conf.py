@@ -0,0 +1,41 @@
+import os
+import multiprocessing
+
+# Mode production du webhook (main.py --production) : deux serveurs gunicorn sur la même
+# application, chacun avec ses propres workers.
+# - WEBHOOK_POOL=read   (port 5000) : carte et API de lecture, plus /helium-data pour
+#                                      garder une seule URL publique derrière le tunnel ;
+# - WEBHOOK_POOL=ingest (port 5001) : uniquement /helium-data et /api/ingest_stats, à
+#                                      viser par le webhook Helium pour que l'ingestion
+#                                      ne partage pas ses workers avec la carte.
+# Les écritures du CSV et de l'index passent par les verrous fcntl de file_lock.py.
+pool = os.environ.get("WEBHOOK_POOL", "read")
+
+bind = os.environ.get("WEBHOOK_BIND", "0.0.0.0:5001" if pool == "ingest" else "0.0.0.0:5000")
+worker_class = "gthread"
+workers = int(os.environ.get("WEBHOOK_WORKERS", 1 if pool == "ingest" else min(4, multiprocessing.cpu_count())))
+threads = int(os.environ.get("WEBHOOK_THREADS", 8 if pool == "ingest" else 4))
+# Temps laissé à chaque worker pour vider sa file d'ingestion (comme WEBHOOK_DRAIN_TIMEOUT)
+graceful_timeout = 30
+# Application importée une fois dans le maître, index en mémoire partagé par fork
+preload_app = True
+proc_name = f"webhook-{pool}"
+accesslog = None
+
+# Un processus ERA5 chaud par worker de lecture au lieu de deux
+os.environ.setdefault("ERA5_WORKERS", "1")
+
+
+def when_ready(server):
+    import webhook_server
+    webhook_server.prepare()
+
+
+def post_fork(server, worker):
+    import webhook_server
+    webhook_server.start_worker(pool)
+
+
+def worker_exit(server, worker):
+    import webhook_server
+    webhook_server.stop_worker()
@@ -0,0 +1,175 @@
+import datetime
+import numpy as np
+
+# Lecteur vectorisé des fichiers IGRA2 "derived" (format à colonnes fixes, voir
+# igra2-derived-format.txt) : tout le fichier est découpé en une seule passe NumPy
+# au lieu de faire int(line[16:23]) ligne par ligne.
+MISSING = -99999
+
+# Colonnes de l'en-tête (début, fin) en indices Python
+HEADER_FIELDS = {
+    "year": (13, 17),
+    "month": (18, 20),
+    "day": (21, 23),
+    "hour": (24, 26),
+    "numlev": (31, 36),
+}
+
+# Colonnes des niveaux : (début, fin, facteur d'échelle vers l'unité stockée)
+LEVEL_FIELDS = {
+    "pressure": (0, 7, 1),             # Pa
+    "reported_height": (8, 15, 1),     # m (REPGPH)
+    "height": (16, 23, 1),             # m (CALCGPH, utilisé pour les gradients)
+    "temperature": (24, 31, 0.1),      # K
+    "vapour_pressure": (72, 79, 0.001),  # hPa
+    "relative_humidity": (96, 103, 0.1),  # % (CALCRH)
+    "refractivity": (144, 151, 1),     # N
+}
+
+SOUNDING_DTYPE = np.dtype([
+    ("time", "datetime64[h]"),
+    ("hour", np.int8),          # 99 si l'heure nominale est manquante (time à 00h)
+    ("first", np.int64),        # indice du premier niveau dans levels
+    ("count", np.int32),
+])
+LEVEL_DTYPE = np.dtype([("sounding", np.int32)] + [(name, np.float32) for name in LEVEL_FIELDS])
+
+
+# Nombre de lignes décodées à la fois (borne la mémoire des matrices de caractères)
+CHUNK_LINES = 200000
+
+
+def _fixed_ints(buf, starts, ends, fields):
+    """
+    Entiers alignés à droite dans les colonnes [début, fin) de chaque ligne, pour
+    tous les champs à la fois : une matrice de caractères, puis un produit par les
+    puissances de 10 (les blancs et les signes comptent pour 0). Un champ entièrement
+    blanc, ou tronqué par une fin de ligne, vaut MISSING (int() levait ValueError).
+    """
+    offsets = np.concatenate([np.arange(first, last) for first, last in fields])
+    results = [np.empty(len(starts), dtype=np.int64) for _ in fields]
+
+    for lo in range(0, len(starts), CHUNK_LINES):
+        cols = starts[lo:lo + CHUNK_LINES, None] + offsets
+        chars = buf[np.minimum(cols, len(buf) - 1)]
+        chars[cols >= ends[lo:lo + CHUNK_LINES, None]] = 32  # au-delà de la fin de ligne
+        digits = np.where((chars >= 48) & (chars <= 57), chars - 48, 0).astype(np.int64)
+        negative = chars == 45
+
+        position = 0
+        for result, (first, last) in zip(results, fields):
+            width = last - first
+            block = slice(position, position + width)
+            values = digits[:, block] @ (10 ** np.arange(width - 1, -1, -1, dtype=np.int64))
+            values = np.where(negative[:, block].any(axis=1), -values, values)
+            blank = (chars[:, block] == 32).all(axis=1)
+            result[lo:lo + CHUNK_LINES] = np.where(blank, MISSING, values)
+            position += width
+    return results
+
+
+def parse_buffer(buf):
+    """
+    Découpe un contenu IGRA dérivé (tableau uint8, fichier entier ou extrait) en
+    deux tableaux structurés : les sondages et tous leurs niveaux à la suite.
+    """
+    buf = np.asarray(buf, dtype=np.uint8)
+    if buf.size == 0:
+        return np.empty(0, SOUNDING_DTYPE), np.empty(0, LEVEL_DTYPE)
+
+    newlines = np.flatnonzero(buf == 10)
+    starts = np.concatenate(([0], newlines + 1))
+    ends = np.concatenate((newlines, [len(buf)]))
+    keep = ends > starts
+    starts, ends = starts[keep], ends[keep]
+
+    is_header = buf[starts] == ord("#")
+    sounding_of_line = np.cumsum(is_header) - 1
+
+    h_starts, h_ends = starts[is_header], ends[is_header]
+    header = dict(zip(HEADER_FIELDS, _fixed_ints(buf, h_starts, h_ends, list(HEADER_FIELDS.values()))))
+
+    data = ~is_header & (sounding_of_line >= 0)
+    d_starts, d_ends = starts[data], ends[data]
+
+    levels = np.empty(len(d_starts), LEVEL_DTYPE)
+    levels["sounding"] = sounding_of_line[data]
+    columns = _fixed_ints(buf, d_starts, d_ends, [(a, b) for a, b, _ in LEVEL_FIELDS.values()])
+    for (name, (_, _, scale)), raw in zip(LEVEL_FIELDS.items(), columns):
+        levels[name] = np.where(raw == MISSING, np.nan, raw * scale)
+
+    soundings = np.empty(len(h_starts), SOUNDING_DTYPE)
+    months = ((header["year"] - 1970) * 12 + header["month"] - 1).astype("datetime64[M]")
+    days = months.astype("datetime64[D]") + (header["day"] - 1).astype("timedelta64[D]")
+    hours = np.where(header["hour"] == MISSING, 99, header["hour"])
+    times = days.astype("datetime64[h]") + np.where((hours >= 0) & (hours < 24), hours, 0).astype("timedelta64[h]")
+    valid_date = (header["year"] > 0) & (header["month"] >= 1) & (header["month"] <= 12) & (header["day"] >= 1)
+    soundings["time"] = np.where(valid_date, times, np.datetime64("NaT", "h"))
+    soundings["hour"] = hours
+    soundings["count"] = np.bincount(levels["sounding"], minlength=len(h_starts))
+    soundings["first"] = np.concatenate(([0], np.cumsum(soundings["count"])[:-1]))
+    return soundings, levels
+
+
+def read_file(filepath):
+    return parse_buffer(np.fromfile(filepath, dtype=np.uint8))
+
+
+def as_legacy(soundings, levels):
+    """
+    Format historique de parse_igra_derived_file : [{'date': (a, m, j), 'levels': [(h, N), ...]}],
+    sans les niveaux où la hauteur ou N manquent, ni les sondages vides.
+    """
+    result = []
+    for sounding in soundings:
+        block = levels[sounding["first"]:sounding["first"] + sounding["count"]]
+        valid = ~np.isnan(block["height"]) & ~np.isnan(block["refractivity"])
+        if not valid.any():
+            continue
+        day = sounding["time"].astype(datetime.datetime)
+        result.append({
+            'date': (day.year, day.month, day.day),
+            'levels': list(zip(block["height"][valid].astype(int).tolist(),
+                               block["refractivity"][valid].astype(int).tolist())),
+        })
+    return result
+
+
+class IgraStation:
+    """Fichier d'une station parsé une fois, interrogeable par plage de dates."""
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        soundings, self.levels = read_file(filepath)
+        order = np.argsort(soundings["time"], kind="stable")
+        self.soundings = soundings[order]
+
+    def __len__(self):
+        return len(self.soundings)
+
+    def _slice(self, start, end):
+        """Indices des sondages du jour `start` au jour `end` inclus."""
+        start = np.datetime64(np.datetime64(start, "D"), "h")
+        end = np.datetime64(np.datetime64(end, "D") + 1, "h")
+        times = self.soundings["time"]
+        return np.searchsorted(times, start, "left"), np.searchsorted(times, end, "left")
+
+    def between(self, start, end):
+        """Sondages (tableau structuré) entre deux dates incluses."""
+        lo, hi = self._slice(start, end)
+        return self.soundings[lo:hi]
+
+    def profile(self, sounding):
+        """Niveaux (tableau structuré) d'un sondage renvoyé par between()."""
+        return self.levels[sounding["first"]:sounding["first"] + sounding["count"]]
+
+    def day(self, year, month, day):
+        date = datetime.date(year, month, day)
+        return as_legacy(self.between(date, date), self.levels)
+
+    def days(self, start, end):
+        """{date: sondages au format historique} pour toute la plage, en une seule passe."""
+        by_day = {}
+        for sounding in as_legacy(self.between(start, end), self.levels):
+            by_day.setdefault(datetime.date(*sounding['date']), []).append(sounding)
+        return by_day
@@ -0,0 +1,96 @@
+import os
+import datetime
+import numpy as np
+from scipy.spatial import cKDTree
+
+# Index spatial des stations IGRA actives : vecteurs unitaires dans un KD-tree, la
+# distance de corde étant monotone avec la distance sur le grand cercle.
+STATIONS_FILE = "/app/output/igra-datas/igra2-station-list.txt"
+INDEX_SUFFIX = ".idx.npz"
+
+EARTH_RADIUS = 6371.0
+
+
+def unit_vectors(lats, lons):
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    lons = np.radians(np.asarray(lons, dtype=np.float64))
+    return np.stack([np.cos(lats) * np.cos(lons), np.cos(lats) * np.sin(lons), np.sin(lats)], axis=-1)
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS * np.arcsin(np.clip(chord / 2, 0, 1))
+
+
+def parse_station_list(stations_file, year):
+    """Stations dont la dernière année de données (LSTYEAR, colonnes 78-81) est `year`."""
+    ids, lats, lons = [], [], []
+    with open(stations_file, "r") as f:
+        for line in f:
+            try:
+                if int(line[77:81]) != year:
+                    continue
+                ids.append(line[0:11].strip())
+                lats.append(float(line[12:20].strip()))
+                lons.append(float(line[21:30].strip()))
+            except ValueError:
+                continue
+    return np.array(ids, dtype=str), np.array(lats, dtype=np.float64), np.array(lons, dtype=np.float64)
+
+
+class StationIndex:
+
+    def __init__(self, ids, lats, lons):
+        self.ids = np.asarray(ids, dtype=str)
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.tree = cKDTree(unit_vectors(self.lats, self.lons)) if len(self.ids) else None
+
+    @classmethod
+    def load(cls, stations_file=STATIONS_FILE, year=None):
+        """
+        Index de la liste des stations, relu depuis `<liste>.idx.npz` tant que la liste
+        téléchargée n'a pas changé, sinon reconstruit puis enregistré.
+        """
+        year = year or datetime.datetime.now().year
+        stat = os.stat(stations_file)
+        signature = np.array([stat.st_size, stat.st_mtime_ns, year], dtype=np.int64)
+        index_path = stations_file + INDEX_SUFFIX
+
+        if os.path.exists(index_path):
+            try:
+                with np.load(index_path) as saved:
+                    if np.array_equal(saved["signature"], signature):
+                        return cls(saved["ids"], saved["lats"], saved["lons"])
+            except (OSError, ValueError, KeyError):
+                pass
+
+        ids, lats, lons = parse_station_list(stations_file, year)
+        tmp = index_path + ".tmp.npz"
+        np.savez(tmp, signature=signature, ids=ids, lats=lats, lons=lons)
+        os.replace(tmp, index_path)
+        return cls(ids, lats, lons)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def station(self, i):
+        """Station au format historique de get_stations()."""
+        return {"id": str(self.ids[i]), "lat": float(self.lats[i]), "lon": float(self.lons[i])}
+
+    def query(self, lats, lons, k=1):
+        """
+        Les k stations les plus proches de chaque point (tableaux de même forme) :
+        indices et distances en km, de forme (n,) si k == 1, (n, k) sinon.
+        """
+        if self.tree is None:
+            raise ValueError("No active IGRA station in the index")
+        k = min(k, len(self))
+        chord, indices = self.tree.query(unit_vectors(np.atleast_1d(lats), np.atleast_1d(lons)), k=k)
+        return indices, chord_to_km(chord)
+
+    def nearest(self, lat, lon):
+        """Station la plus proche d'un seul point (dict) ou None s'il n'y a aucune station."""
+        if not len(self):
+            return None
+        indices, _ = self.query(lat, lon)
+        return self.station(int(indices[0]))
@@ -0,0 +1,213 @@
+import os
+import json
+import time
+import queue
+import threading
+
+# Lot en échec : nouvel essai après RETRY_MIN_S, puis délai doublé jusqu'à RETRY_MAX_S
+RETRY_MIN_S = 0.5
+RETRY_MAX_S = 30.0
+
+
+class IngestQueue:
+    """
+    File d'attente bornée entre le webhook et l'écriture disque.
+    Un thread d'écriture regroupe les lignes tous les `batch_rows` lignes ou toutes les
+    `flush_ms` millisecondes, puis appelle dans l'ordre chaque étape de `steps`, une liste
+    de (nom, fonction(messages, rows)). Les étapes réussies sont notées sur le lot : s'il
+    échoue, seules les étapes restantes sont réessayées (le webhook a déjà répondu 200,
+    Helium ne le renverra pas, et une ligne déjà dans le CSV ne doit pas y être recopiée).
+    Pendant ce temps la file se remplit et finit par répondre 503. Un lot encore incomplet
+    à l'arrêt est écrit dans `spill_file` avec ses étapes faites, et repris au démarrage suivant.
+    """
+
+    def __init__(self, steps, maxsize=10000, batch_rows=200, flush_ms=500, on_error=print, spill_file=None):
+        self.steps = list(steps)
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_ms / 1000.0
+        self.on_error = on_error
+        self.spill_file = spill_file
+        self.queue = queue.Queue(maxsize=maxsize)
+        self._stop = threading.Event()
+        # put() et close() : aucun payload accepté après la décision d'arrêt
+        self._put_lock = threading.Lock()
+        self._thread = None
+        self._retry_at = None
+        self._retry_delay = 0.0
+        self._replay_file = None
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "accepted": 0,
+            "rejected": 0,
+            "written_rows": 0,
+            "flushes": 0,
+            "flush_errors": 0,
+            "replayed_rows": 0,
+            "spilled_rows": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0,
+        }
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+            self._thread.start()
+        return self
+
+    def put(self, message, rows):
+        """Ajoute un payload validé. Retourne False si la file est pleine (backpressure)."""
+        with self._put_lock:
+            if self._stop.is_set():
+                return False
+            try:
+                self.queue.put_nowait((message, rows))
+            except queue.Full:
+                with self._stats_lock:
+                    self._stats["rejected"] += 1
+                return False
+        with self._stats_lock:
+            self._stats["accepted"] += 1
+        return True
+
+    @staticmethod
+    def _new_batch():
+        return {"messages": [], "rows": [], "done": []}
+
+    def _flush(self, batch):
+        """Lance les étapes pas encore faites du lot. Retourne False (et planifie un nouvel essai) en cas d'échec."""
+        start = time.perf_counter()
+        for name, step in self.steps:
+            if name in batch["done"]:
+                continue
+            try:
+                step(batch["messages"], batch["rows"])
+            except Exception as e:
+                self._retry_delay = min(max(RETRY_MIN_S, 2 * self._retry_delay), RETRY_MAX_S)
+                self._retry_at = time.monotonic() + self._retry_delay
+                with self._stats_lock:
+                    self._stats["flush_errors"] += 1
+                self.on_error(f"[INGEST ERROR] Step {name} failed for a batch of {len(batch['rows'])} rows, "
+                              f"retry in {self._retry_delay:.1f} s: {e}")
+                return False
+            batch["done"].append(name)
+        self._retry_at = None
+        self._retry_delay = 0.0
+        elapsed = (time.perf_counter() - start) * 1000
+        with self._stats_lock:
+            self._stats["flushes"] += 1
+            self._stats["written_rows"] += len(batch["rows"])
+            self._stats["last_flush_ms"] = elapsed
+            self._stats["max_flush_ms"] = max(self._stats["max_flush_ms"], elapsed)
+            self._stats["total_flush_ms"] += elapsed
+        return True
+
+    def _load_spill(self):
+        """Lots incomplets lors du dernier arrêt, renommés pour qu'un seul processus les reprenne."""
+        if self.spill_file is None or not os.path.exists(self.spill_file):
+            return []
+        replay_file = f"{self.spill_file}.replay-{os.getpid()}"
+        try:
+            os.replace(self.spill_file, replay_file)
+        except FileNotFoundError:
+            return []  # repris par un autre worker
+        batches = []
+        with open(replay_file, "r") as f:
+            for line in f:
+                batch = json.loads(line)
+                batch.setdefault("done", [])
+                batches.append(batch)
+        self._replay_file = replay_file
+        with self._stats_lock:
+            self._stats["replayed_rows"] += sum(len(batch["rows"]) for batch in batches)
+        return batches
+
+    def _replayed(self):
+        """Lots rejoués tous terminés (ou sauvegardés à nouveau) : le fichier de reprise est inutile."""
+        if self._replay_file is not None:
+            os.remove(self._replay_file)
+            self._replay_file = None
+
+    def _spill(self, batches):
+        batches = [batch for batch in batches if batch["messages"] or batch["rows"]]
+        if batches and self.spill_file is None:
+            rows = sum(len(batch["rows"]) for batch in batches)
+            self.on_error(f"[INGEST ERROR] {rows} rows lost: no spill file")
+        elif batches:
+            # Une seule écriture en mode ajout : les lignes de plusieurs workers ne se mélangent pas
+            with open(self.spill_file, "a") as f:
+                f.write("".join(json.dumps(batch) + "\n" for batch in batches))
+            rows = sum(len(batch["rows"]) for batch in batches)
+            with self._stats_lock:
+                self._stats["spilled_rows"] += rows
+            self.on_error(f"[INGEST] {rows} rows saved to {self.spill_file}, resumed at next start")
+        self._replayed()
+
+    def _run(self):
+        pending = self._load_spill()
+        batch = self._new_batch()
+        deadline = None
+        while True:
+            if pending or self._retry_at is not None:
+                # Lot rejoué ou en échec : rien de plus n'est pris dans la file avant qu'il soit écrit
+                if self._retry_at is not None and self._stop.wait(max(0.0, self._retry_at - time.monotonic())):
+                    break
+                if self._stop.is_set():
+                    break
+                if pending:
+                    if self._flush(pending[0]):
+                        pending.pop(0)
+                        if not pending:
+                            self._replayed()
+                elif self._flush(batch):
+                    batch = self._new_batch()
+                    deadline = None
+                continue
+
+            timeout = self.flush_interval if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                message, new_rows = self.queue.get(timeout=timeout)
+                batch["messages"].append(message)
+                batch["rows"].extend(new_rows)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+            except queue.Empty:
+                if self._stop.is_set():
+                    break
+
+            if batch["messages"] and (len(batch["rows"]) >= self.batch_rows or time.monotonic() >= deadline):
+                if self._flush(batch):
+                    batch = self._new_batch()
+                    deadline = None
+
+        # Vidage final : payloads arrivés avant l'arrêt mais pas encore lus, dans un lot
+        # à part (le lot en cours a peut-être déjà passé certaines étapes)
+        tail = self._new_batch()
+        while True:
+            try:
+                message, new_rows = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            tail["messages"].append(message)
+            tail["rows"].extend(new_rows)
+        # Dernier essai pour chaque lot ; les incomplets sont sauvegardés avec leurs étapes faites
+        unfinished = [b for b in pending + [batch, tail] if (b["messages"] or b["rows"]) and not self._flush(b)]
+        if unfinished or pending:
+            self._spill(unfinished)
+
+    def close(self, timeout=None):
+        """Refuse les nouveaux payloads et attend que la file soit entièrement écrite."""
+        with self._put_lock:
+            self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.queue.empty()
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        flushes = stats.pop("total_flush_ms")
+        stats["avg_flush_ms"] = round(flushes / stats["flushes"], 3) if stats["flushes"] else 0.0
+        stats["queue_depth"] = self.queue.qsize()
+        stats["queue_capacity"] = self.queue.maxsize
+        return stats
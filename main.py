@@ -1,13 +1,16 @@
 import subprocess
-import schedule
 import time
 import signal
 import sys
 import argparse
 import os
 
+from pipeline import Pipeline, Stage
+
 LOCALTUNNEL = "run_localtunnel.sh"
 WEBHOOK = "webhook_server.py"
+GUNICORN_CONF = "gunicorn.conf.py"
+WSGI_APP = "webhook_server:app"
 SPLAT = "run_splat.py"
 MAP_GENERATION = "generate_maps.py"
 IGRA = "calculate_igra.py"
@@ -15,16 +18,75 @@ DOWNLOAD_TERRAIN = "download_terrain.py"
 CONVERT_HGT = "convert_hgt_to_sdf.sh"
 STATS = "study-correlation/main_stats.py"
 ERA5 = "era5_gradients.py"
+REFRACTION = "refraction_los.py"
 
 # Définir l'argument --logs
 parser = argparse.ArgumentParser(description="Logs option")
 parser.add_argument("--logs", action="store_true", help="Activate logs")
+parser.add_argument("--production", action="store_true",
+                    help="Serve the webhook with gunicorn (read pool on 5000, ingest pool on 5001)")
 args = parser.parse_args()
 
 subprocesses = []
+webhook_processes = []
+
+# Temps laissé au webhook pour vider sa file d'ingestion après SIGTERM
+WEBHOOK_DRAIN_TIMEOUT = 30
+
+# Intervalle entre deux vérifications du pipeline
+PIPELINE_TICK = 10
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+
+def with_logs(command):
+    return command + ["--logs"] if args.logs else command
+
+# Dépendances des calculs : ingestion -> visibilité -> IGRA/ERA5 -> carte/statistiques/réfraction.
+# Une étape ne tourne que si une de ses dépendances a produit de nouvelles sorties
+# (ou si sa période est écoulée pour IGRA, ERA5 et les statistiques, qui téléchargent
+# des données externes), et jamais deux fois en même temps (voir pipeline.py).
+STAGES = [
+    Stage("ingest", outputs=["/app/output/data/helium_gateway_data.csv"]),
+    # Mesures reçues toutes les 5 minutes : SPLAT au plus toutes les 5 minutes, comme avant
+    Stage("visibility", with_logs(["python3", SPLAT]), deps=["ingest"],
+          outputs=["/app/output/data/gateway_visibility.stamp"],
+          min_interval=5 * MINUTE),
+    Stage("igra", with_logs(["python3", IGRA]), deps=["visibility"],
+          outputs=["/app/output/igra-datas/map_links.json"],
+          every=12 * HOUR, min_interval=HOUR),
+    Stage("era5", ["python3", "-u", ERA5], deps=["visibility"],
+          outputs=["/app/output/era5/ducting"],
+          every=24 * HOUR, min_interval=6 * HOUR),
+    Stage("map", with_logs(["python3", MAP_GENERATION]), deps=["ingest", "visibility", "igra"],
+          outputs=["/app/output/map.html"], min_interval=5 * MINUTE),
+    # LOS recalculée avec le gradient mesuré chaque jour (liens et jours déjà faits sautés)
+    Stage("refraction", with_logs(["python3", REFRACTION, "--source", "both"]), deps=["igra", "era5"],
+          outputs=["/app/output/data/refraction_los.csv"],
+          every=24 * HOUR, min_interval=6 * HOUR),
+    Stage("stats", ["python3", STATS], deps=["igra", "era5"],
+          every=24 * HOUR, min_interval=HOUR),
+]
+
+pipeline = Pipeline(STAGES)
+
 with open("configs/.subdomain", "r") as f:
     subdomain = f.readline()
 
+def start_webhook(log_file):
+    if not args.production:
+        if args.logs:
+            return [subprocess.Popen(["python3", WEBHOOK, "--logs"], stdout=log_file)]
+        return [subprocess.Popen(["python3", WEBHOOK], stdout=log_file)]
+
+    # Deux serveurs gunicorn (voir gunicorn.conf.py) : lecture puis ingestion
+    env = dict(os.environ, WEBHOOK_LOGS="1" if args.logs else "0")
+    return [
+        subprocess.Popen(["gunicorn", "-c", GUNICORN_CONF, WSGI_APP],
+                         stdout=log_file, stderr=subprocess.STDOUT, env=dict(env, WEBHOOK_POOL=pool))
+        for pool in ("read", "ingest")
+    ]
+
 def run_all():
     run_terrain()
 
@@ -35,16 +97,9 @@ def run_all():
     # subprocesses.append(p)
     time.sleep(2)
     with open("/app/output/server.log", "w") as log_file:
-        if args.logs:
-            p2 = subprocess.Popen(["python3", WEBHOOK, "--logs"], stdout=log_file)
-        else:
-            p2 = subprocess.Popen(["python3", WEBHOOK], stdout=log_file)
-        subprocesses.append(p2)
-
-    run_igra()
-    run_era5()
-    run_map()
-    
+        webhook_processes.extend(start_webhook(log_file))
+        subprocesses.extend(webhook_processes)
+
 def run_terrain():
     p0 = subprocess.Popen(["python3", "-u", DOWNLOAD_TERRAIN])
     subprocesses.append(p0)
@@ -53,40 +108,19 @@ def run_terrain():
     subprocesses.append(p00)
     p00.wait()
 
-def run_map():
-    print("(Re)running SPLAT calculation and map generation on new data...")
-    if args.logs:
-        p3 = subprocess.Popen(["python3", SPLAT, "--logs"])
-    else:
-        p3 = subprocess.Popen(["python3", SPLAT])
-    p3.wait()
-    if args.logs:
-        p4 = subprocess.Popen(["python3", MAP_GENERATION, "--logs"])
-    else:
-        p4 = subprocess.Popen(["python3", MAP_GENERATION])
-    subprocesses.append(p4)
-
-def run_igra():
-    print("Running calculate_igra on data...")
-    if args.logs:
-        p5 = subprocess.Popen(["python3", IGRA, "--logs"])
-    else:
-        p5 = subprocess.Popen(["python3", IGRA])
-    subprocesses.append(p5)
-    p5.wait()
-
-def run_era5():
-    print("Running ERA5...")
-    p6 = subprocess.Popen(["python3", "-u", ERA5])
-    subprocesses.append(p6)
-
-def run_stats():
-    print("Running stats on correlation...")
-    p6 = subprocess.Popen(["python3", STATS])
-    subprocesses.append(p6)
-
 def cleanup(signum=None, frame=None):
     print("Stopping all subprocesses...")
+    # Le webhook en premier : il vide sa file d'ingestion sur SIGTERM avant de quitter
+    for webhook_process in webhook_processes:
+        if webhook_process.poll() is None:
+            webhook_process.terminate()
+    for webhook_process in webhook_processes:
+        try:
+            webhook_process.wait(timeout=WEBHOOK_DRAIN_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            print(f"Webhook {webhook_process.pid} did not drain in time, we kill it.")
+            webhook_process.kill()
+    pipeline.stop()
     for p in subprocesses:
         if p.poll() is None:  # Si le process est encore actif
             try:
@@ -110,23 +144,16 @@ signal.signal(signal.SIGTERM, cleanup)  # kill ou shutdown
 
 try:
     run_all()
-    fix_output_ownership()
-
-    run_stats()
-
-    # Lance le calcul splat et la génération de map toutes les 5 minutes
-    schedule.every(5).minutes.do(run_map)
-
-    # Lance le calcul des stations IGRA 2 fois par jour
-    schedule.every(12).hours.do(run_igra)
-
-    # Lance les statistiques une fois par jour
-    schedule.every(24).hours.do(run_stats)
-    schedule.every(24).hours.do(run_era5)
 
+    ownership_fixed = False
     while True:
-        schedule.run_pending()
-        time.sleep(1)
+        if pipeline.tick():
+            print(f"Pipeline durations: {pipeline.stats()}")
+        # Après le premier passage complet, comme avant après les premiers calculs
+        if not ownership_fixed and pipeline.all_ran():
+            fix_output_ownership()
+            ownership_fixed = True
+        time.sleep(PIPELINE_TICK)
 
 except KeyboardInterrupt:
     # Catch redondant au cas où le signal ne capte pas tout
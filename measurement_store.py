@@ -0,0 +1,184 @@
+import os
+import glob
+import time
+import shutil
+import argparse
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from visibility_store import join_visibility
+
+# Stockage colonnaire des mesures : une partition Parquet par jour
+# /app/output/data/measurements/date=YYYY-MM-DD/part-<ns>.parquet
+CSV_FILE = "/app/output/data/helium_gateway_data.csv"
+STORE_DIR = "/app/output/data/measurements"
+MIGRATED_MARKER = "_MIGRATED"
+
+# Au-delà de ce nombre de fichiers dans une partition, on la compacte en un seul
+MAX_PARTS_PER_DAY = 32
+
+CSV_HEADER = ["gwTime", "gatewayId", "gateway_name", "gateway_id",
+              "node_long", "node_lat", "gateway_long", "gateway_lat",
+              "dist_km", "rssi", "snr", "visibility"]
+
+FLOAT32_COLUMNS = ["rssi", "snr"]
+FLOAT64_COLUMNS = ["node_long", "node_lat", "gateway_long", "gateway_lat", "dist_km"]
+CATEGORY_COLUMNS = ["gatewayId", "gateway_name", "visibility"]
+
+
+def is_enabled(store_dir=STORE_DIR):
+    """Le store n'est utilisé qu'une fois la migration depuis le CSV effectuée."""
+    return os.path.exists(os.path.join(store_dir, MIGRATED_MARKER))
+
+
+def to_typed_frame(df):
+    """Convertit un DataFrame au format CSV en colonnes typées."""
+    df = df.copy()
+    df["gwTime"] = pd.to_datetime(df["gwTime"], format="ISO8601", utc=True, errors="coerce")
+    df = df.dropna(subset=["gwTime"])
+    for col in FLOAT32_COLUMNS:
+        df[col] = pd.to_numeric(df[col], errors="coerce").astype("float32")
+    for col in FLOAT64_COLUMNS:
+        df[col] = pd.to_numeric(df[col], errors="coerce").astype("float64")
+    # Visibilité pas encore calculée par run_splat : "N/A" comme dans le CSV
+    df["visibility"] = df["visibility"].astype("string").fillna("N/A")
+    for col in CATEGORY_COLUMNS:
+        df[col] = df[col].astype("string").astype("category")
+    df["gateway_id"] = df["gateway_id"].astype("string")
+    df["date"] = df["gwTime"].dt.strftime("%Y-%m-%d")
+    return df
+
+
+def partition_dir(date, store_dir=STORE_DIR):
+    return os.path.join(store_dir, f"date={date}")
+
+
+def _write_partition(frame, directory):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"part-{time.time_ns()}.parquet")
+    tmp_path = f"{path}.tmp"
+    frame = frame[CSV_HEADER].copy()
+    for col in CATEGORY_COLUMNS:
+        frame[col] = frame[col].astype("category").cat.remove_unused_categories()
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def compact_partition(date, store_dir=STORE_DIR):
+    """Regroupe tous les fichiers d'une partition en un seul."""
+    directory = partition_dir(date, store_dir)
+    parts = sorted(glob.glob(os.path.join(directory, "part-*.parquet")))
+    if len(parts) <= 1:
+        return
+    frame = pq.read_table(parts, partitioning=None).to_pandas()
+    _write_partition(frame, directory)
+    for part in parts:
+        os.remove(part)
+
+
+def append_rows(rows, store_dir=STORE_DIR):
+    """Ajoute des lignes (dicts au format CSV) dans les partitions journalières."""
+    if not rows:
+        return []
+    df = to_typed_frame(pd.DataFrame(rows, columns=CSV_HEADER))
+    written = []
+    for date, group in df.groupby("date"):
+        directory = partition_dir(date, store_dir)
+        _write_partition(group, directory)
+        if len(glob.glob(os.path.join(directory, "part-*.parquet"))) > MAX_PARTS_PER_DAY:
+            compact_partition(date, store_dir)
+        written.append(date)
+    return written
+
+
+def list_dates(store_dir=STORE_DIR):
+    return sorted(os.path.basename(d)[len("date="):]
+                  for d in glob.glob(os.path.join(store_dir, "date=*")))
+
+
+def read_measurements(start=None, end=None, columns=None, store_dir=STORE_DIR):
+    """
+    Lit les mesures entre start et end inclus ('YYYY-MM-DD').
+    Seules les partitions de la période demandée sont ouvertes.
+    """
+    read_columns = None
+    if columns is not None:
+        read_columns = [c for c in CSV_HEADER if c in columns or c == "gwTime"]
+
+    tables = []
+    for date in list_dates(store_dir):
+        if start is not None and date < start:
+            continue
+        if end is not None and date > end:
+            continue
+        files = sorted(glob.glob(os.path.join(partition_dir(date, store_dir), "part-*.parquet")))
+        if not files:
+            continue
+        table = pq.read_table(files, columns=read_columns, partitioning=None)
+        # La date vient du nom de la partition : pas de conversion de gwTime ligne par ligne
+        dates = pa.DictionaryArray.from_arrays(np.zeros(len(table), dtype=np.int32), pa.array([date]))
+        tables.append(table.append_column("date", dates))
+
+    if not tables:
+        df = pd.DataFrame({c: pd.Series(dtype="object") for c in (read_columns or CSV_HEADER) + ["date"]})
+        df["gwTime"] = pd.to_datetime(df["gwTime"], utc=True)
+        return df
+
+    df = pa.concat_tables(tables, promote_options="permissive").to_pandas()
+    df["date"] = df["date"].astype(str)
+    return df
+
+
+def load_measurements(start=None, end=None, columns=None, csv_file=CSV_FILE, store_dir=STORE_DIR):
+    """
+    Point d'entrée commun pour les scripts : lit le store colonnaire s'il est migré,
+    sinon retombe sur le CSV (gwTime et date au même format dans les deux cas).
+    La visibilité est jointe depuis la table des gateways de run_splat.
+    """
+    if is_enabled(store_dir):
+        df = read_measurements(start, end, columns, store_dir)
+    else:
+        df = to_typed_frame(pd.read_csv(csv_file))
+        if start is not None:
+            df = df[df["date"] >= start]
+        if end is not None:
+            df = df[df["date"] <= end]
+        if columns is not None:
+            df = df[[c for c in df.columns if c in columns or c in ("gwTime", "date")]]
+
+    if {"gatewayId", "gateway_lat", "gateway_long", "visibility"}.issubset(df.columns):
+        df = join_visibility(df)
+    return df
+
+
+def migrate(csv_file=CSV_FILE, store_dir=STORE_DIR):
+    """Migration unique du CSV vers le store partitionné (réécrit le store entier)."""
+    df = to_typed_frame(pd.read_csv(csv_file))
+    tmp_dir = f"{store_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for date, group in df.groupby("date"):
+        _write_partition(group, partition_dir(date, tmp_dir))
+    open(os.path.join(tmp_dir, MIGRATED_MARKER), "w").close()
+    shutil.rmtree(store_dir, ignore_errors=True)
+    os.replace(tmp_dir, store_dir)
+    print(f"[OK] Migrated {len(df)} rows from {csv_file} into {store_dir}")
+    return len(df)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Columnar store for gateway measurements")
+    parser.add_argument("--migrate", action="store_true", help="Migrate the CSV into the store")
+    parser.add_argument("--csv", default=CSV_FILE)
+    parser.add_argument("--store", default=STORE_DIR)
+    args = parser.parse_args()
+
+    if args.migrate:
+        migrate(args.csv, args.store)
+    else:
+        dates = list_dates(args.store)
+        print(f"{len(dates)} daily partitions in {args.store}"
+              + (f" ({dates[0]} -> {dates[-1]})" if dates else ""))
@@ -0,0 +1,198 @@
+import os
+import json
+import time
+import hashlib
+import subprocess
+
+# Enchaînement des calculs lancés par main.py : chaque étape déclare les étapes dont elle
+# dépend et les fichiers qu'elle produit. Une étape n'est relancée que si les sorties de
+# ses dépendances ont changé depuis son dernier lancement (ou si sa période est écoulée),
+# jamais deux fois en même temps, et jamais pendant qu'une de ses dépendances tourne.
+# Les durées et l'état de chaque étape sont enregistrés dans STATE_FILE.
+STATE_FILE = "/app/output/pipeline.json"
+# Au-delà, une sortie est comparée par (mtime, taille) au lieu de son contenu
+DIGEST_MAX_BYTES = 8 * 1024 * 1024
+
+
+class Stage:
+    """
+    command : liste passée à Popen, ou None pour une source (ex. le CSV du webhook).
+    every : relance périodique (secondes) même sans changement en amont (données externes).
+    min_interval : délai minimal entre deux lancements (regroupe les changements rapprochés).
+    """
+
+    def __init__(self, name, command=None, deps=(), outputs=(), every=None, min_interval=0):
+        self.name = name
+        self.command = command
+        self.deps = tuple(deps)
+        self.outputs = tuple(outputs)
+        self.every = every
+        self.min_interval = min_interval
+
+
+class Pipeline:
+    def __init__(self, stages, state_file=STATE_FILE, log=print):
+        self.stages = {stage.name: stage for stage in stages}
+        self.order = self._topological_order()
+        self.state_file = state_file
+        self.log = log
+        self.state = self._load_state()
+        for state in self.state.values():
+            if state.pop("running", False):
+                # Interrompue par un arrêt du conteneur : à refaire
+                state["inputs"] = None
+        self.running = {}
+        self._digests = {}
+
+    def _topological_order(self):
+        order, visiting = [], set()
+
+        def visit(name):
+            if name in order:
+                return
+            if name in visiting:
+                raise ValueError(f"Dependency cycle on stage {name}")
+            visiting.add(name)
+            for dep in self.stages[name].deps:
+                if dep not in self.stages:
+                    raise ValueError(f"Stage {name} depends on unknown stage {dep}")
+                visit(dep)
+            visiting.discard(name)
+            order.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return [self.stages[name] for name in order]
+
+    def _load_state(self):
+        if not os.path.exists(self.state_file):
+            return {}
+        try:
+            with open(self.state_file, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            self.log(f"[WARN] Unreadable pipeline state {self.state_file}: {e}")
+            return {}
+
+    def _save_state(self):
+        tmp = f"{self.state_file}.tmp-{os.getpid()}"
+        with open(tmp, "w") as f:
+            json.dump(self.state, f, indent=1)
+        os.replace(tmp, self.state_file)
+
+    def _path_signature(self, path):
+        """Empreinte du contenu d'un fichier (recalculée seulement si mtime/taille changent)."""
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        stat = [st.st_mtime_ns, st.st_size]
+        if os.path.isdir(path) or st.st_size > DIGEST_MAX_BYTES:
+            return stat
+        cached = self._digests.get(path)
+        if cached is None or cached[0] != stat:
+            with open(path, "rb") as f:
+                cached = self._digests[path] = (stat, hashlib.sha1(f.read()).hexdigest())
+        return cached[1]
+
+    def signature(self, name):
+        """Version des sorties d'une étape : change quand l'une d'elles change."""
+        return [self._path_signature(path) for path in self.stages[name].outputs]
+
+    def _inputs(self, stage):
+        return {dep: self.signature(dep) for dep in stage.deps}
+
+    def _reason(self, stage, now):
+        """Pourquoi l'étape doit être lancée maintenant, ou None."""
+        if any(dep in self.running for dep in stage.deps):
+            return None  # attendre la fin de l'amont
+        state = self.state.get(stage.name)
+        if state is None:
+            return "first run"
+        if now - state["started"] < stage.min_interval:
+            return None
+        if state.get("inputs") != self._inputs(stage):
+            return "inputs changed"
+        if stage.every and now - state["started"] >= stage.every:
+            return "periodic"
+        return None
+
+    def _start(self, stage, now, reason):
+        self.log(f"[PIPELINE] Starting {stage.name} ({reason})")
+        state = self.state.setdefault(stage.name, {"runs": 0, "failures": 0, "total_duration_s": 0.0})
+        state["started"] = now
+        state["reason"] = reason
+        state["running"] = True
+        # Entrées lues au lancement : un changement pendant le calcul relancera l'étape
+        state["inputs"] = self._inputs(stage)
+        self.running[stage.name] = subprocess.Popen(stage.command)
+        self._save_state()
+
+    def _poll(self, now):
+        finished = []
+        for name, process in list(self.running.items()):
+            code = process.poll()
+            if code is None:
+                continue
+            del self.running[name]
+            state = self.state[name]
+            duration = now - state["started"]
+            state["runs"] += 1
+            state["last_duration_s"] = round(duration, 1)
+            state["total_duration_s"] = round(state["total_duration_s"] + duration, 1)
+            state["last_exit"] = code
+            state["running"] = False
+            if code != 0:
+                state["failures"] += 1
+                # Nouvel essai après min_interval, même si l'amont n'a pas changé
+                state["inputs"] = None
+                self.log(f"[PIPELINE] {name} failed with code {code} after {duration:.1f} s")
+            else:
+                self.log(f"[PIPELINE] {name} done in {duration:.1f} s")
+            finished.append(name)
+        if finished:
+            self._save_state()
+        return finished
+
+    def tick(self, now=None):
+        """Relève les étapes terminées puis lance celles à refaire. Retourne les étapes terminées."""
+        now = time.time() if now is None else now
+        finished = self._poll(now)
+        for stage in self.order:
+            if stage.command is None or stage.name in self.running:
+                continue
+            reason = self._reason(stage, now)
+            if reason is not None:
+                self._start(stage, now, reason)
+        return finished
+
+    def all_ran(self):
+        """Toutes les étapes ont tourné au moins une fois et aucune ne tourne."""
+        return not self.running and all(self.state.get(stage.name, {}).get("runs")
+                                        for stage in self.order if stage.command is not None)
+
+    def stop(self, timeout=5):
+        for name, process in self.running.items():
+            if process.poll() is None:
+                process.terminate()
+        for name, process in self.running.items():
+            try:
+                process.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                print(f"Stage {name} ({process.pid}) does not respond, we kill it.")
+                process.kill()
+        self.running.clear()
+
+    def stats(self):
+        """Durées par étape (dernière et moyenne), échecs et étapes en cours."""
+        return {
+            stage.name: {
+                "running": stage.name in self.running,
+                "runs": state.get("runs", 0),
+                "failures": state.get("failures", 0),
+                "last_duration_s": state.get("last_duration_s"),
+                "avg_duration_s": round(state["total_duration_s"] / state["runs"], 1) if state.get("runs") else None,
+            }
+            for stage in self.order if stage.command is not None
+            for state in [self.state.get(stage.name, {})]
+        }
@@ -0,0 +1,170 @@
+import os
+import json
+import argparse
+from contextlib import closing
+import numpy as np
+import terrain_los
+from visibility_store import gateway_key
+from file_lock import FileLock
+
+# Cache persistant des profils de terrain end-node -> gateway : le terrain ne change
+# pas, seul le calcul LOS (k, Fresnel) varie. Toutes les altitudes sont à la suite
+# dans un seul fichier float32 mémoire-mappé, l'index JSON donne l'offset de chaque profil.
+# run_splat et refraction_los peuvent ajouter des profils en même temps : l'ajout et
+# l'écriture de l'index se font sous un verrou fcntl (voir file_lock.py).
+CACHE_DIR = "/app/output/data/profiles/"
+DATA_FILE = "profiles.f32"
+INDEX_FILE = "profiles.json"
+
+# Version du format : à incrémenter si l'échantillonnage du profil change
+FORMAT_VERSION = 1
+
+
+def profile_id(gateway_id, lat, lon):
+    return "|".join(str(part) for part in gateway_key(gateway_id, lat, lon))
+
+
+class ProfileCache:
+    """
+    Profils (distances, altitudes) par gateway pour un end-node donné. Les distances
+    ne sont pas stockées : elles sont régulières, reconstruites depuis la longueur totale.
+    """
+
+    def __init__(self, end_lat, end_lon, tiles=None, cache_dir=CACHE_DIR, step_m=terrain_los.SAMPLE_STEP_M):
+        self.end_node = [round(float(end_lat), 6), round(float(end_lon), 6)]
+        self.step_m = float(step_m)
+        self.tiles = tiles
+        self.cache_dir = cache_dir
+        self.data_path = os.path.join(cache_dir, DATA_FILE)
+        self.index_path = os.path.join(cache_dir, INDEX_FILE)
+        # Verrou partagé entre threads et processus qui utilisent le même cache
+        self.lock = FileLock("profiles", lock_dir=cache_dir)
+        self._data = None
+        self.hits = 0
+        self.misses = 0
+        self.index = self._load_index()
+
+    def _header(self):
+        return {"version": FORMAT_VERSION, "end_node": self.end_node, "step_m": self.step_m}
+
+    def _read_index(self):
+        """Index sur disque, ou None s'il est absent, illisible ou pour un autre end-node."""
+        if not (os.path.exists(self.index_path) and os.path.exists(self.data_path)):
+            return None
+        try:
+            with open(self.index_path, "r") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if all(index.get(key) == value for key, value in self._header().items()):
+            return index
+        return None
+
+    def _load_index(self):
+        with self.lock:
+            index = self._read_index()
+            if index is None:
+                # End-node déplacé (configs/.latitude, .longitude), format changé ou cache absent
+                return self.invalidate()
+            length = os.path.getsize(self.data_path)
+            if length > index["size"] * 4:
+                # Arrêt entre l'ajout des altitudes et l'écriture de l'index : fin orpheline
+                os.truncate(self.data_path, index["size"] * 4)
+            elif length < index["size"] * 4:
+                # Fichier tronqué : les offsets de l'index ne sont plus fiables
+                return self.invalidate()
+            return index
+
+    def invalidate(self):
+        """Vide le cache : à appeler quand END_DEVICE_LAT/LON change."""
+        with self.lock:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            open(self.data_path, "wb").close()
+            self._data = None
+            self.index = {**self._header(), "size": 0, "profiles": {}}
+            self._save_index()
+            return self.index
+
+    def _save_index(self):
+        tmp = f"{self.index_path}.tmp-{os.getpid()}"
+        with open(tmp, "w") as f:
+            json.dump(self.index, f, separators=(",", ":"))
+        os.replace(tmp, self.index_path)
+
+    def _elevations(self):
+        if self._data is None:
+            size = self.index["size"]
+            self._data = (np.memmap(self.data_path, dtype=np.float32, mode="r", shape=(size,))
+                          if size else np.empty(0, dtype=np.float32))
+        return self._data
+
+    def __contains__(self, key):
+        return profile_id(*key) in self.index["profiles"]
+
+    def __len__(self):
+        return len(self.index["profiles"])
+
+    def get(self, gateway_id, lat, lon):
+        """Profil (distances en m, altitudes en m) de la gateway, calculé au premier appel."""
+        entry = self.index["profiles"].get(profile_id(gateway_id, lat, lon))
+        if entry is None:
+            self.misses += 1
+            return self.add(gateway_id, lat, lon)
+        self.hits += 1
+        offset, count, total = entry
+        elevations = self._elevations()[offset:offset + count]
+        return np.linspace(0.0, total, count), elevations
+
+    def add(self, gateway_id, lat, lon):
+        if self.tiles is None:
+            self.tiles = terrain_los.HgtTiles()
+        distances, elevations = terrain_los.terrain_profile(
+            self.tiles, self.end_node[0], self.end_node[1], lat, lon, self.step_m
+        )
+        elevations = elevations.astype(np.float32)
+        key = profile_id(gateway_id, lat, lon)
+        with self.lock:
+            # Index relu sous le verrou : profils ajoutés entre-temps par un autre processus
+            index = self._read_index()
+            if index is not None:
+                self.index = index
+            if key not in self.index["profiles"]:
+                with open(self.data_path, "ab") as f:
+                    # Offset = vraie fin du fichier, pas la taille connue de l'index
+                    f.seek(0, os.SEEK_END)
+                    offset = f.tell() // 4
+                    f.write(elevations.tobytes())
+                self.index["profiles"][key] = [offset, len(elevations), float(distances[-1])]
+                self.index["size"] = offset + len(elevations)
+                self._save_index()
+            self._data = None  # le memmap sera rouvert avec la nouvelle taille
+        return distances, elevations
+
+    def stats(self):
+        return {
+            "profiles": len(self),
+            "samples": self.index["size"],
+            "size_mb": round(self.index["size"] * 4 / 1e6, 2),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+if __name__ == "__main__":
+    from configs.config_coords import END_DEVICE_LAT, END_DEVICE_LON
+    import visibility_store
+
+    parser = argparse.ArgumentParser(description="Persistent terrain profile cache")
+    parser.add_argument("--invalidate", action="store_true", help="Drop every cached profile")
+    parser.add_argument("--build", action="store_true", help="Compute the profiles of all known gateways")
+    args = parser.parse_args()
+
+    cache = ProfileCache(END_DEVICE_LAT, END_DEVICE_LON)
+    if args.invalidate:
+        cache.invalidate()
+    if args.build:
+        with closing(visibility_store.connect()) as conn:
+            gateways = conn.execute("SELECT gateway_id, lat, lon FROM gateways").fetchall()
+        for gateway_id, lat, lon in gateways:
+            cache.get(gateway_id, lat, lon)
+    print(cache.stats())
@@ -0,0 +1,194 @@
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+from configs.config_coords import END_DEVICE_LAT, END_DEVICE_LON
+from measurement_store import load_measurements
+import terrain_los
+from profile_cache import ProfileCache
+import calculate_igra
+
+# Mode batch : visibilité de chaque lien recalculée avec le gradient de réfractivité
+# mesuré ce jour-là (IGRA et/ou ERA5) au lieu de l'atmosphère standard (k = 4/3).
+IGRA_LINKS_JSON = "/app/output/igra-datas/map_links.json"
+GRIB_DIR = "/app/output/era5/grib"
+OUTPUT_CSV = "/app/output/data/refraction_los.csv"
+
+# Épaisseur de la couche basse utilisée pour le gradient effectif (ΔN sur le premier km)
+LAYER_THICKNESS_M = 1000
+
+OUTPUT_COLUMNS = ["gatewayId", "gateway_name", "date", "source", "reference",
+                  "dN_dh", "k_factor", "visibility_standard", "visibility_refraction",
+                  "min_clearance_m"]
+
+parser = argparse.ArgumentParser(description="LOS under the measured refraction of each day")
+parser.add_argument("--logs", action="store_true")
+parser.add_argument("--source", choices=["igra", "era5", "both"], default="igra")
+parser.add_argument("--fresnel", type=float, default=0.0,
+                    help="Required clear fraction of the first Fresnel zone (0 = direct ray only)")
+
+
+def log(*messages):
+    if args.logs:
+        print("[LOG]", *messages)
+
+
+def layer_gradient(heights, refractivity, thickness=LAYER_THICKNESS_M):
+    """Gradient moyen (N/km) entre le niveau le plus bas et `thickness` mètres au-dessus."""
+    order = np.argsort(heights)
+    heights = np.asarray(heights, dtype=float)[order]
+    refractivity = np.asarray(refractivity, dtype=float)[order]
+    if len(heights) < 2:
+        return None
+    top = min(heights[0] + thickness, heights[-1])
+    if top <= heights[0]:
+        return None
+    n_top = np.interp(top, heights, refractivity)
+    return (n_top - refractivity[0]) / (top - heights[0]) * 1000
+
+
+class IgraGradients:
+    """Gradient de la couche basse par (station, jour), moyenné sur les sondages du jour."""
+
+    def __init__(self):
+        self.links = {}
+        if os.path.exists(IGRA_LINKS_JSON):
+            with open(IGRA_LINKS_JSON, "r") as f:
+                self.links = json.load(f)
+        self.stations = None
+        self.cache = {}
+
+    def station_for(self, gw_id, gw_lat, gw_lon):
+        if gw_id in self.links:
+            return self.links[gw_id]["station_id"]
+        if self.stations is None:
+            self.stations = calculate_igra.get_stations()
+        if not self.stations:
+            return None
+        mid_lat, mid_lon = calculate_igra.spherical_midpoint(gw_lat, gw_lon, END_DEVICE_LAT, END_DEVICE_LON)
+        return self.stations.nearest(mid_lat, mid_lon)["id"]
+
+    def gradient(self, station_id, date):
+        key = (station_id, date)
+        if key not in self.cache:
+            self.cache[key] = None
+            igra_file = calculate_igra.download_igra_file(station_id)
+            if igra_file and os.path.exists(igra_file):
+                soundings = calculate_igra.parse_igra_derived_file(igra_file, date.year, date.month, date.day)
+                values = []
+                for sounding in soundings:
+                    if len(sounding["levels"]) >= 2:
+                        heights, refractivity = zip(*sounding["levels"])
+                        g = layer_gradient(heights, refractivity)
+                        if g is not None:
+                            values.append(g)
+                if values:
+                    self.cache[key] = float(np.mean(values))
+        return self.cache[key]
+
+
+class Era5Gradients:
+    """Gradient de la couche basse (layer_gradient) au point milieu du lien, moyenné sur les heures du jour."""
+
+    def __init__(self):
+        import era5_gradients
+        self.era5 = era5_gradients
+        self.days = {}
+
+    def _load_day(self, date_str):
+        if date_str not in self.days:
+            self.days[date_str] = None
+            grib_file = os.path.join(GRIB_DIR, f"era5_{date_str}.grib")
+            if os.path.exists(grib_file):
+                cube = self.era5.load_cube(grib_file)
+                self.days[date_str] = (self.era5.compute_cube(cube), cube["lats"], cube["lons"])
+        return self.days[date_str]
+
+    def gradient(self, lat, lon, date_str):
+        day = self._load_day(date_str)
+        if day is None:
+            return None
+        result, lats, lons = day
+        i, j = np.unravel_index(((lats - lat) ** 2 + (lons - lon) ** 2).argmin(), lats.shape)
+        heights = result["heights"][:, :, i, j]      # (temps, niveau)
+        refractivity = result["refractivity"][:, :, i, j]
+        # Même définition que pour IGRA (ΔN sur le premier km) pour chaque heure, puis moyenne du jour
+        per_hour = [g for g in map(layer_gradient, heights, refractivity) if g is not None]
+        return float(np.mean(per_hour)) if per_hour else None
+
+
+def load_done():
+    if not os.path.exists(OUTPUT_CSV):
+        return pd.DataFrame(columns=OUTPUT_COLUMNS)
+    return pd.read_csv(OUTPUT_CSV)
+
+
+def main():
+    links = load_measurements(columns=["gatewayId", "gateway_name", "gateway_lat", "gateway_long", "visibility"])
+    links = (links.astype({"gatewayId": str, "gateway_name": str})
+                  .drop_duplicates(subset=["gatewayId", "date"])
+                  .sort_values(["date", "gatewayId"]))
+
+    done = load_done()
+    done_keys = set(zip(done["gatewayId"].astype(str), done["date"].astype(str), done["source"].astype(str)))
+
+    sources = ["igra", "era5"] if args.source == "both" else [args.source]
+    igra = IgraGradients() if "igra" in sources else None
+    era5 = Era5Gradients() if "era5" in sources else None
+
+    profiles = ProfileCache(END_DEVICE_LAT, END_DEVICE_LON)  # profil de terrain persistant par gateway
+    results = []
+
+    for row in links.itertuples(index=False):
+        gw_id, date_str = row.gatewayId, row.date
+        date = pd.Timestamp(date_str)
+
+        for source in sources:
+            if (gw_id, date_str, source) in done_keys:
+                continue
+
+            if source == "igra":
+                reference = igra.station_for(gw_id, row.gateway_lat, row.gateway_long)
+                dn_dh = igra.gradient(reference, date) if reference else None
+            else:
+                mid_lat, mid_lon = calculate_igra.spherical_midpoint(row.gateway_lat, row.gateway_long,
+                                                                     END_DEVICE_LAT, END_DEVICE_LON)
+                reference = f"{mid_lat:.2f},{mid_lon:.2f}"
+                dn_dh = era5.gradient(mid_lat, mid_lon, date_str)
+
+            if dn_dh is None:
+                log(f"No {source} gradient for {row.gateway_name} on {date_str}")
+                continue
+
+            distances, elevations = profiles.get(gw_id, row.gateway_lat, row.gateway_long)
+
+            # Seule la courbure change d'un jour à l'autre
+            k = terrain_los.k_factor_from_gradient(dn_dh)
+            result = terrain_los.los_clearance(distances, elevations, k_factor=k)
+            visibility = terrain_los.classify(result, args.fresnel)
+
+            results.append({
+                "gatewayId": gw_id,
+                "gateway_name": row.gateway_name,
+                "date": date_str,
+                "source": source,
+                "reference": reference,
+                "dN_dh": round(dn_dh, 2),
+                "k_factor": round(k, 3),
+                "visibility_standard": row.visibility,
+                "visibility_refraction": visibility,
+                "min_clearance_m": round(result["min_clearance_m"], 2),
+            })
+            log(f"{row.gateway_name} {date_str} ({source}): dN/dh={dn_dh:.1f} N/km, k={k:.2f} -> {visibility}")
+
+    if results:
+        out = pd.concat([done, pd.DataFrame(results, columns=OUTPUT_COLUMNS)], ignore_index=True)
+        out.sort_values(["date", "gatewayId", "source"]).to_csv(OUTPUT_CSV, index=False)
+    log(f"Terrain profiles: {profiles.stats()}")
+    print(f"{len(results)} new links computed, saved in {OUTPUT_CSV}")
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    main()
@@ -0,0 +1,116 @@
+import os
+import time
+import importlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Rendu des graphes matplotlib dans un pool de processus. Un job est une donnée simple
+# (fonction de dessin "module:fonction", fichier de sortie, tableaux et titres) : les
+# processus n'échangent ni figures ni objets pygrib.
+RENDER_WORKERS = int(os.environ.get("RENDER_WORKERS", os.cpu_count() or 1))
+
+
+def _init_worker():
+    # Backend sans affichage choisi une fois par processus, avant tout import de pyplot
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot  # noqa: F401
+
+
+def _resolve(renderer):
+    module_name, function_name = renderer.split(":")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def render_job(job):
+    """
+    Exécute un job dans le processus courant : la fonction dessine dans un fichier
+    temporaire du même dossier, renommé ensuite (jamais de PNG à moitié écrit).
+    """
+    output = job["output"]
+    root, ext = os.path.splitext(output)
+    tmp = f"{root}.tmp-{os.getpid()}{ext}"
+    start = time.perf_counter()
+    try:
+        _resolve(job["renderer"])(tmp, **job.get("data", {}))
+        os.replace(tmp, output)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return output, time.perf_counter() - start
+
+
+def make_job(renderer, output, **data):
+    return {"renderer": renderer, "output": output, "data": data}
+
+
+class RenderPool:
+    """
+    Pool de rendu borné à `workers` processus (1 = rendu dans le processus courant,
+    sans pool). run() renvoie {fichier: True/False} et met à jour les métriques.
+    """
+
+    def __init__(self, workers=None, on_error=print):
+        self.workers = max(1, workers or RENDER_WORKERS)
+        self.on_error = on_error
+        self.executor = None
+        self.submitted = 0
+        self.rendered = 0
+        self.failed = 0
+        self.render_seconds = 0.0
+        self.wall_seconds = 0.0
+
+    def __enter__(self):
+        if self.workers > 1:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+        else:
+            _init_worker()
+        return self
+
+    def __exit__(self, *exc):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    def _done(self, job, result=None, error=None):
+        if error is None:
+            self.rendered += 1
+            self.render_seconds += result[1]
+            return True
+        self.failed += 1
+        self.on_error(f"[ERROR] Rendering {job['output']}: {error}")
+        return False
+
+    def run(self, jobs):
+        jobs = list(jobs)
+        self.submitted += len(jobs)
+        results = {}
+        start = time.perf_counter()
+
+        if self.executor is None:
+            for job in jobs:
+                try:
+                    results[job["output"]] = self._done(job, render_job(job))
+                except Exception as e:
+                    results[job["output"]] = self._done(job, error=e)
+        else:
+            futures = {self.executor.submit(render_job, job): job for job in jobs}
+            for future in as_completed(futures):
+                job = futures[future]
+                try:
+                    results[job["output"]] = self._done(job, future.result())
+                except Exception as e:
+                    results[job["output"]] = self._done(job, error=e)
+
+        self.wall_seconds += time.perf_counter() - start
+        return results
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "submitted": self.submitted,
+            "rendered": self.rendered,
+            "failed": self.failed,
+            "wall_s": round(self.wall_seconds, 2),
+            "plots_per_s": round(self.rendered / self.wall_seconds, 2) if self.wall_seconds else 0.0,
+            "avg_render_ms": round(1000 * self.render_seconds / self.rendered, 1) if self.rendered else 0.0,
+        }
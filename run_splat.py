@@ -1,11 +1,15 @@
-import csv
 import os
 import subprocess
-from collections import defaultdict
 import glob
 import shutil
 import argparse
+import tempfile
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from configs.config_coords import END_DEVICE_LAT, END_DEVICE_LON
+import visibility_store
+import terrain_los
+from profile_cache import ProfileCache
 
 GATEWAY_CSV = "/app/output/data/helium_gateway_data.csv"
 END_NODE_FILE = "/app/data/terrain/end_node.qth"
@@ -19,6 +23,13 @@ os.makedirs(IMG_DIR, exist_ok=True)
 
 parser = argparse.ArgumentParser()
 parser.add_argument("--logs", action="store_true")
+parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Number of SPLAT jobs run in parallel")
+parser.add_argument("--timeout", type=int, default=600, help="Timeout of one SPLAT job (seconds)")
+parser.add_argument("--backend", choices=["splat", "native"], default="splat",
+                    help="LOS engine: SPLAT! subprocess or native profile over the .hgt tiles")
+parser.add_argument("--k-factor", type=float, default=terrain_los.K_FACTOR, help="Effective earth radius factor (native backend)")
+parser.add_argument("--fresnel", type=float, default=0.0,
+                    help="Required clear fraction of the first Fresnel zone (native backend, 0 = direct ray only)")
 args = parser.parse_args()
 
 def log(*messages):
@@ -53,19 +64,25 @@ def generate_qth(name, lat, lon, alt, path):
         f.write(f"{name}\n{lat}\n{360-lon}\n{alt}m") # Pour que ce soit lisible par splat : lon = 360 - lon
         log(f"Generated QTH file: {path}")
 
-def run_splat(tx_qth, rx_qth, output_png, output_txt):
+def run_splat(tx_qth, rx_qth, output_png, output_txt, cwd=None, timeout=None):
     if os.path.exists(output_txt):
         log(f"SPLAT output already exists: {output_txt}, skip.")
         return 2
 
     # Exécute SPLAT en mode profil de terrain
     log("Running Splat...")
-    result = subprocess.run(
-        ["splat", "-t", tx_qth, "-r", rx_qth, "-d", SDF_DIR, "-metric", "-f", "5800", "-H", output_png],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True
-    )
+    try:
+        result = subprocess.run(
+            ["splat", "-t", tx_qth, "-r", rx_qth, "-d", SDF_DIR, "-metric", "-f", "5800", "-H", output_png],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            cwd=cwd,
+            timeout=timeout
+        )
+    except subprocess.TimeoutExpired:
+        log(f"SPLAT timeout after {timeout}s for {rx_qth}")
+        return 0
     # log(result.stdout)
     if result.returncode != 0:
         log(f"SPLAT error:\n{result.stderr}")
@@ -86,79 +103,124 @@ def is_nlos(splat_output):
         log(f"File {splat_output} not found.")
         return False
 
-def main():
-    generate_end_node()
-
-
-    with open(GATEWAY_CSV, newline="") as csvfile:
-        reader = csv.DictReader(csvfile)
-        rows = list(reader)
-    
-    fieldnames = reader.fieldnames
-
-    # Regrouper les lignes par nom de gateway
-    gateways = defaultdict(list)
-    for row in rows:
-        if row.get("visibility") == "N/A":
-            gateways[row["gateway_name"]].append(row)
-
-    for gw_name, gw_rows in gateways.items():
-        try:
-            sample_row = gw_rows[0]
-            gw_lat = float(sample_row["gateway_lat"])
-            gw_lon = float(sample_row["gateway_long"])
-            gw_alt = 3
-
-            gw_qth = f"{QTH_DIR}{gw_name}.qth"
-            generate_qth(gw_name, gw_lat, gw_lon, gw_alt, gw_qth)
-
-            log(f"Analysing {gw_name}...")
-
-            txt_path = f"End-node-to-{gw_name}.txt"
-            png_path = f"{gw_name}.png"
-
-            splat = run_splat(f"{END_NODE_FILE}", gw_qth, png_path, f"{RUNS_DIR}{txt_path}")
-
-            if splat:
-                if splat == 2:
-                    txt_path = f"{RUNS_DIR}{txt_path}" # Le run a déjà été fait
-
-                if not os.path.exists(txt_path):
-                    log(f"Splat file missing: {txt_path}")
-                    continue
-
-                los_result = "NLOS" if is_nlos(txt_path) else "LOS"
-                log(f"{gw_name}: {los_result}")
-
-                # Appliquer à toutes les lignes de cette gateway
-                for row in gw_rows:
-                    row["visibility"] = los_result
-
-        except Exception as e:
-            log(f"Error on gateway '{gw_name}': {e}")
-
-
-    log("Writing results...")
-    with open(GATEWAY_CSV, "w", newline="") as outcsv:
-        writer = csv.DictWriter(outcsv, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(rows)
-
-    print(f"Results saved in {GATEWAY_CSV}")
-
-    # Déplacer tous les fichiers
-    for file in glob.glob('End-node*.txt'):
+def move_outputs(work_dir):
+    """Déplace les rapports et images produits par SPLAT dans work_dir."""
+    for file in glob.glob(os.path.join(work_dir, 'End-node*.txt')):
         dest = os.path.join(RUNS_DIR, os.path.basename(file))
         if os.path.exists(dest):
             os.remove(dest)
         shutil.move(file, dest)
 
-    for file in glob.glob('*.png'):
+    for file in glob.glob(os.path.join(work_dir, '*.png')):
         dest = os.path.join(IMG_DIR, os.path.basename(file))
         if os.path.exists(dest):
             os.remove(dest)
         shutil.move(file, dest)
 
+def site_name(gw):
+    """
+    Nom du site SPLAT d'une gateway : son nom suivi d'une empreinte de (id, lat, lon).
+    SPLAT nomme son rapport d'après ce nom ; une gateway déplacée obtient donc de
+    nouveaux fichiers QTH et rapport au lieu de réutiliser ceux de l'ancienne position.
+    """
+    key = visibility_store.gateway_key(gw["gateway_id"], gw["lat"], gw["lon"])
+    digest = hashlib.sha1("|".join(str(part) for part in key).encode()).hexdigest()[:10]
+    return f"{gw['gateway_name']}-{digest}"
+
+def analyse_gateway(gw, timeout=None):
+    """
+    Job SPLAT d'une gateway. SPLAT écrit ses fichiers dans le dossier courant,
+    chaque job tourne donc dans son propre dossier temporaire.
+    Retourne "LOS", "NLOS" ou None en cas d'échec.
+    """
+    gw_name = site_name(gw)
+    gw_alt = 3
+
+    gw_qth = f"{QTH_DIR}{gw_name}.qth"
+    generate_qth(gw_name, gw["lat"], gw["lon"], gw_alt, gw_qth)
+
+    log(f"Analysing {gw_name}...")
+
+    txt_name = f"End-node-to-{gw_name}.txt"
+    work_dir = tempfile.mkdtemp(prefix="splat-", dir=RUNS_DIR)
+    try:
+        splat = run_splat(f"{END_NODE_FILE}", gw_qth, f"{gw_name}.png", f"{RUNS_DIR}{txt_name}",
+                          cwd=work_dir, timeout=timeout)
+        if not splat:
+            return None
+
+        move_outputs(work_dir)
+        txt_path = f"{RUNS_DIR}{txt_name}"
+        if not os.path.exists(txt_path):
+            log(f"Splat file missing: {txt_path}")
+            return None
+
+        return "NLOS" if is_nlos(txt_path) else "LOS"
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def analyse_gateway_native(gw, profiles):
+    """Même analyse que SPLAT mais avec le moteur natif (pas de sous-process ni de fichiers)."""
+    log(f"Analysing {gw['gateway_name']} (native)...")
+    distances, elevations = profiles.get(gw["gateway_id"], gw["lat"], gw["lon"])
+    visibility, result = terrain_los.analyse_profile(
+        distances, elevations, k_factor=args.k_factor, fresnel_fraction=args.fresnel
+    )
+    log(f"{gw['gateway_name']}: min clearance {result['min_clearance_m']:.1f} m, "
+        f"Fresnel ratio {result['fresnel_ratio']:.2f}")
+    return visibility
+
+def main():
+    generate_end_node()
+
+    # Migration unique : reprend les visibilités déjà écrites dans le CSV
+    seeded = visibility_store.seed_from_csv(GATEWAY_CSV)
+    if seeded:
+        log(f"Visibility table seeded with {seeded} gateways from {GATEWAY_CSV}")
+
+    # Seules les nouvelles gateways (visibilité pas encore calculée) sont analysées
+    pending = visibility_store.pending_gateways()
+    log(f"{len(pending)} gateways without visibility, {args.workers} workers")
+
+    # Un job par (gateway_id, lat, lon) : fichiers SPLAT et profils sont propres à chaque position
+    by_key = {visibility_store.gateway_key(gw["gateway_id"], gw["lat"], gw["lon"]): gw for gw in pending}
+
+    profiles = None
+    if args.backend == "native":
+        # Profils de terrain persistants : une gateway déjà vue n'est jamais ré-échantillonnée
+        profiles = ProfileCache(END_DEVICE_LAT, END_DEVICE_LON, terrain_los.HgtTiles(SDF_DIR))
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        if profiles is not None:
+            futures = {pool.submit(analyse_gateway_native, gw, profiles): key for key, gw in by_key.items()}
+        else:
+            futures = {pool.submit(analyse_gateway, gw, args.timeout): key for key, gw in by_key.items()}
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                log(f"Error on gateway '{by_key[key]['gateway_name']}' {key}: {e}")
+
+    # Fusion des résultats dans l'ordre des gateways, indépendamment de l'ordre de fin des jobs
+    for key in sorted(results):
+        los_result = results[key]
+        if los_result is None:
+            continue
+        gw = by_key[key]
+        log(f"{gw['gateway_name']} {key}: {los_result}")
+        # Une seule ligne par gateway, jointe aux mesures à la lecture
+        visibility_store.set_visibility(gw["gateway_id"], gw["lat"], gw["lon"], los_result)
+
+    # Signal pour les étapes suivantes du pipeline (IGRA, ERA5, carte)
+    if visibility_store.write_stamp():
+        log(f"Visibilities changed, {visibility_store.STAMP_FILE} updated")
+
+    if profiles is not None:
+        log(f"Terrain profiles: {profiles.stats()}")
+    print(f"Results saved in {visibility_store.DB_FILE}")
+
     return 0
 
 if __name__ == "__main__":
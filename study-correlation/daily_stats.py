@@ -1,14 +1,18 @@
+import os
+import sys
 from collections import defaultdict
 import pandas as pd
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from measurement_store import load_measurements
+
 DATA_FILE = "/app/output/data/helium_gateway_data.csv"
 OUTPUT_STATS = "/app/output/study-correlation/daily_propagation_stats.csv"
 
 
 def calculate_daily_propagation_stats():
     try:
-        df = pd.read_csv(DATA_FILE)
-        df['date'] = pd.to_datetime(df['gwTime'], format='ISO8601').dt.strftime('%Y-%m-%d')
+        df = load_measurements(csv_file=DATA_FILE)
     except Exception as e:
         print(f"Erreur lors de la lecture du fichier : {e}")
         return
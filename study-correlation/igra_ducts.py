@@ -1,6 +1,10 @@
 import datetime
 import pandas as pd
 import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from igra_reader import IgraStation
 
 
 FIRST_DAY = datetime.datetime.strptime("2025-06-28", '%Y-%m-%d')
@@ -17,43 +21,6 @@ os.makedirs("/app/output/study-correlation/", exist_ok=True)
 
 DUCT_THRESHOLD = -157
 
-def parse_igra_derived_file(filepath, target_year, target_month, target_day):
-    with open(filepath, 'r') as file:
-        lines = file.readlines()
-
-    data = []
-    current_sounding = None
-    inside_target_day = False
-
-    for line in lines:
-        if line.startswith('#'):
-            year = int(line[13:17])
-            month = int(line[18:20])
-            day = int(line[21:23])
-
-            if year == target_year and month == target_month and day == target_day:
-                inside_target_day = True
-                if current_sounding:
-                    data.append(current_sounding)
-                current_sounding = {'date': (year, month, day), 'levels': []}
-            else:
-                inside_target_day = False
-        elif inside_target_day and current_sounding:
-            try:
-                height = int(line[16:23].strip())
-                N = int(line[144:151].strip())
-                if height != -99999 and N != -99999:
-                    current_sounding['levels'].append((height, N))
-            except ValueError:
-                continue
-            except ValueError:
-                continue
-
-    if current_sounding and current_sounding['levels']:
-        data.append(current_sounding)
-
-    return data
-
 def compute_gradients(levels):
     gradients = []
     for i in range(len(levels) - 1):
@@ -99,14 +66,7 @@ def detect_duct_zones(gradients, threshold = DUCT_THRESHOLD):
     
     return duct_zones
 
-def analyze_ducting_for_date(date):
-    data = parse_igra_derived_file(
-        IGRA_FILE, 
-        date.year, 
-        date.month, 
-        date.day
-    )
-    
+def analyze_ducting_for_date(date, data):
     if not data or not data[0]['levels']:
         return None
     
@@ -143,9 +103,12 @@ def main():
     results = []
     current_date = FIRST_DAY
 
+    # Le fichier de la station est parsé une seule fois, puis découpé par jour
+    soundings_by_day = IgraStation(IGRA_FILE).days(FIRST_DAY, END_DAY)
+
     while current_date <= END_DAY:
         print(f"Processing {current_date.strftime('%Y-%m-%d')}...")
-        analysis = analyze_ducting_for_date(current_date)
+        analysis = analyze_ducting_for_date(current_date, soundings_by_day.get(current_date.date()))
         
         if analysis is None:
             print(f"No data for {current_date.strftime('%Y-%m-%d')}")
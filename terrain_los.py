@@ -0,0 +1,242 @@
+import os
+import glob
+import math
+import argparse
+import numpy as np
+
+# Moteur LOS/NLOS natif : profil de terrain sur les tuiles SRTM (.hgt) déjà
+# téléchargées par download_terrain.py, à la place du rapport texte de SPLAT.
+HGT_DIR = "/app/maps/"
+RUNS_DIR = "/app/output/splat-runs/"
+QTH_DIR = "/app/data/terrain/"
+
+EARTH_RADIUS_M = 6371000.0
+K_FACTOR = 4 / 3             # atmosphère standard
+FREQUENCY_MHZ = 5800         # même fréquence que l'appel SPLAT (-f 5800)
+SAMPLE_STEP_M = 90.0         # résolution SRTM3
+
+# Hauteurs des antennes comme dans les fichiers QTH générés par run_splat :
+# "3" sans unité pour l'end-node (pieds pour SPLAT), "3m" pour les gateways
+END_NODE_HEIGHT_M = 3 * 0.3048
+GATEWAY_HEIGHT_M = 3.0
+
+SRTM_VOID = -32768
+
+
+def tile_name(lat, lon):
+    ns = 'N' if lat >= 0 else 'S'
+    ew = 'E' if lon >= 0 else 'W'
+    return f"{ns}{abs(lat):02d}{ew}{abs(lon):03d}"
+
+
+class HgtTiles:
+    """Accès mémoire-mappé aux tuiles .hgt (int16 big-endian, ligne 0 = bord nord)."""
+
+    def __init__(self, hgt_dir=HGT_DIR):
+        self.hgt_dir = hgt_dir
+        self._tiles = {}
+
+    def tile(self, lat_floor, lon_floor):
+        key = (lat_floor, lon_floor)
+        if key not in self._tiles:
+            path = os.path.join(self.hgt_dir, f"{tile_name(lat_floor, lon_floor)}.hgt")
+            if os.path.exists(path):
+                size = int(round(math.sqrt(os.path.getsize(path) // 2)))
+                self._tiles[key] = np.memmap(path, dtype='>i2', mode='r', shape=(size, size))
+            else:
+                # Tuile absente (mer) : altitude 0 comme SPLAT
+                self._tiles[key] = None
+        return self._tiles[key]
+
+    def elevation(self, lats, lons):
+        """Altitudes (m) interpolées bilinéairement pour des tableaux de coordonnées."""
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        heights = np.zeros(lats.shape, dtype=np.float64)
+
+        lat_floor = np.floor(lats).astype(np.int64)
+        lon_floor = np.floor(lons).astype(np.int64)
+        tile_ids = lat_floor * 1000 + lon_floor
+        for tile_id in np.unique(tile_ids):
+            mask = tile_ids == tile_id
+            la, lo = int(lat_floor[mask][0]), int(lon_floor[mask][0])
+            data = self.tile(la, lo)
+            if data is None:
+                continue
+            n = data.shape[0] - 1
+            row = (la + 1 - lats[mask]) * n
+            col = (lons[mask] - lo) * n
+            r0 = np.clip(np.floor(row).astype(np.int64), 0, n - 1)
+            c0 = np.clip(np.floor(col).astype(np.int64), 0, n - 1)
+            fr = row - r0
+            fc = col - c0
+
+            z00 = data[r0, c0].astype(np.float64)
+            z01 = data[r0, c0 + 1].astype(np.float64)
+            z10 = data[r0 + 1, c0].astype(np.float64)
+            z11 = data[r0 + 1, c0 + 1].astype(np.float64)
+            corners = np.stack([z00, z01, z10, z11])
+            corners[corners == SRTM_VOID] = 0.0
+
+            heights[mask] = (corners[0] * (1 - fr) * (1 - fc) + corners[1] * (1 - fr) * fc
+                             + corners[2] * fr * (1 - fc) + corners[3] * fr * fc)
+        return heights
+
+
+def great_circle_points(lat1, lon1, lat2, lon2, n_points):
+    """Points régulièrement espacés sur le grand cercle + distance totale (m)."""
+    phi1, lam1, phi2, lam2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    p1 = np.array([math.cos(phi1) * math.cos(lam1), math.cos(phi1) * math.sin(lam1), math.sin(phi1)])
+    p2 = np.array([math.cos(phi2) * math.cos(lam2), math.cos(phi2) * math.sin(lam2), math.sin(phi2)])
+    omega = math.acos(max(-1.0, min(1.0, float(p1 @ p2))))
+
+    t = np.linspace(0.0, 1.0, n_points)
+    if omega < 1e-12:
+        points = np.outer(1 - t, p1) + np.outer(t, p2)
+    else:
+        points = (np.outer(np.sin((1 - t) * omega), p1) + np.outer(np.sin(t * omega), p2)) / math.sin(omega)
+
+    lats = np.degrees(np.arctan2(points[:, 2], np.hypot(points[:, 0], points[:, 1])))
+    lons = np.degrees(np.arctan2(points[:, 1], points[:, 0]))
+    return lats, lons, omega * EARTH_RADIUS_M
+
+
+def terrain_profile(tiles, lat1, lon1, lat2, lon2, step_m=SAMPLE_STEP_M):
+    """Distances depuis le point 1 (m) et altitudes du terrain le long du trajet."""
+    _, _, total = great_circle_points(lat1, lon1, lat2, lon2, 2)
+    n_points = max(2, int(math.ceil(total / step_m)) + 1)
+    lats, lons, total = great_circle_points(lat1, lon1, lat2, lon2, n_points)
+    distances = np.linspace(0.0, total, n_points)
+    return distances, tiles.elevation(lats, lons)
+
+
+def k_factor_from_gradient(dn_dh):
+    """
+    Facteur k du rayon terrestre effectif pour un gradient de réfractivité (N/km) :
+    k = 1 / (1 + R * dN/dh * 1e-6). Infini au seuil de ducting (-157 N/km),
+    négatif en dessous (rayon courbé plus que la Terre).
+    """
+    denominator = 1 + (EARTH_RADIUS_M / 1000) * dn_dh * 1e-6
+    return float("inf") if denominator == 0 else 1 / denominator
+
+
+def earth_bulge(distances, total, k_factor=K_FACTOR):
+    """Renflement de la Terre (m) au-dessus de la corde, rayon effectif k * R (k infini ou négatif accepté)."""
+    return distances * (total - distances) / (2 * EARTH_RADIUS_M) * (1 / k_factor)
+
+
+def fresnel_radius(distances, total, frequency_mhz=FREQUENCY_MHZ):
+    """Rayon de la première zone de Fresnel (m)."""
+    wavelength = 299792458.0 / (frequency_mhz * 1e6)
+    with np.errstate(invalid="ignore"):
+        return np.sqrt(np.clip(wavelength * distances * (total - distances) / total, 0, None))
+
+
+def los_clearance(distances, elevations, tx_height=END_NODE_HEIGHT_M, rx_height=GATEWAY_HEIGHT_M,
+                  k_factor=K_FACTOR, frequency_mhz=FREQUENCY_MHZ):
+    """
+    Analyse d'un profil : hauteur libre minimale sous le rayon direct et fraction
+    minimale de la première zone de Fresnel dégagée.
+    """
+    total = float(distances[-1])
+    if total <= 0:
+        return {"nlos": False, "min_clearance_m": float("inf"), "fresnel_ratio": float("inf"),
+                "obstruction_km": None}
+
+    tx = elevations[0] + tx_height
+    rx = elevations[-1] + rx_height
+    ray = tx + (rx - tx) * distances / total
+    bulge = earth_bulge(distances, total, k_factor)
+    clearance = (ray - (elevations + bulge))[1:-1]
+    if clearance.size == 0:
+        return {"nlos": False, "min_clearance_m": float("inf"), "fresnel_ratio": float("inf"),
+                "obstruction_km": None}
+
+    radius = fresnel_radius(distances, total, frequency_mhz)[1:-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(radius > 0, clearance / radius, np.inf)
+
+    worst = int(np.argmin(clearance))
+    blocked = clearance[worst] < 0
+    return {
+        "nlos": bool(blocked),
+        "min_clearance_m": float(clearance[worst]),
+        "fresnel_ratio": float(np.min(ratio)),
+        "obstruction_km": float(distances[1:-1][worst] / 1000) if blocked else None,
+    }
+
+
+def classify(result, fresnel_fraction=0.0):
+    """
+    LOS/NLOS depuis le résultat de los_clearance. Avec fresnel_fraction=0 on garde
+    le critère de SPLAT (rayon direct obstrué), 0.6 exige 60 % de la zone de Fresnel.
+    """
+    if fresnel_fraction > 0:
+        return "NLOS" if result["fresnel_ratio"] < fresnel_fraction else "LOS"
+    return "NLOS" if result["nlos"] else "LOS"
+
+
+def analyse_profile(distances, elevations, k_factor=K_FACTOR, frequency_mhz=FREQUENCY_MHZ, fresnel_fraction=0.0):
+    result = los_clearance(distances, elevations, k_factor=k_factor, frequency_mhz=frequency_mhz)
+    return classify(result, fresnel_fraction), result
+
+
+def analyse_link(tiles, end_lat, end_lon, gw_lat, gw_lon, k_factor=K_FACTOR,
+                 frequency_mhz=FREQUENCY_MHZ, fresnel_fraction=0.0):
+    distances, elevations = terrain_profile(tiles, end_lat, end_lon, gw_lat, gw_lon)
+    return analyse_profile(distances, elevations, k_factor, frequency_mhz, fresnel_fraction)
+
+
+def read_qth(path):
+    """Nom, latitude et longitude d'un fichier QTH (longitude écrite 360 - lon)."""
+    with open(path, "r") as f:
+        name, lat, lon = [f.readline().strip() for _ in range(3)]
+    return name, float(lat), 360 - float(lon)
+
+
+def validate(end_lat, end_lon, runs_dir=RUNS_DIR, qth_dir=QTH_DIR, hgt_dir=HGT_DIR,
+             k_factor=K_FACTOR, fresnel_fraction=0.0):
+    """Compare le moteur natif aux rapports SPLAT déjà présents dans splat-runs/."""
+    tiles = HgtTiles(hgt_dir)
+    confusion = {}
+    disagreements = []
+    for report in sorted(glob.glob(os.path.join(runs_dir, "End-node-to-*.txt"))):
+        name = os.path.basename(report)[len("End-node-to-"):-len(".txt")]
+        qth = os.path.join(qth_dir, f"{name}.qth")
+        if not os.path.exists(qth):
+            continue
+        with open(report, "r", encoding="latin1") as f:
+            splat = "NLOS" if "detected obstructions at" in f.read().lower() else "LOS"
+        _, gw_lat, gw_lon = read_qth(qth)
+        native, result = analyse_link(tiles, end_lat, end_lon, gw_lat, gw_lon, k_factor,
+                                      fresnel_fraction=fresnel_fraction)
+        confusion[(splat, native)] = confusion.get((splat, native), 0) + 1
+        if splat != native:
+            disagreements.append((name, splat, native, result["min_clearance_m"]))
+    return confusion, disagreements
+
+
+if __name__ == "__main__":
+    from configs.config_coords import END_DEVICE_LAT, END_DEVICE_LON
+
+    parser = argparse.ArgumentParser(description="Native terrain LOS engine")
+    parser.add_argument("--validate", action="store_true", help="Cross-validate against stored SPLAT reports")
+    parser.add_argument("--link", nargs=2, type=float, metavar=("LAT", "LON"), help="Analyse one gateway")
+    parser.add_argument("--k-factor", type=float, default=K_FACTOR)
+    parser.add_argument("--fresnel", type=float, default=0.0, help="Required fraction of the first Fresnel zone")
+    args = parser.parse_args()
+
+    if args.validate:
+        confusion, disagreements = validate(END_DEVICE_LAT, END_DEVICE_LON, k_factor=args.k_factor,
+                                            fresnel_fraction=args.fresnel)
+        total = sum(confusion.values())
+        agree = confusion.get(("LOS", "LOS"), 0) + confusion.get(("NLOS", "NLOS"), 0)
+        print(f"SPLAT vs native on {total} links: {agree} agree ({100 * agree / total if total else 0:.1f} %)")
+        for (splat, native), count in sorted(confusion.items()):
+            print(f"  SPLAT {splat:<4} / native {native:<4} : {count}")
+        for name, splat, native, clearance in disagreements:
+            print(f"  [DIFF] {name}: SPLAT={splat} native={native} (min clearance {clearance:.1f} m)")
+    elif args.link:
+        visibility, result = analyse_link(HgtTiles(), END_DEVICE_LAT, END_DEVICE_LON, *args.link,
+                                          k_factor=args.k_factor, fresnel_fraction=args.fresnel)
+        print(visibility, result)
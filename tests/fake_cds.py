@@ -0,0 +1,68 @@
+"""CDS local et fichiers GRIB minimaux pour tester era5_download.py hors ligne."""
+import datetime
+
+from era5_download import CdsClient
+
+
+class FakeCdsClient(CdsClient):
+    """
+    CDS local pour travailler hors ligne : chaque requête est prête après `polls`
+    appels à status() et `writer(request, target)` écrit le fichier GRIB.
+    `failing` : identifiants de requête dont le statut est "failed".
+    """
+
+    def __init__(self, writer, polls=1):
+        self.writer = writer
+        self.polls = polls
+        self.requests = {}
+        self.pending_polls = {}
+        self.failing = set()
+
+    def submit(self, dataset, request):
+        request_id = f"fake-{len(self.requests) + 1}"
+        self.requests[request_id] = (dataset, request)
+        self.pending_polls[request_id] = self.polls
+        return request_id
+
+    def status(self, request_id):
+        if request_id not in self.requests or request_id in self.failing:
+            return "failed"
+        if self.pending_polls[request_id] > 0:
+            self.pending_polls[request_id] -= 1
+            return "running"
+        return "completed"
+
+    def download(self, request_id, target):
+        self.writer(self.requests[request_id][1], target)
+
+
+def grib1_header_message(date, hour, payload=b""):
+    """Message GRIB1 réduit aux en-têtes lus par grib_messages (section 1 de 28 octets)."""
+    pds = bytearray(28)
+    pds[0:3] = (28).to_bytes(3, "big")
+    pds[12], pds[13], pds[14], pds[15] = date.year % 100 or 100, date.month, date.day, hour
+    pds[24] = (date.year - 1) // 100 + 1
+    length = 8 + len(pds) + len(payload) + 4
+    return b"GRIB" + length.to_bytes(3, "big") + bytes([1]) + bytes(pds) + payload + b"7777"
+
+
+def grib2_header_message(date, hour, payload=b""):
+    """Message GRIB2 réduit aux sections 0 et 1."""
+    section1 = bytearray(21)
+    section1[0:4] = (21).to_bytes(4, "big")
+    section1[4] = 1
+    section1[12:14] = date.year.to_bytes(2, "big")
+    section1[14], section1[15], section1[16] = date.month, date.day, hour
+    length = 16 + len(section1) + len(payload) + 4
+    return b"GRIB" + bytes(2) + bytes([0, 2]) + length.to_bytes(8, "big") + bytes(section1) + payload + b"7777"
+
+
+def grib_writer(times=("00:00", "12:00"), message=grib1_header_message):
+    """writer(request, target) : un message par jour et par heure demandés, dans l'ordre du CDS."""
+    def write(request, target):
+        with open(target, "wb") as f:
+            for day in request["day"]:
+                date = datetime.date(int(request["year"]), int(request["month"]), int(day))
+                for time_str in request.get("time", times):
+                    f.write(message(date, int(time_str[:2]), payload=f"{date}T{time_str}".encode()))
+    return write
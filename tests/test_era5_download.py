@@ -0,0 +1,117 @@
+import os
+import json
+import datetime
+
+import pytest
+
+from era5_download import DownloadPlanner, CdsClient, grib_messages, month_batches, split_by_day
+from tests.fake_cds import FakeCdsClient, grib_writer, grib1_header_message, grib2_header_message
+
+DATASET = "reanalysis-era5-pressure-levels"
+TIMES = ["00:00", "12:00"]
+
+
+def request_for(days):
+    return {"year": days[0][:4], "month": days[0][5:7], "day": [day[8:10] for day in days], "time": TIMES}
+
+
+def planner(client, grib_dir, **kwargs):
+    return DownloadPlanner(client, DATASET, request_for, str(grib_dir), poll_seconds=0, log=lambda *a: None, **kwargs)
+
+
+def days_between(start, end):
+    day = datetime.date.fromisoformat(start)
+    while day <= datetime.date.fromisoformat(end):
+        yield day.isoformat()
+        day += datetime.timedelta(days=1)
+
+
+def test_cds_client_is_abstract():
+    with pytest.raises(TypeError):
+        CdsClient()
+
+
+def test_month_batches_group_sorted_unique_days():
+    batches = month_batches(["2025-07-02", "2025-06-30", "2025-07-01", "2025-07-02"])
+    assert batches == {"2025-06": ["2025-06-30"], "2025-07": ["2025-07-01", "2025-07-02"]}
+
+
+def test_plan_batches_missing_days_by_month(tmp_path):
+    (tmp_path / "era5_2025-06-29.grib").write_bytes(b"")
+    dl = planner(FakeCdsClient(grib_writer()), tmp_path)
+    missing = dl.plan(list(days_between("2025-06-28", "2025-07-02")))
+
+    assert missing == ["2025-06-28", "2025-06-30", "2025-07-01", "2025-07-02"]
+    assert sorted(batch["days"] for batch in dl.batches.values()) == [
+        ["2025-06-28", "2025-06-30"], ["2025-07-01", "2025-07-02"]]
+    # Déjà planifiés : pas de second lot pour les mêmes jours
+    assert dl.plan(list(days_between("2025-06-28", "2025-07-02"))) == []
+    assert len(dl.batches) == 2
+
+
+def test_run_submits_one_request_per_month_and_splits_by_day(tmp_path):
+    client = FakeCdsClient(grib_writer(), polls=2)
+    days = list(days_between("2025-05-30", "2025-07-02"))
+    dl = planner(client, tmp_path, max_parallel=2)
+
+    active = []
+    step = dl.step
+    dl.step = lambda: (active.append(len(dl.active())), step())[1]
+    assert dl.run(days) == days
+
+    assert len(client.requests) == 3
+    assert max(active) <= 2
+    for day in days:
+        with open(tmp_path / f"era5_{day}.grib", "rb") as f:
+            messages = list(grib_messages(f.read()))
+        assert [message_day for message_day, _, _ in messages] == [day] * len(TIMES)
+    # Fichiers mensuels supprimés, plus rien en cours
+    assert not list(tmp_path.glob("era5_batch_*"))
+    with open(tmp_path / "downloads.json") as f:
+        assert json.load(f) == {}
+
+
+def test_restart_resumes_submitted_requests_from_state_file(tmp_path):
+    client = FakeCdsClient(grib_writer(), polls=3)
+    days = list(days_between("2025-06-01", "2025-07-31"))
+    first = planner(client, tmp_path)
+    first.plan(days)
+    first.step()
+    submitted = {key: batch["request_id"] for key, batch in first.batches.items()}
+    assert len(submitted) == 2 and all(submitted.values())
+
+    # Nouveau processus : l'état est relu, les requêtes en cours ne sont pas resoumises
+    second = planner(client, tmp_path)
+    assert {key: batch["request_id"] for key, batch in second.batches.items()} == submitted
+    assert second.run(days) == days
+    assert len(client.requests) == 2
+
+
+def test_failed_request_is_dropped_then_planned_again(tmp_path):
+    client = FakeCdsClient(grib_writer())
+    dl = planner(client, tmp_path)
+    dl.plan(["2025-06-10"])
+    dl.step()
+    client.failing.add(next(iter(dl.batches.values()))["request_id"])
+    assert dl.step() is False
+    assert dl.batches == {}
+
+    client.failing.clear()
+    assert dl.run(["2025-06-10"]) == ["2025-06-10"]
+    assert len(client.requests) == 2
+
+
+@pytest.mark.parametrize("message", [grib1_header_message, grib2_header_message])
+def test_split_by_day_copies_messages_unchanged(tmp_path, message):
+    june = [datetime.date(2025, 6, day) for day in (1, 2, 3)]
+    messages = {date.isoformat(): [message(date, hour, payload=bytes([hour]) * 5) for hour in (0, 6, 12)]
+                for date in june}
+    batch = tmp_path / "batch.grib"
+    batch.write_bytes(b"".join(b"".join(parts) for parts in messages.values()))
+
+    # Seuls les jours demandés sont écrits
+    assert split_by_day(str(batch), str(tmp_path), ["2025-06-01", "2025-06-03", "2025-06-04"]) == [
+        "2025-06-01", "2025-06-03"]
+    for day in ("2025-06-01", "2025-06-03"):
+        assert (tmp_path / f"era5_{day}.grib").read_bytes() == b"".join(messages[day])
+    assert not os.path.exists(tmp_path / "era5_2025-06-02.grib")
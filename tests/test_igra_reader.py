@@ -0,0 +1,54 @@
+import numpy as np
+
+import igra_reader
+from igra_reader import HEADER_FIELDS, LEVEL_FIELDS, MISSING
+
+
+def fixed_line(fields, values, width, first=" "):
+    """Ligne à colonnes fixes : chaque valeur alignée à droite dans son champ (None = blanc)."""
+    line = [first] + [" "] * (width - 1)
+    for name, value in values.items():
+        start, end = fields[name][:2]
+        if value is not None:
+            line[start:end] = str(value).rjust(end - start)
+    return "".join(line).rstrip()
+
+
+def header(year=2025, month=6, day=14, hour=12):
+    return fixed_line(HEADER_FIELDS, {"year": year, "month": month, "day": day, "hour": hour, "numlev": 3}, 71, "#")
+
+
+def level(height, refractivity):
+    return fixed_line(LEVEL_FIELDS, {"pressure": 100000, "height": height, "temperature": 2931,
+                                     "refractivity": refractivity}, 151)
+
+
+def parse(lines):
+    return igra_reader.parse_buffer(np.frombuffer("\n".join(lines).encode(), dtype=np.uint8))
+
+
+def test_blank_and_truncated_fields_are_missing():
+    lines = [header(), level(120, 320), level(None, 310), level(900, 300)]
+    lines[3] = lines[3][:147]  # N coupé par la fin de ligne
+    lines.append(level(1500, None)[:30])  # ligne tronquée avant N
+
+    soundings, levels = parse(lines)
+    assert levels["height"][0] == 120 and levels["height"][2] == 900
+    assert np.isnan(levels["height"][1]) and np.isnan(levels["refractivity"][2])
+    assert np.isnan(levels["refractivity"][3]) and np.isnan(levels["vapour_pressure"]).all()
+    assert levels["refractivity"][0] == 320
+    # Comme l'ancien int(line[...].strip()) : seuls les niveaux complets restent
+    assert igra_reader.as_legacy(soundings, levels) == [{"date": (2025, 6, 14), "levels": [(120, 320)]}]
+
+
+def test_missing_value_and_negative_numbers():
+    soundings, levels = parse([header(), level(MISSING, -5), level(-20, 280)])
+    assert np.isnan(levels["height"][0]) and levels["refractivity"][0] == -5
+    assert levels["height"][1] == -20
+
+
+def test_blank_header_fields():
+    soundings, _ = parse([header(hour=None), level(120, 320), header(month=None), level(120, 320)])
+    assert soundings["hour"].tolist() == [99, 12]
+    assert soundings["time"][0] == np.datetime64("2025-06-14T00", "h")
+    assert np.isnat(soundings["time"][1])
@@ -0,0 +1,73 @@
+import json
+import time
+
+import ingest_queue
+from ingest_queue import IngestQueue
+
+
+class Steps:
+    """Étapes enregistrées ; `failures[nom]` : nombre d'échecs avant de réussir."""
+
+    def __init__(self, failures=None):
+        self.failures = dict(failures or {})
+        self.calls = {"csv": [], "index": []}
+
+    def step(self, name):
+        def run(messages, rows):
+            if self.failures.get(name, 0) > 0:
+                self.failures[name] -= 1
+                raise OSError(f"{name} locked")
+            self.calls[name].extend(rows)
+        return name, run
+
+    def all(self):
+        return [self.step("csv"), self.step("index")]
+
+
+def make_queue(steps, tmp_path, **kwargs):
+    return IngestQueue(steps.all(), flush_ms=10, on_error=lambda *a: None,
+                       spill_file=str(tmp_path / "spill.jsonl"), **kwargs)
+
+
+def test_failed_step_is_retried_without_rewriting_previous_steps(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest_queue, "RETRY_MIN_S", 0.01)
+    steps = Steps({"index": 3})
+    q = make_queue(steps, tmp_path).start()
+    for i in range(5):
+        assert q.put(f"m{i}", [i])
+    deadline = time.monotonic() + 5
+    while q.stats()["written_rows"] < 5 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert q.close(timeout=5)
+
+    assert steps.calls["csv"] == [0, 1, 2, 3, 4]
+    assert steps.calls["index"] == [0, 1, 2, 3, 4]
+    stats = q.stats()
+    assert stats["flush_errors"] == 3 and stats["written_rows"] == 5 and stats["spilled_rows"] == 0
+    assert not (tmp_path / "spill.jsonl").exists()
+
+
+def test_unfinished_batch_is_saved_with_its_done_steps_and_resumed(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest_queue, "RETRY_MIN_S", 60)
+    steps = Steps({"index": 1})
+    q = make_queue(steps, tmp_path).start()
+    q.put("m0", [0])
+    while not q.stats()["flush_errors"]:
+        time.sleep(0.01)
+    # Arrivé pendant l'attente du nouvel essai : lot à part, aucune étape faite
+    q.put("m1", [1])
+    steps.failures["index"] = 2
+    q.close(timeout=5)
+
+    with open(tmp_path / "spill.jsonl") as f:
+        saved = [json.loads(line) for line in f]
+    assert [(batch["rows"], batch["done"]) for batch in saved] == [([0], ["csv"]), ([1], ["csv"])]
+    assert steps.calls == {"csv": [0, 1], "index": []}
+
+    # Redémarrage : seules les étapes manquantes sont refaites
+    resumed = Steps()
+    q = make_queue(resumed, tmp_path).start()
+    q.close(timeout=5)
+    assert resumed.calls == {"csv": [], "index": [0, 1]}
+    assert q.stats()["replayed_rows"] == 2
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,179 @@
+import os
+import csv
+import sqlite3
+from contextlib import closing
+from datetime import datetime, timezone
+
+# Visibilité LOS/NLOS stockée une seule fois par gateway (id + coordonnées),
+# puis jointe aux mesures au moment de la lecture.
+DB_FILE = "/app/output/data/gateway_visibility.sqlite"
+
+# Réécrit par run_splat seulement quand des visibilités ont changé : c'est la sortie suivie
+# par le pipeline de main.py, la base et son WAL changeant aussi à chaque lot du webhook
+STAMP_FILE = "/app/output/data/gateway_visibility.stamp"
+
+# Précision des coordonnées dans la clé (~1 m), la même que l'index des gateways
+COORD_DIGITS = 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS gateways (
+    gateway_id   TEXT NOT NULL,
+    lat          REAL NOT NULL,
+    lon          REAL NOT NULL,
+    gateway_name TEXT,
+    visibility   TEXT,
+    updated_at   TEXT,
+    PRIMARY KEY (gateway_id, lat, lon)
+);
+CREATE INDEX IF NOT EXISTS idx_pending ON gateways (visibility) WHERE visibility IS NULL;
+"""
+
+
+def gateway_key(gateway_id, lat, lon):
+    return (str(gateway_id), round(float(lat), COORD_DIGITS), round(float(lon), COORD_DIGITS))
+
+
+def connect(db_file=DB_FILE):
+    os.makedirs(os.path.dirname(db_file), exist_ok=True)
+    conn = sqlite3.connect(db_file, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def register_gateways(rows, db_file=DB_FILE):
+    """Enregistre les gateways encore inconnues (visibilité à calculer par run_splat)."""
+    keys = {}
+    for row in rows:
+        try:
+            key = gateway_key(row["gatewayId"], row["gateway_lat"], row["gateway_long"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        keys[key] = row.get("gateway_name")
+    if not keys:
+        return 0
+    with closing(connect(db_file)) as conn, conn:
+        cursor = conn.executemany(
+            "INSERT OR IGNORE INTO gateways (gateway_id, lat, lon, gateway_name) VALUES (?, ?, ?, ?)",
+            [(*key, name) for key, name in keys.items()],
+        )
+        return cursor.rowcount
+
+
+def pending_gateways(db_file=DB_FILE):
+    """Gateways dont la visibilité n'a pas encore été calculée."""
+    with closing(connect(db_file)) as conn:
+        return [
+            {"gateway_id": gw_id, "lat": lat, "lon": lon, "gateway_name": name}
+            for gw_id, lat, lon, name in conn.execute(
+                "SELECT gateway_id, lat, lon, gateway_name FROM gateways WHERE visibility IS NULL "
+                "ORDER BY gateway_name, gateway_id, lat, lon"
+            )
+        ]
+
+
+def set_visibility(gateway_id, lat, lon, visibility, db_file=DB_FILE):
+    with closing(connect(db_file)) as conn, conn:
+        conn.execute(
+            "UPDATE gateways SET visibility = ?, updated_at = ? WHERE gateway_id = ? AND lat = ? AND lon = ?",
+            (visibility, datetime.now(timezone.utc).isoformat(), *gateway_key(gateway_id, lat, lon)),
+        )
+
+
+def write_stamp(db_file=DB_FILE, stamp_file=STAMP_FILE):
+    """Nombre de visibilités calculées et dernière mise à jour ; le fichier n'est réécrit que s'ils ont changé."""
+    with closing(connect(db_file)) as conn:
+        count, updated_at = conn.execute("SELECT COUNT(visibility), MAX(updated_at) FROM gateways").fetchone()
+    content = f"{count} {updated_at}\n"
+    try:
+        with open(stamp_file, "r") as f:
+            if f.read() == content:
+                return False
+    except FileNotFoundError:
+        pass
+    tmp = f"{stamp_file}.tmp-{os.getpid()}"
+    with open(tmp, "w") as f:
+        f.write(content)
+    os.replace(tmp, stamp_file)
+    return True
+
+
+def visibility_map(db_file=DB_FILE):
+    """{(gateway_id, lat, lon): 'LOS'/'NLOS'} pour toutes les gateways déjà calculées."""
+    if not os.path.exists(db_file):
+        return {}
+    with closing(connect(db_file)) as conn:
+        return {
+            (gw_id, lat, lon): visibility
+            for gw_id, lat, lon, visibility in conn.execute(
+                "SELECT gateway_id, lat, lon, visibility FROM gateways WHERE visibility IS NOT NULL"
+            )
+        }
+
+
+def version(db_file=DB_FILE):
+    """Taille et date de la base et de son journal WAL : change à chaque écriture."""
+    signature = []
+    for path in (db_file, db_file + "-wal"):
+        try:
+            stat = os.stat(path)
+            signature += [stat.st_size, stat.st_mtime_ns]
+        except FileNotFoundError:
+            signature += [0, 0]
+    return tuple(signature)
+
+
+def lookup(visibilities, gateway_id, lat, lon, default="N/A"):
+    try:
+        return visibilities.get(gateway_key(gateway_id, lat, lon), default)
+    except (TypeError, ValueError):
+        return default
+
+
+def join_visibility(df, db_file=DB_FILE):
+    """Remplace la colonne visibility d'un DataFrame de mesures par celle de la table."""
+    visibilities = visibility_map(db_file)
+    if df.empty or not visibilities:
+        return df
+    keys = zip(df["gatewayId"].astype(str),
+               df["gateway_lat"].astype(float).round(COORD_DIGITS),
+               df["gateway_long"].astype(float).round(COORD_DIGITS))
+    joined = [visibilities.get(key) for key in keys]
+    df = df.copy()
+    df["visibility"] = [v if v is not None else old for v, old in zip(joined, df["visibility"].astype(object))]
+    df["visibility"] = df["visibility"].astype("category")
+    return df
+
+
+def seed_from_csv(csv_file, db_file=DB_FILE):
+    """
+    Migration unique : remplit la table depuis le CSV existant (visibilités déjà
+    calculées par l'ancienne version de run_splat). Ne fait rien si la table est remplie.
+    """
+    with closing(connect(db_file)) as conn:
+        if conn.execute("SELECT 1 FROM gateways LIMIT 1").fetchone():
+            return 0
+    if not os.path.exists(csv_file):
+        return 0
+
+    gateways = {}
+    with open(csv_file, newline="") as f:
+        for row in csv.DictReader(f):
+            try:
+                key = gateway_key(row["gatewayId"], row["gateway_lat"], row["gateway_long"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            visibility = row.get("visibility")
+            visibility = visibility if visibility in ("LOS", "NLOS") else None
+            if key not in gateways or gateways[key][1] is None:
+                gateways[key] = (row.get("gateway_name"), visibility)
+
+    now = datetime.now(timezone.utc).isoformat()
+    with closing(connect(db_file)) as conn, conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO gateways (gateway_id, lat, lon, gateway_name, visibility, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(*key, name, visibility, now if visibility else None)
+             for key, (name, visibility) in gateways.items()],
+        )
+    return len(gateways)
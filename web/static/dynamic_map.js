@@ -9,7 +9,10 @@ let map;
 let currentDateIndex = 0;
 let allDates = [];
 let currentLayer = null;
-let allGatewayData = {}; // Nouveau cache global pour toutes les données
+let dateVersions = {}; // Manifeste : date -> empreinte du shard
+let dateRequests = {}; // Shards déjà demandés : date -> {version, promise}
+let ductingOverlay = null;
+let ductingIndex = null; // Description de la carte de ducting du jour affiché
 
 // Fonction pour charger la configuration depuis le serveur
 async function loadConfig() {
@@ -69,11 +72,11 @@ async function initMap() {
         zIndexOffset: 1000
     }).addTo(map);
     
-    // Charger TOUTES les données en une seule requête
+    // Seul le manifeste (dates et empreintes) est chargé, les mesures le sont par date
     try {
-        const response = await fetch('/api/optimized_gateways');
-        allGatewayData = await response.json();
-        allDates = Object.keys(allGatewayData).sort();
+        const response = await fetch('/api/optimized_gateways/manifest');
+        dateVersions = (await response.json()).dates;
+        allDates = Object.keys(dateVersions).sort();
         
         // Afficher la première date
         if (allDates.length > 0) {
@@ -101,8 +104,52 @@ async function initMap() {
         .catch(error => console.error('Error loading IGRA stations:', error));
 }
 
-// Nouvelle version optimisée de loadDateData
-function loadDateData(date) {
+// Shard d'une date : l'URL contient son empreinte, le navigateur peut donc le garder en cache
+function fetchDateData(date) {
+    const version = dateVersions[date];
+    const cached = dateRequests[date];
+    if (cached && cached.version === version) return cached.promise;
+
+    const promise = fetch(`/api/optimized_gateways/${date}?v=${version}`)
+        .then(response => {
+            if (!response.ok) throw new Error(`No data for ${date}`);
+            return response.json();
+        })
+        .catch(error => {
+            delete dateRequests[date];
+            throw error;
+        });
+    dateRequests[date] = { version: version, promise: promise };
+    return promise;
+}
+
+// Précharge les dates voisines pour que Prev / Next soient immédiats
+function prefetchNeighbours(index) {
+    [index - 1, index + 1].forEach(i => {
+        if (i >= 0 && i < allDates.length) {
+            fetchDateData(allDates[i]).catch(() => {});
+        }
+    });
+}
+
+async function loadDateData(date) {
+    document.getElementById('currentDate').textContent = date;
+    prefetchNeighbours(allDates.indexOf(date));
+
+    let dateData;
+    try {
+        dateData = await fetchDateData(date);
+    } catch (error) {
+        console.error('Error loading date data:', error);
+        return;
+    }
+    // Une autre date a pu être choisie pendant le chargement
+    if (date !== getSelectedDate()) return;
+    renderDateData(date, dateData);
+}
+
+// Affichage des gateways d'une date
+function renderDateData(date, dateData) {
     // Supprimer le layer précédent s'il existe
     if (currentLayer) {
         map.removeLayer(currentLayer);
@@ -113,10 +160,7 @@ function loadDateData(date) {
     
     // Afficher la date en cours
     document.getElementById('currentDate').textContent = date;
-    
-    // Récupérer les données depuis le cache
-    const dateData = allGatewayData[date];
-    if (!dateData) return;
+    updateDuctingOverlay(date);
     
     // Traiter chaque gateway
     for (const [gw_id, gw] of Object.entries(dateData)) {
@@ -229,8 +273,56 @@ document.addEventListener('DOMContentLoaded', async () => {
 
     // Nouvel écouteur pour le bouton ERA5
     document.getElementById('era5Button').addEventListener('click', showERA5GraphForSelectedDate);
+
+    // Carte de ducting ERA5 (image par heure ou probabilité du jour)
+    document.getElementById('ductingToggle').addEventListener('change', () => updateDuctingOverlay(getSelectedDate()));
+    document.getElementById('ductingHour').addEventListener('change', showDuctingOverlay);
 });
 
+// Charge la description de la carte de ducting du jour puis affiche l'image choisie
+async function updateDuctingOverlay(date) {
+    const enabled = document.getElementById('ductingToggle').checked;
+    const select = document.getElementById('ductingHour');
+    select.disabled = !enabled;
+
+    if (!enabled || !date) {
+        showDuctingOverlay();
+        return;
+    }
+    if (!ductingIndex || ductingIndex.date !== date) {
+        try {
+            const res = await fetch(`/api/ducting_map?date=${date}`);
+            ductingIndex = res.ok ? await res.json() : { date: date, overlays: {} };
+        } catch (err) {
+            console.error("Error loading ducting map:", err);
+            ductingIndex = { date: date, overlays: {} };
+        }
+
+        // Heures disponibles pour ce jour, en gardant le choix actuel si possible
+        const previous = select.value;
+        select.innerHTML = '<option value="probability">Daily probability</option>';
+        Object.keys(ductingIndex.overlays).forEach((hour, i) => {
+            const cells = ductingIndex.ducting_cells ? ` (${ductingIndex.ducting_cells[i]} cells)` : '';
+            select.insertAdjacentHTML('beforeend', `<option value="${hour}">${hour}:00${cells}</option>`);
+        });
+        select.value = [...select.options].some(o => o.value === previous) ? previous : 'probability';
+    }
+    showDuctingOverlay();
+}
+
+function showDuctingOverlay() {
+    if (ductingOverlay) {
+        map.removeLayer(ductingOverlay);
+        ductingOverlay = null;
+    }
+    if (!document.getElementById('ductingToggle').checked || !ductingIndex || !ductingIndex.bounds) return;
+
+    const choice = document.getElementById('ductingHour').value;
+    const url = choice === 'probability' ? ductingIndex.probability : ductingIndex.overlays[choice];
+    if (!url) return;
+    ductingOverlay = L.imageOverlay(url, ductingIndex.bounds, { opacity: 0.8, interactive: false }).addTo(map);
+}
+
 // Nouvelle fonction pour obtenir la date sélectionnée
 function getSelectedDate() {
     return allDates[currentDateIndex];
@@ -6,6 +6,7 @@
 # From the base code of : Marco Rainone
 
 import csv
+import io
 import os
 import math
 from flask import Flask, request, jsonify, send_from_directory, send_file, render_template, url_for, Response
@@ -14,21 +15,39 @@ from datetime import datetime
 import pandas as pd
 import json
 import gzip
-from functools import lru_cache
+import hashlib
+import tempfile
 import threading
-from collections import defaultdict
 import numpy as np
-import subprocess
+import signal
+from concurrent.futures import TimeoutError as FutureTimeoutError
+import sys
 from configs.config_coords import END_DEVICE_LAT, END_DEVICE_LON
+from gateway_index import GatewayIndex
+from ingest_queue import IngestQueue
+import measurement_store
+import visibility_store
+from date_shards import DateShards, negotiate
+from file_lock import FileLock
+from era5_service import Era5OnDemand
+import ducting_map
 
 # Désactive les logs de requêtes Werkzeug (Flask)
 import logging
 log = logging.getLogger('werkzeug')
 log.disabled = True
 
-parser = argparse.ArgumentParser()
-parser.add_argument("--logs", action="store_true")
-args = parser.parse_args()
+# Options aussi lues dans l'environnement : sous gunicorn, sys.argv est celui de gunicorn
+parser = argparse.ArgumentParser(allow_abbrev=False)
+parser.add_argument("--logs", action="store_true", default=os.environ.get("WEBHOOK_LOGS") == "1")
+parser.add_argument("--queue-size", type=int, default=int(os.environ.get("WEBHOOK_QUEUE_SIZE", 10000)),
+                    help="Max payloads waiting to be written")
+parser.add_argument("--batch-rows", type=int, default=int(os.environ.get("WEBHOOK_BATCH_ROWS", 200)),
+                    help="Flush the ingest queue every N rows")
+parser.add_argument("--flush-ms", type=int, default=int(os.environ.get("WEBHOOK_FLUSH_MS", 500)),
+                    help="Flush the ingest queue every T milliseconds")
+parser.add_argument("--era5-workers", type=int, default=None, help="Warm processes for on-demand ERA5 graphs")
+args, _ = parser.parse_known_args()
 
 def log(*messages):
     if args.logs:
@@ -53,10 +72,20 @@ IGRA_LINKS_JSON = "/app/output/igra-datas/map_links.json"
 
 JSON_INDEX = "/app/output/data/gateways_index.json.gz"
 
+# Lots non écrits à l'arrêt du webhook, rejoués au démarrage suivant (voir ingest_queue.py)
+INGEST_SPILL_FILE = "/app/output/data/ingest_spill.jsonl"
+
 LOG_FILE = "/app/output/app.log"
 
-csv_lock = threading.Lock()
-index_lock = threading.Lock()
+# Verrous fcntl partagés par tous les workers (voir file_lock.py et gunicorn.conf.py)
+csv_lock = FileLock("csv")
+index_lock = FileLock("index")
+
+# Index date -> gateway chargé une fois au démarrage (voir __main__)
+gateway_index = GatewayIndex(CSV_FILE)
+
+# Graphes ERA5 on-demand : pool chaud démarré avec le serveur, résultats mémoïsés
+era5_service = Era5OnDemand(workers=args.era5_workers)
 
 # ----------------------------------------------------------------------------
 # **POSIZIONE DEL NODO (Da impostare manualmente)**
@@ -90,147 +119,382 @@ def haversine(lat1, lon1, lat2, lon2):
 def home():
     return "<html><body>OK</body></html>"
 
+_json_index_state = {"signature": None}
+# Une seule reconstruction de l'index gzip à la fois (threads et workers gunicorn)
+json_index_lock = FileLock("json_index")
+
+
+def json_index_signature(versions):
+    return hashlib.sha1(repr((sorted(versions.items()), shard_inputs_version())).encode()).hexdigest()[:20]
+
+
 def create_index():
-    """Create optimized JSON index from CSV"""
-    df = pd.read_csv(CSV_FILE, parse_dates=['gwTime'])
-    df['date'] = df['gwTime'].dt.strftime('%Y-%m-%d')
-    
+    """
+    Index compact date -> gateway écrit en gzip (à partir de l'index en mémoire),
+    seulement si sa signature a changé depuis la dernière écriture. Retourne la signature.
+    """
+    with json_index_lock:
+        with index_lock:
+            gateway_index.sync()
+            signature = json_index_signature(gateway_index.versions())
+            # Signature revérifiée sous le verrou : une requête concurrente a pu le refaire
+            if signature == _json_index_state["signature"] and os.path.exists(JSON_INDEX):
+                return signature
+            snapshot = gateway_index.snapshot()
+        write_index(snapshot)
+        _json_index_state["signature"] = signature
+    return signature
+
+
+def write_index(snapshot):
+    """Écrit JSON_INDEX depuis un snapshot de l'index (sous json_index_lock)."""
+    visibilities = cached_visibilities()
+
     index = {}
-    for date, group in df.groupby('date'):
+    for date, gateways in snapshot.items():
         index[date] = {}
-        for gw_id, gw_group in group.groupby('gatewayId'):
-            first = gw_group.iloc[0]
+        for gw_id, entry in gateways.items():
             index[date][gw_id] = {
-                'name': first['gateway_name'],
-                'lat': first['gateway_lat'],
-                'lon': first['gateway_long'],
-                'visibility': first['visibility'],
-                'distance': first['dist_km'],
-                'measurements': gw_group[['gwTime', 'rssi', 'snr']].apply(
-                    lambda r: [r['gwTime'].strftime('%H:%M'), r['rssi'], r['snr']], 
-                    axis=1
-                ).tolist()
+                'name': entry['name'],
+                'lat': entry['lat'],
+                'lon': entry['lon'],
+                'visibility': visibility_store.lookup(visibilities, gw_id, entry['lat'], entry['lon'], entry['visibility']),
+                'distance': entry['dist_km'],
+                'measurements': [[(m['gwTime'] or '')[11:16], m['rssi'], m['snr']] for m in entry['measurements']]
             }
-    
-    with open(JSON_INDEX, 'w') as f:
-        json.dump(index, f, separators=(',', ':'))
+
+    # Écriture atomique d'un vrai fichier gzip (le nom .json.gz l'annonçait déjà)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(JSON_INDEX), suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb') as f:
+            f.write(json.dumps(index, separators=(',', ':')).encode())
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, JSON_INDEX)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+
+def parse_rx_info(data):
+    """Extrait les lignes du CSV (dicts au format CSV_HEADER) depuis un payload Helium."""
+    rows = []
+
+    # Estrai i dati dei gateway dalla lista 'rxInfo'
+    for gateway in data.get("rxInfo", []):
+        # Estrai i dati richiesti con valori di default se mancano
+        gwTime = gateway.get("gwTime", "N/A")
+        gatewayId = gateway.get("gatewayId", "N/A")
+        metadata = gateway.get("metadata", {})
+
+        gateway_name = metadata.get("gateway_name", "N/A")
+        gateway_id = metadata.get("gateway_id", "N/A")
+        gateway_long = metadata.get("gateway_long", "N/A")
+        gateway_lat = metadata.get("gateway_lat", "N/A")
+        rssi = gateway.get("rssi", "N/A")
+        snr = gateway.get("snr", "N/A")
+
+        # Vérification : champs essentiels présents et valides
+        if not all([gwTime, gatewayId, gateway_name, gateway_id, gateway_lat, gateway_long]):
+            log("[IGNORED] Missing required data for gateway:", gatewayId or "Unknown")
+            continue
+
+        # Converti latitudine e longitudine in float per il calcolo della distanza
+        try:
+            gateway_lat = float(gateway_lat)
+            gateway_long = float(gateway_long)
+        except (ValueError, TypeError):
+            log(f"[IGNORED] Invalid coordinates for gateway {gatewayId}")
+            continue
+
+        # Calcola la distanza solo se tutti i valori sono validi
+        if gateway_lat is not None and gateway_long is not None:
+            dist_km = haversine(END_DEVICE_LAT, END_DEVICE_LON, gateway_lat, gateway_long)
+        else:
+            dist_km = "N/A"
+
+        rows.append(dict(zip(CSV_HEADER, [gwTime, gatewayId, gateway_name, gateway_id,
+                                          END_DEVICE_LON, END_DEVICE_LAT, gateway_long, gateway_lat,
+                                          dist_km, rssi, snr, "N/A"])))
+    return rows
 
 
+# Écriture d'un lot de payloads par le thread de la file d'ingestion, en étapes
+# indépendantes : si l'une échoue, seules les suivantes sont refaites (voir ingest_queue.py)
+def write_messages(messages, rows):
+    # Salva i messaggi originali nel file di log
+    with csv_lock, open(LOG_FILE, mode='a') as log_file:
+        log_file.write("".join(message + "\n" for message in messages))
+
+
+def write_csv_rows(messages, rows):
+    # Une seule écriture : le lot est dans le CSV en entier ou pas du tout (sauf disque plein)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row[col] for col in CSV_HEADER])
+    with csv_lock, open(CSV_FILE, mode='a', newline='') as file:
+        file.write(buffer.getvalue())
+
+
+def sync_index(messages, rows):
+    # Mise à jour incrémentale de l'index : la fin du CSV est relue (nos lignes et
+    # celles des autres workers depuis le dernier sync), seul le shard du jour est réécrit
+    with index_lock:
+        gateway_index.sync()
+
+
+def register_gateways(messages, rows):
+    # Nouvelles gateways : visibilité à calculer au prochain passage de run_splat
+    visibility_store.register_gateways(rows)
+
+
+def store_measurements(messages, rows):
+    # Copie dans le store colonnaire une fois la migration effectuée
+    if measurement_store.is_enabled():
+        measurement_store.append_rows(rows)
+
+
+INGEST_STEPS = [
+    ("log", write_messages),
+    ("csv", write_csv_rows),
+    ("index", sync_index),
+    ("visibility", register_gateways),
+    ("measurements", store_measurements),
+]
+
+# File d'ingestion : le webhook répond dès que le payload est validé
+ingest_queue = IngestQueue(INGEST_STEPS, maxsize=args.queue_size,
+                           batch_rows=args.batch_rows, flush_ms=args.flush_ms, on_error=log,
+                           spill_file=INGEST_SPILL_FILE)
+
 
 @app.route('/helium-data', methods=['POST'])
 def helium_webhook():
     try:
-        data = request.get_json()
-
-        # Salva il messaggio originale nel file di log
-        with open(LOG_FILE, mode='a') as log_file:
-            log_file.write(str(data) + "\n")
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({"status": "error", "message": "Invalid JSON payload"}), 400
 
         # Stampa tutto il payload ricevuto per debugging
         log("Dati ricevuti:", data)
 
-        # Estrai i dati dei gateway dalla lista 'rxInfo'
-        rx_info_list = data.get("rxInfo", [])
-
-        with csv_lock:
-            # Apri il file CSV in modalità append per aggiungere i nuovi dati
-            with open(CSV_FILE, mode='a', newline='') as file:
-                writer = csv.writer(file)
-
-                for gateway in rx_info_list:
-                    # Estrai i dati richiesti con valori di default se mancano
-                    gwTime = gateway.get("gwTime", "N/A")
-                    gatewayId = gateway.get("gatewayId", "N/A")
-                    metadata = gateway.get("metadata", {})
-
-                    gateway_name = metadata.get("gateway_name", "N/A")
-                    gateway_id = metadata.get("gateway_id", "N/A")
-                    gateway_long = metadata.get("gateway_long", "N/A")
-                    gateway_lat = metadata.get("gateway_lat", "N/A")
-                    rssi = gateway.get("rssi", "N/A")
-                    snr = gateway.get("snr", "N/A")
-
-                    # Vérification : champs essentiels présents et valides
-                    if not all([gwTime, gatewayId, gateway_name, gateway_id, gateway_lat, gateway_long]):
-                        log("[IGNORED] Missing required data for gateway:", gatewayId or "Unknown")
-                        continue
-
-                    # Converti latitudine e longitudine in float per il calcolo della distanza
-                    try:
-                        gateway_lat = float(gateway_lat)
-                        gateway_long = float(gateway_long)
-                    except (ValueError, TypeError):
-                        log(f"[IGNORED] Invalid coordinates for gateway {gatewayId}")
-                        continue
-
-                    # Calcola la distanza solo se tutti i valori sono validi
-                    if gateway_lat is not None and gateway_long is not None:
-                        dist_km = haversine(END_DEVICE_LAT, END_DEVICE_LON, gateway_lat, gateway_long)
-                    else:
-                        dist_km = "N/A"
-
-                    # Scrive una riga nel CSV
-                    writer.writerow([gwTime, gatewayId, gateway_name, gateway_id, 
-                                    END_DEVICE_LON, END_DEVICE_LAT, gateway_long, gateway_lat, 
-                                    dist_km, rssi, snr, "N/A"])
-                    
-        generate_optimized_json()
-        return jsonify({"status": "success", "message": "Dati ricevuti e salvati in CSV"}), 200
+        rows = parse_rx_info(data)
+
+        # L'écriture disque est faite par le thread de la file d'ingestion
+        if not ingest_queue.put(str(data), rows):
+            log("[INGEST] Queue full, payload rejected")
+            return jsonify({"status": "error", "message": "Ingest queue full, retry later"}), 503
+
+        return jsonify({"status": "success", "message": "Dati ricevuti, in attesa di scrittura nel CSV"}), 200
 
     except Exception as e:
         log("Errore:", e)
         return jsonify({"status": "error", "message": str(e)}), 500
-    
 
-JSON_OPTIMIZED_PATH = "/app/output/data/optimized_gateways_data.json"
 
-def generate_optimized_json():
-    df = pd.read_csv(CSV_FILE, parse_dates=['gwTime'])
-    df['date'] = pd.to_datetime(df['gwTime'], format='ISO8601').dt.strftime('%Y-%m-%d')
-    # Nettoyage des données
-    df = df.replace([np.nan, 'NaN', 'N/A'], None)
-    
-    # Charger les liens IGRA une seule fois
-    with open(IGRA_LINKS_JSON, 'r') as f:
-        igra_links = json.load(f)
-    
-    # Structurer les données par date → gateway
-    optimized_data = {}
-    for date, group in df.groupby('date'):
-        optimized_data[date] = {}
-        for gw_id, gw_data in group.groupby('gatewayId'):
-            optimized_data[date][gw_id] = {
-                'name': gw_data['gateway_name'].iloc[0],
-                'lat': round(gw_data['gateway_lat'].iloc[0], 5),
-                'lon': round(gw_data['gateway_long'].iloc[0], 5),
-                'dist_km': round(gw_data['dist_km'].iloc[0], 2),
-                'visibility': gw_data['visibility'].iloc[0],
-                'measurements': gw_data[['gwTime', 'rssi', 'snr']].to_dict('records'),
-                'graph_path': igra_links.get(gw_id, {}).get('graphs', {}).get(date, '').replace('./', '')
+@app.route('/api/ingest_stats')
+def get_ingest_stats():
+    return jsonify(ingest_queue.stats())
+
+
+def with_links(date, gateways, igra_links, visibilities):
+    """Ajoute la visibilité et le lien vers le graphe IGRA de chaque gateway (jointure à la lecture)."""
+    return {
+        gw_id: dict(entry,
+                    visibility=visibility_store.lookup(visibilities, gw_id, entry['lat'], entry['lon'], entry['visibility']),
+                    graph_path=igra_links.get(gw_id, {}).get('graphs', {}).get(date, '').replace('./', ''))
+        for gw_id, entry in gateways.items()
+    }
+
+
+def file_signature(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class ArtifactCache:
+    """
+    Fichiers lus par les routes (JSON, base des visibilités...) gardés parsés en mémoire,
+    par chemin, tant que leur signature (mtime, taille) ne change pas. Les vues dérivées
+    (stations uniques, ...) sont calculées une seule fois par version du fichier.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path, loader, signature=file_signature, default=None):
+        """loader(path) relancé seulement si la signature a changé ; `default` si le fichier n'existe pas."""
+        return self.view(path, None, loader, signature=signature, default=default)
+
+    def view(self, path, name, loader, derive=None, signature=file_signature, default=None):
+        """derive(valeur parsée) mis en cache sous (path, name) pour la version courante du fichier."""
+        version = signature(path)
+        if version is None:
+            return default
+        key = (path, name)
+        with self.lock:
+            cached = self.entries.get(key)
+            if cached is not None and cached[0] == version:
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+        if name is None:
+            value = loader(path)
+        else:
+            loaded = self.get(path, loader, signature)
+            if loaded is None:
+                return default  # fichier supprimé entre la signature et la lecture
+            value = derive(loaded)
+        with self.lock:
+            self.entries[key] = (version, value)
+        return value
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+artifacts = ArtifactCache()
+
+
+def load_json(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def cached_igra_links():
+    """Liens IGRA relus seulement quand map_links.json a changé."""
+    return artifacts.get(IGRA_LINKS_JSON, load_json, default={})
+
+
+def cached_visibilities():
+    return artifacts.get(visibility_store.DB_FILE, visibility_store.visibility_map,
+                         signature=visibility_store.version, default={})
+
+
+def unique_stations(igra_links):
+    stations = {}
+    for gateway_data in igra_links.values():
+        station_id = gateway_data["station_id"]
+        if station_id not in stations:
+            stations[station_id] = {
+                "id": station_id,
+                "lat": gateway_data["station_coords"][0],
+                "lon": gateway_data["station_coords"][1]
             }
-    
-    # Sauvegarder le fichier
-    with open(JSON_OPTIMIZED_PATH, 'w') as f:
-        json.dump(optimized_data, f, indent=2)
+    return list(stations.values())
+
+
+def shard_inputs_version():
+    return (file_signature(IGRA_LINKS_JSON), visibility_store.version())
+
+
+# Une réponse précompressée par date (voir date_shards.py)
+date_shards = DateShards(
+    gateway_index,
+    render=lambda date, gateways: with_links(date, gateways, cached_igra_links(), cached_visibilities()),
+    inputs_version=shard_inputs_version,
+)
+
+
+def gateway_list(date, gateways):
+    """Gateways d'une date au format historique de /api/gateways (liste)."""
+    igra_links = cached_igra_links()
+    visibilities = cached_visibilities()
+    result = []
+    for gw_id, entry in sorted(gateways.items()):
+        graph_path = igra_links.get(gw_id, {}).get("graphs", {}).get(date)
+        result.append({
+            "gatewayId": gw_id,
+            "gateway_name": entry['name'],
+            "lat": entry['lat'],
+            "lon": entry['lon'],
+            "dist_km": entry['dist_km'],
+            "visibility": visibility_store.lookup(visibilities, gw_id, entry['lat'], entry['lon'], entry['visibility']),
+            "measurements": entry['measurements'],
+            "graph_path": graph_path.replace("./", "") if graph_path else None
+        })
+    return result
+
+
+# Même principe pour /api/gateways?date= : liste de gateways par date, précompressée
+gateway_lists = DateShards(gateway_index, render=gateway_list, inputs_version=shard_inputs_version)
+
+
+@app.route('/api/optimized_gateways/manifest')
+def get_gateways_manifest():
+    with index_lock:
+        gateway_index.sync()
+    manifest = date_shards.manifest()
+    response = jsonify({"dates": manifest})
+    response.set_etag(hashlib.sha1(json.dumps(manifest, sort_keys=True).encode()).hexdigest()[:20])
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+def shard_response(shard):
+    """Réponse précompressée d'un shard (voir date_shards.py), 304 si l'ETag correspond."""
+    version, digest, variants = shard
+    encoding = negotiate(request.headers.get('Accept-Encoding'), variants)
+    response = Response(variants[encoding], mimetype='application/json')
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    # ETag fort par représentation (le corps compressé diffère du JSON brut)
+    response.set_etag(f"{digest}-{encoding}")
+    if request.args.get('v') == version:
+        # URL versionnée par le manifeste : son contenu ne changera plus
+        response.cache_control.public = True
+        response.cache_control.max_age = 31536000
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+@app.route('/api/optimized_gateways/<date>')
+def get_gateways_shard(date):
+    with index_lock:
+        gateway_index.sync()
+    shard = date_shards.get(date)
+    if shard is None:
+        return jsonify({"error": "No data for this date"}), 404
+    return shard_response(shard)
+
+
+@app.route('/api/cache_stats')
+def get_cache_stats():
+    return jsonify(artifacts.stats())
+
+
+@app.route('/api/shard_stats')
+def get_shard_stats():
+    return jsonify({"optimized_gateways": date_shards.stats(), "gateways": gateway_lists.stats()})
+
 
 @app.route('/api/optimized_gateways')
 def get_optimized_gateways():
-    if not os.path.exists(JSON_OPTIMIZED_PATH):
-        generate_optimized_json()
-    return send_from_directory('/app/output/data', 'optimized_gateways_data.json')
-
+    with index_lock:
+        gateway_index.sync()
+        snapshot = gateway_index.snapshot()
+    igra_links = cached_igra_links()
+    visibilities = cached_visibilities()
+    return jsonify({date: with_links(date, gateways, igra_links, visibilities)
+                    for date, gateways in snapshot.items()})
 
-# Chargement des données (peut être optimisé avec un cache)
-def load_data():
-    df = pd.read_csv(CSV_FILE)
-    df['date'] = pd.to_datetime(df['gwTime'], format='ISO8601').dt.strftime('%Y-%m-%d')
-    return df
 
 @app.route('/api/dates')
 def get_dates():
-    with open(JSON_OPTIMIZED_PATH, 'r') as f:
-        data = json.load(f)
-    return jsonify(sorted(data.keys()))
+    with index_lock:
+        gateway_index.sync()
+        return jsonify(gateway_index.dates())
 # Route pour obtenir les dates disponibles
 # @app.route('/api/dates')
 # def get_dates():
@@ -242,24 +506,11 @@ def get_dates():
 @app.route('/api/igra_stations')
 def get_igra_stations():
     try:
-        with open(IGRA_LINKS_JSON, "r") as f:
-            igra_links = json.load(f)
-        
-        # Extraire les stations uniques
-        stations = {}
-        for gateway_data in igra_links.values():
-            station_id = gateway_data["station_id"]
-            if station_id not in stations:
-                stations[station_id] = {
-                    "id": station_id,
-                    "lat": gateway_data["station_coords"][0],
-                    "lon": gateway_data["station_coords"][1]
-                }
-        
-        return jsonify(list(stations.values()))
-    
-    except FileNotFoundError:
-        return jsonify({"error": "IGRA links file not found"}), 404
+        # Stations uniques calculées une fois par version de map_links.json
+        stations = artifacts.view(IGRA_LINKS_JSON, 'stations', load_json, unique_stations)
+        if stations is None:
+            return jsonify({"error": "IGRA links file not found"}), 404
+        return jsonify(stations)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     
@@ -270,55 +521,32 @@ def get_gateways():
     date = request.args.get('date')
     if not date:
         return jsonify({"error": "Date parameter is required"}), 400
-    
-    df = load_data()
-    df_date = df[df['date'] == date]
-    
-    if df_date.empty:
-            return jsonify({"error": "No data for this date"}), 404
-        
-    # Nettoyage des données
-    df_date = df_date.replace([np.nan, 'NaN', 'N/A'], None)
-    
-    # Grouper par gateway
-    grouped = df_date.groupby(["gatewayId", "date"])
-    
-    result = []
-    for (gw_id, _), group in grouped:
-        row = group.iloc[0]  # Première ligne pour les infos statiques
-        
-        gateway_data = {
-            "gatewayId": gw_id,
-            "gateway_name": row['gateway_name'],
-            "lat": round(row['gateway_lat'], 5),
-            "lon": round(row['gateway_long'], 5),
-            "dist_km": round(row['dist_km'], 2),
-            "visibility": row['visibility'],
-            "measurements": [],
-            "graph_path": None
-        }
-        
-        # Ajouter les mesures
-        for _, r in group.iterrows():
-            gateway_data["measurements"].append({
-                "gwTime": r['gwTime'],
-                "rssi": r.get('rssi'),
-                "snr": r.get('snr')
-            })
-        
-        # Vérifier s'il y a un graphique IGRA
-        try:
-            with open(IGRA_LINKS_JSON, "r") as f:
-                igra_links = json.load(f)
-                graph_path = igra_links.get(gw_id, {}).get("graphs", {}).get(date)
-                if graph_path:
-                    gateway_data["graph_path"] = graph_path.replace("./", "")
-        except FileNotFoundError:
-            pass
-        
-        result.append(gateway_data)
-    
-    return jsonify(result)
+
+    # Réponse construite depuis l'index en mémoire, refaite seulement si la date a changé
+    with index_lock:
+        gateway_index.sync()
+    shard = gateway_lists.get(date)
+    if shard is None:
+        return jsonify({"error": "No data for this date"}), 404
+    return shard_response(shard)
+
+
+@app.route('/api/gateways_index')
+def get_gateways_index():
+    # Index gzip complet, réécrit seulement si des mesures, liens ou visibilités ont changé
+    signature = create_index()
+
+    with open(JSON_INDEX, 'rb') as f:
+        body = f.read()
+    if 'gzip' in request.accept_encodings:
+        response = Response(body, mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(gzip.decompress(body), mimetype='application/json')
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.set_etag(f"{signature}-{'gzip' if 'gzip' in request.accept_encodings else 'identity'}")
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 @app.route('/dynamic-map')
 def index():
@@ -344,34 +572,31 @@ def get_graph():
     if None in [gateway_name, lat, lon, date, time]:
         return jsonify({"error": "Missing parameters"}), 400
 
-
+    # Date du fichier GRIB et heure "HH" ou "HH:MM" (seule l'heure est utilisée)
     try:
-        # Lancer le script qui génère l'image
-        result = subprocess.run(
-            [
-                "python3", "era5_gradients.py",
-                "--on-demand", str(gateway_name), str(lat), str(lon), str(date), str(time)
-            ],
-            capture_output=True, text=True, check=True, timeout=300
-        )
-
-         # Nettoyer la sortie en prenant la dernière ligne
-        output_lines = result.stdout.strip().split('\n')
-        image_path = output_lines[-1]  # Prend seulement la dernière ligne (pas les print)
-
-        image_url = image_path.replace('/app/output/era5/plots/', '/plots/')
-        
-        return jsonify({"image_url": image_url})
+        datetime.strptime(date, "%Y-%m-%d")
+        datetime.strptime(time if ':' in time else f"{time}:00", "%H:%M")
+    except ValueError:
+        return jsonify({"error": "Invalid date or time. Use YYYY-MM-DD and HH:MM"}), 400
 
-    except subprocess.TimeoutExpired:
+    try:
+        image_path = era5_service.get(gateway_name, lat, lon, date, time)
+    except FutureTimeoutError:
         return jsonify({"error": "Processing timeout"}), 504
-    except subprocess.CalledProcessError as e:
-        logging.error(f"Script failed: {e.stderr}")
-        return jsonify({"error": f"Processing failed: {e.stderr}"}), 500
     except Exception as e:
         logging.error(f"Unexpected error: {str(e)}")
         return jsonify({"error": "Internal server error"}), 500
 
+    if not image_path:
+        return jsonify({"error": "Processing failed"}), 500
+
+    image_url = image_path.replace('/app/output/era5/plots/', '/plots/')
+    return jsonify({"image_url": image_url})
+
+@app.route("/api/era5_stats")
+def get_era5_stats():
+    return jsonify(era5_service.stats())
+
 @app.route("/api/era5_daily_graph")
 def get_daily_graph():
     date_str = request.args.get("date")
@@ -418,7 +643,38 @@ def serve_images(filename):
 
 @app.route('/plots/<path:filename>')
 def serve_era5(filename):
-    return send_from_directory('/app/output/era5/plots', filename)
+    # ETag / Last-Modified : le navigateur revalide (304) au lieu de retélécharger
+    if filename.startswith('ondemand_'):
+        # Nom = empreinte du contenu : le fichier ne change jamais sous ce nom
+        response = send_from_directory('/app/output/era5/plots', filename,
+                                       etag=os.path.splitext(filename)[0], max_age=31536000)
+        response.cache_control.immutable = True
+        return response
+    response = send_from_directory('/app/output/era5/plots', filename, max_age=0)
+    response.cache_control.no_cache = True
+    return response
+
+@app.route("/api/ducting_map")
+def get_ducting_map():
+    date_str = request.args.get("date")
+    if not date_str:
+        return jsonify({"error": "Date parameter required"}), 400
+    try:
+        datetime.strptime(date_str, "%Y-%m-%d")
+    except ValueError:
+        return jsonify({"error": "Invalid date format. Use YYYY-MM-DD"}), 400
+
+    overlays = ducting_map.overlay_index(date_str)
+    if overlays is None:
+        return jsonify({"error": "Ducting map not available for this date"}), 404
+    return jsonify(overlays)
+
+@app.route('/ducting/<path:filename>')
+def serve_ducting(filename):
+    # Images refaites si le GRIB du jour change : revalidation par ETag
+    response = send_from_directory(ducting_map.DUCT_MAP_DIR, filename, max_age=0)
+    response.cache_control.no_cache = True
+    return response
 
 @app.route('/logs', methods=['GET'])
 def get_logs():
@@ -437,11 +693,78 @@ def stats():
     return render_template('stats.html', images=images)
 
 
-if __name__ == '__main__':
-    if not os.path.exists(JSON_INDEX):
+# Routes servies par le pool d'ingestion (WEBHOOK_POOL=ingest, voir gunicorn.conf.py)
+INGEST_ENDPOINTS = {"home", "helium_webhook", "get_ingest_stats"}
+
+
+def ingest_only():
+    if request.endpoint not in INGEST_ENDPOINTS:
+        return jsonify({"error": "Not served by the ingest pool"}), 404
+
+
+def prepare():
+    """
+    Travail fait une seule fois avant de servir : migration, index et index gzip.
+    Sous gunicorn, fait dans le processus maître (les workers héritent de l'index).
+    """
+    with FileLock("startup"):
+        # Migration unique du CSV vers le store colonnaire partitionné par jour
+        if not measurement_store.is_enabled():
+            try:
+                measurement_store.migrate(CSV_FILE)
+            except Exception as e:
+                log(f"Measurement store migration failed: {e}")
+
+        # Table des visibilités par gateway (remplace la réécriture du CSV par run_splat)
+        visibility_store.seed_from_csv(CSV_FILE)
+
+        with index_lock:
+            gateway_index.load()
+        log(f"Gateway index loaded: {len(gateway_index.dates())} dates")
+
+        # Index gzip remis à jour au démarrage, puis à la demande sur /api/gateways_index
         try:
             create_index()
         except Exception as e:
             log(f"Initial index creation failed: {e}")
 
+
+def start_worker(pool="all"):
+    """Démarre les services d'un processus qui sert des requêtes (après le fork sous gunicorn)."""
+    with index_lock:
+        gateway_index.sync()
+
+    if pool == "ingest":
+        app.before_request(ingest_only)
+    else:
+        # Pool ERA5 démarré avant les threads d'ingestion
+        try:
+            era5_service.start()
+            log(f"ERA5 on-demand workers ready: {era5_service.workers}")
+        except Exception as e:
+            log(f"ERA5 on-demand pool failed to start: {e}")
+
+    ingest_queue.start()
+
+
+def stop_worker():
+    # Vide la file d'ingestion avant de quitter
+    print("Draining ingest queue...")
+    ingest_queue.close()
+    print(f"Ingest queue drained: {ingest_queue.stats()}")
+    era5_service.close()
+
+
+if __name__ == '__main__':
+    prepare()
+    start_worker()
+
+    def shutdown(signum=None, frame=None):
+        # SIGTERM envoyé par main.cleanup
+        stop_worker()
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
     app.run(host='0.0.0.0', port=5000, debug=False, use_reloader=False)